@@ -0,0 +1,1713 @@
+let currentPath = '';
+let selectedFiles = new Set();
+let allFiles = [];
+let uploadDirectory = '~/Downloads';
+let baseUploadDirectory = '~/Downloads';
+
+// Load files on page load
+document.addEventListener('DOMContentLoaded', function() {
+    loadFiles();
+    updateUploadPathDisplay();
+    document.getElementById('uploadConcurrency').value = String(getUploadConcurrency());
+    const optimization = getImageOptimization();
+    document.getElementById('optimizeImages').value = String(optimization.maxDimension);
+    document.getElementById('optimizeQuality').value = String(optimization.quality);
+    resumeUploads(); // Check for interrupted uploads
+    liveChannel.connect();
+    if (!('webkitdirectory' in document.createElement('input'))) {
+        document.getElementById('syncFolderBtn').style.display = 'none';
+    }
+});
+
+// File upload handling
+document.getElementById('fileInput').addEventListener('change', function(e) {
+    const files = e.target.files;
+    if (files.length > 0) {
+        uploadFiles(files);
+    }
+});
+
+document.getElementById('folderInput').addEventListener('change', function(e) {
+    const files = e.target.files;
+    if (files.length > 0) {
+        syncFolder(files);
+    }
+    e.target.value = '';
+});
+
+// Files picked as a folder keep their place in it
+function relativePath(file) {
+    return file.webkitRelativePath || file.name;
+}
+
+function uploadDirectoryFor(file, directory) {
+    const path = relativePath(file);
+    const slash = path.lastIndexOf('/');
+    return slash < 0 ? directory : directory.replace(/\/+$/, '') + '/' + path.slice(0, slash);
+}
+
+// Mirror a folder from the phone: send the server a manifest of every
+// file and upload only those it reports missing or changed
+async function syncFolder(files) {
+    files = Array.from(files);
+    showUploadStatus(`🔍 Comparing ${files.length} files with the Mac...`, false, false);
+
+    let body = JSON.stringify({
+        upload_directory: uploadDirectory,
+        files: files.map(file => ({
+            path: relativePath(file),
+            size: file.size,
+            mtime: file.lastModified / 1000
+        }))
+    });
+    const headers = {
+        'Content-Type': 'application/json'
+    };
+    if (typeof CompressionStream !== 'undefined') {
+        body = await gzipBlob(new Blob([body]).stream());
+        headers['Content-Encoding'] = 'gzip';
+    }
+
+    let diff;
+    try {
+        const response = await fetch('/api/sync/diff', {
+            method: 'POST',
+            headers: headers,
+            body: body
+        });
+        diff = await response.json();
+        if (!response.ok) throw new Error(diff.error);
+    } catch (error) {
+        showStatus(`❌ Could not compare folder: ${error.message}`, 'error');
+        return;
+    }
+
+    const byPath = new Map(files.map(file => [relativePath(file), file]));
+    const changed = diff.upload.map(item => byPath.get(item.path)).filter(Boolean);
+    const conflicts = diff.conflicts.length ? `, ${diff.conflicts.length} skipped (folder on Mac)` : '';
+    if (changed.length === 0) {
+        showStatus(`✅ Folder already in sync (${diff.unchanged} files${conflicts})`, 'success');
+        return;
+    }
+    showStatus(`🔄 Syncing ${changed.length} of ${files.length} files${conflicts}`, 'success');
+    await uploadFiles(changed);
+}
+
+// Store upload state for resumability
+let uploadState = {
+    files: [],
+    completed: [],
+    directory: '',
+    successCount: 0,
+    failCount: 0,
+    isUploading: false
+};
+
+// Bytes sent so far for each file currently in flight
+const inFlightUploads = new Map();
+
+function getUploadConcurrency() {
+    const value = parseInt(localStorage.getItem('uploadConcurrency') || '4', 10);
+    return Math.min(Math.max(value || 4, 1), 6);
+}
+
+function setUploadConcurrency(value) {
+    localStorage.setItem('uploadConcurrency', String(value));
+}
+
+async function uploadFiles(files) {
+    const progress = document.getElementById('progress');
+    const progressBar = document.getElementById('progressBar');
+
+    // Initialize upload state
+    uploadState.files = Array.from(files);
+    uploadState.completed = uploadState.files.map(() => false);
+    uploadState.directory = uploadDirectory;
+    uploadState.successCount = 0;
+    uploadState.failCount = 0;
+    uploadState.isUploading = true;
+
+    progress.style.display = 'block';
+    progressBar.style.width = '0%';
+    showUploadStatus(`📤 Starting upload of ${files.length} files...`, false, true);
+
+    // Store state in localStorage for recovery
+    localStorage.setItem('uploadState', JSON.stringify(uploadState));
+
+    await processUploadQueue();
+}
+
+function completedUploadCount() {
+    return uploadState.completed.filter(Boolean).length;
+}
+
+function updateUploadProgress() {
+    const progressBar = document.getElementById('progressBar');
+    const totalBytes = uploadState.files.reduce((total, file) => total + (file.size || 0), 0);
+    let sentBytes = 0;
+    uploadState.files.forEach((file, index) => {
+        if (uploadState.completed[index]) sentBytes += file.size || 0;
+    });
+    inFlightUploads.forEach(bytes => { sentBytes += bytes; });
+
+    const progressPercent = totalBytes > 0
+        ? (sentBytes / totalBytes) * 100
+        : (completedUploadCount() / Math.max(uploadState.files.length, 1)) * 100;
+    progressBar.style.width = progressPercent + '%';
+
+    const queueList = document.getElementById('uploadQueue');
+    queueList.innerHTML = Array.from(inFlightUploads.entries()).map(([index, bytes]) => {
+        const file = uploadState.files[index];
+        const percent = file.size ? Math.round((bytes / file.size) * 100) : 0;
+        return `<div class="upload-queue-item"><span>${file.name}</span><span>${percent}%</span></div>`;
+    }).join('');
+}
+
+// Upload the queue with a bounded number of files in flight at once
+async function processUploadQueue() {
+    const progress = document.getElementById('progress');
+    const total = uploadState.files.length;
+    const pending = [];
+    uploadState.files.forEach((file, index) => {
+        if (!uploadState.completed[index]) pending.push(index);
+    });
+
+    async function uploadWorker() {
+        while (pending.length > 0 && uploadState.isUploading) {
+            const index = pending.shift();
+            const file = uploadState.files[index];
+            inFlightUploads.set(index, 0);
+            updateUploadProgress();
+
+            let ok = false;
+            try {
+                ok = await uploadFile(file, uploadDirectoryFor(file, uploadState.directory), fraction => {
+                    inFlightUploads.set(index, fraction * file.size);
+                    updateUploadProgress();
+                });
+            } catch (error) {
+                ok = false;
+            }
+
+            inFlightUploads.delete(index);
+            if (!uploadState.isUploading) break;
+            uploadState.completed[index] = true;
+            const done = completedUploadCount();
+            if (ok === 'skipped') {
+                uploadState.successCount++;
+                showStatus(`⏭️ Already on Mac ${done}/${total}: ${file.name}`, 'success');
+            } else if (ok === 'delta') {
+                uploadState.successCount++;
+                showStatus(`🔁 Updated ${done}/${total} (changes only): ${file.name}`, 'success');
+            } else if (ok) {
+                uploadState.successCount++;
+                showStatus(`✅ Uploaded ${done}/${total}: ${file.name}`, 'success');
+            } else {
+                uploadState.failCount++;
+                showStatus(`❌ Failed ${done}/${total}: ${file.name}`, 'error');
+            }
+
+            updateUploadProgress();
+
+            // Update stored state
+            localStorage.setItem('uploadState', JSON.stringify(uploadState));
+        }
+    }
+
+    const workers = [];
+    for (let i = 0; i < Math.min(getUploadConcurrency(), pending.length); i++) {
+        workers.push(uploadWorker());
+    }
+    await Promise.all(workers);
+
+    // Check if upload completed
+    if (completedUploadCount() >= total) {
+        // Show final summary
+        if (uploadState.successCount > 0 && uploadState.failCount === 0) {
+            showStatus(`🎉 All ${uploadState.successCount} files uploaded successfully!`, 'success');
+        } else if (uploadState.successCount > 0 && uploadState.failCount > 0) {
+            showStatus(`⚠️ ${uploadState.successCount} uploaded, ${uploadState.failCount} failed`, 'error');
+        } else {
+            showStatus(`❌ All ${uploadState.failCount} uploads failed`, 'error');
+        }
+
+        // Clear state
+        uploadState.isUploading = false;
+        localStorage.removeItem('uploadState');
+
+        // Hide progress after a delay
+        setTimeout(() => {
+            progress.style.display = 'none';
+        }, 5000);
+
+        // Refresh file list (a live delta does it when connected)
+        refreshAfterChange();
+    }
+}
+
+const CHUNK_MAX_RETRIES = 8;
+const SINGLE_SHOT_LIMIT = 8 * 1024 * 1024;
+
+// Runs inside a Web Worker (built from this function's source).
+// Plain-JS SHA-256, since crypto.subtle is missing on plain-http
+// LAN pages and can't hash incrementally anyway.
+function hashWorkerMain() {
+    const K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+    ]);
+
+    class Sha256 {
+        constructor() {
+            this.h = new Uint32Array([0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+                                      0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19]);
+            this.w = new Uint32Array(64);
+            this.tail = new Uint8Array(64);
+            this.tailLength = 0;
+            this.length = 0;
+        }
+
+        update(bytes) {
+            this.length += bytes.length;
+            let offset = 0;
+            if (this.tailLength) {
+                offset = Math.min(64 - this.tailLength, bytes.length);
+                this.tail.set(bytes.subarray(0, offset), this.tailLength);
+                this.tailLength += offset;
+                if (this.tailLength < 64) return;
+                this.block(this.tail, 0);
+                this.tailLength = 0;
+            }
+            for (; offset + 64 <= bytes.length; offset += 64) this.block(bytes, offset);
+            this.tail.set(bytes.subarray(offset), 0);
+            this.tailLength = bytes.length - offset;
+        }
+
+        block(bytes, offset) {
+            const w = this.w, H = this.h;
+            for (let i = 0; i < 16; i++) {
+                const j = offset + i * 4;
+                w[i] = (bytes[j] << 24) | (bytes[j + 1] << 16) | (bytes[j + 2] << 8) | bytes[j + 3];
+            }
+            for (let i = 16; i < 64; i++) {
+                const x = w[i - 15], y = w[i - 2];
+                const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+                const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+                w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+            }
+            let a = H[0], b = H[1], c = H[2], d = H[3], e = H[4], f = H[5], g = H[6], h = H[7];
+            for (let i = 0; i < 64; i++) {
+                const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+                const t1 = (h + S1 + ((e & f) ^ (~e & g)) + K[i] + w[i]) | 0;
+                const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+                const t2 = (S0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+                h = g; g = f; f = e; e = (d + t1) | 0;
+                d = c; c = b; b = a; a = (t1 + t2) | 0;
+            }
+            H[0] += a; H[1] += b; H[2] += c; H[3] += d;
+            H[4] += e; H[5] += f; H[6] += g; H[7] += h;
+        }
+
+        hex() {
+            const bits = this.length * 8;
+            const padding = new Uint8Array((this.tailLength < 56 ? 64 : 128) - this.tailLength);
+            padding[0] = 0x80;
+            const view = new DataView(padding.buffer);
+            view.setUint32(padding.length - 8, Math.floor(bits / 0x100000000));
+            view.setUint32(padding.length - 4, bits >>> 0);
+            this.update(padding);
+            return Array.from(this.h, word => word.toString(16).padStart(8, '0')).join('');
+        }
+    }
+
+    self.Sha256 = Sha256;
+    self.onmessage = async event => {
+        const { id, file } = event.data;
+        try {
+            const hash = new Sha256();
+            const step = 4 * 1024 * 1024;
+            for (let offset = 0; offset < file.size; offset += step) {
+                hash.update(new Uint8Array(await file.slice(offset, offset + step).arrayBuffer()));
+            }
+            self.postMessage({ id, hash: hash.hex() });
+        } catch (error) {
+            self.postMessage({ id, error: String(error) });
+        }
+    };
+}
+
+// Start a worker from the source of one or more functions on first
+// use (later ones may build on earlier ones); the returned function
+// posts one message and resolves with the worker's reply
+function workerClient(...mains) {
+    let worker = null;
+    const pending = new Map();
+    let nextId = 0;
+    return message => {
+        if (!worker) {
+            const source = mains.map(main => `(${main.toString()})();`).join('\n');
+            worker = new Worker(URL.createObjectURL(new Blob([source], { type: 'text/javascript' })));
+            worker.onmessage = event => {
+                const { id, error } = event.data;
+                const entry = pending.get(id);
+                pending.delete(id);
+                if (error) entry.reject(new Error(error));
+                else entry.resolve(event.data);
+            };
+        }
+        const id = nextId++;
+        return new Promise((resolve, reject) => {
+            pending.set(id, { resolve, reject });
+            worker.postMessage({ id, ...message });
+        });
+    };
+}
+
+const hashWorker = workerClient(hashWorkerMain);
+
+// Runs inside a Web Worker after hashWorkerMain (for Sha256).
+// rsync-style matching: roll an Adler-32 over every offset of the new
+// file, and where it hits a block of the server's signature confirm
+// with SHA-256. The result is a list of ops: ['C', block, count] to
+// reuse the server's blocks, ['L', start, end] to send a byte range of
+// the new file.
+function deltaWorkerMain() {
+    const MOD = 65521;
+    const READ_SIZE = 4 * 1024 * 1024;
+
+    self.onmessage = async event => {
+        const { id, file, blockSize, weak, strong, basisSize } = event.data;
+        const size = file.size;
+        try {
+            // The Map is only consulted when the typed-array filter (20
+            // bits of the checksum) says a block might match
+            const blocks = new Map();
+            const filter = new Uint8Array(1 << 20);
+            weak.forEach((value, index) => {
+                filter[((value >>> 16) & 0xf) << 16 | (value & 0xffff)] = 1;
+                if (blocks.has(value)) blocks.get(value).push(index);
+                else blocks.set(value, [index]);
+            });
+            const lastIndex = weak.length - 1;
+            const lastLength = basisSize - lastIndex * blockSize;
+
+            const ops = [];
+            let literalStart = 0;
+            let literalBytes = 0;
+            const emitLiteral = end => {
+                if (end > literalStart) {
+                    ops.push(['L', literalStart, end]);
+                    literalBytes += end - literalStart;
+                }
+            };
+            const emitCopy = index => {
+                const last = ops[ops.length - 1];
+                if (last && last[0] === 'C' && last[1] + last[2] === index) last[2]++;
+                else ops.push(['C', index, 1]);
+            };
+
+            // A matching block, preferring the one after the previous
+            // match so copies merge into runs
+            const findBlock = (value, bytes, allowed) => {
+                const candidates = blocks.get(value);
+                if (!candidates) return -1;
+                const hash = new self.Sha256();
+                hash.update(bytes);
+                const digest = hash.hex().slice(0, 16);
+                const last = ops[ops.length - 1];
+                const next = last && last[0] === 'C' ? last[1] + last[2] : -1;
+                let found = -1;
+                for (const index of candidates) {
+                    if (!allowed(index) || strong[index] !== digest) continue;
+                    if (index === next) return index;
+                    if (found < 0) found = index;
+                }
+                return found;
+            };
+            const adler = bytes => {
+                let a = 1, b = 0;
+                for (let i = 0; i < bytes.length; i++) {
+                    a = (a + bytes[i]) % MOD;
+                    b = (b + a) % MOD;
+                }
+                return [a, b];
+            };
+
+            // buf holds file bytes from bufStart on, from the window start
+            let buf = new Uint8Array(0);
+            let bufStart = 0;
+            let pos = 0;
+            const fill = async end => {
+                if (bufStart + buf.length >= end) return;
+                const readEnd = Math.min(size, Math.max(end, bufStart + buf.length + READ_SIZE));
+                const more = new Uint8Array(await file.slice(bufStart + buf.length, readEnd).arrayBuffer());
+                const keep = buf.subarray(pos - bufStart);
+                buf = new Uint8Array(keep.length + more.length);
+                buf.set(keep);
+                buf.set(more, keep.length);
+                bufStart = pos;
+            };
+
+            // Full-length windows can match every block but a short last one
+            const fullBlock = index => index < lastIndex || lastLength === blockSize;
+            const END = -2;
+            let a = 0, b = 0, fresh = true;
+
+            // Roll the checksum over the buffered bytes, a byte at a time.
+            // Kept synchronous and on locals: this is the hot loop. Returns
+            // a matching block with pos at its start, -1 when more data
+            // must be read, or END.
+            const scan = () => {
+                const data = buf, start = bufStart, n = blockSize;
+                const bufferedEnd = start + data.length;
+                let p = pos, ra = a, rb = b;
+                let result = -1;
+                while (true) {
+                    if ((p + n < size ? p + n + 1 : p + n) > bufferedEnd) break;
+                    const offset = p - start;
+                    if (fresh) {
+                        [ra, rb] = adler(data.subarray(offset, offset + n));
+                        fresh = false;
+                    }
+                    if (filter[(rb & 0xf) << 16 | ra]) {
+                        const index = findBlock(rb * 65536 + ra, data.subarray(offset, offset + n), fullBlock);
+                        if (index >= 0) {
+                            result = index;
+                            break;
+                        }
+                    }
+                    if (p + n >= size) {
+                        result = END;
+                        break;
+                    }
+                    const out = data[offset];
+                    ra = (ra - out + data[offset + n]) % MOD;
+                    if (ra < 0) ra += MOD;
+                    rb = (rb - n * out + ra - 1) % MOD;
+                    if (rb < 0) rb += MOD;
+                    p++;
+                }
+                pos = p;
+                a = ra;
+                b = rb;
+                return result;
+            };
+
+            while (size - pos >= blockSize) {
+                const needed = Math.min(pos + blockSize + 1, size);
+                if (bufStart + buf.length < needed) await fill(needed);
+                const index = scan();
+                if (index === END) break;
+                if (index >= 0) {
+                    emitLiteral(pos);
+                    emitCopy(index);
+                    pos += blockSize;
+                    literalStart = pos;
+                    fresh = true;
+                }
+            }
+
+            // The end of the file can still match a short last block
+            const tailStart = size - lastLength;
+            if (lastLength < blockSize && tailStart >= literalStart) {
+                const tail = new Uint8Array(await file.slice(tailStart).arrayBuffer());
+                const [ta, tb] = adler(tail);
+                if (findBlock(tb * 65536 + ta, tail, index => index === lastIndex) >= 0) {
+                    emitLiteral(tailStart);
+                    emitCopy(lastIndex);
+                    literalStart = size;
+                }
+            }
+            emitLiteral(size);
+            self.postMessage({ id, ops, literalBytes });
+        } catch (error) {
+            self.postMessage({ id, error: String(error) });
+        }
+    };
+}
+
+const deltaWorker = workerClient(hashWorkerMain, deltaWorkerMain);
+
+// Files at least this big that already exist at the destination are
+// updated by sending only what changed
+const DELTA_MIN_SIZE = 1024 * 1024;
+const DELTA_MAX_LITERAL = 1024 * 1024 * 1024;
+
+// Returns the upload result, or null when a full upload should be
+// done instead (no existing file, mostly new content, or an error)
+async function uploadDelta(file, directory, sha256, onProgress) {
+    try {
+        const params = 'filename=' + encodeURIComponent(file.name) +
+            '&upload_directory=' + encodeURIComponent(directory);
+        const response = await fetch('/api/upload/signature?' + params);
+        if (!response.ok) return null;
+        const signature = await response.json();
+        if (!signature.weak.length) return null;
+
+        const { ops, literalBytes } = await deltaWorker({
+            file,
+            blockSize: signature.block_size,
+            weak: signature.weak,
+            strong: signature.strong,
+            basisSize: signature.size
+        });
+        // With mostly new content a normal, resumable upload costs the same
+        if (literalBytes > file.size / 2) return null;
+
+        const parts = [];
+        ops.forEach(([kind, first, second]) => {
+            if (kind === 'C') {
+                const header = new DataView(new ArrayBuffer(9));
+                header.setUint8(0, 67);
+                header.setUint32(1, first);
+                header.setUint32(5, second);
+                parts.push(header.buffer);
+                return;
+            }
+            for (let start = first; start < second; start += DELTA_MAX_LITERAL) {
+                const end = Math.min(start + DELTA_MAX_LITERAL, second);
+                const header = new DataView(new ArrayBuffer(5));
+                header.setUint8(0, 76);
+                header.setUint32(1, end - start);
+                parts.push(header.buffer, file.slice(start, end));
+            }
+        });
+
+        let body = new Blob(parts);
+        const headers = {
+            'Content-Type': 'application/octet-stream'
+        };
+        if (shouldCompressUpload(file)) {
+            body = await gzipBlob(body.stream());
+            headers['Content-Encoding'] = 'gzip';
+        }
+        const applied = await fetch('/api/upload/delta?' + params +
+            `&basis=${encodeURIComponent(signature.basis)}&size=${file.size}&sha256=${sha256}` +
+            `&mtime=${file.lastModified / 1000}`, {
+            method: 'POST',
+            headers: headers,
+            body: body
+        });
+        // 409: the file changed since the signature; anything else odd
+        // is also safest redone as a full upload
+        if (!applied.ok) return null;
+        onProgress(1);
+        return 'delta';
+    } catch (error) {
+        return null;
+    }
+}
+
+async function hashFile(file) {
+    return (await hashWorker({ file })).hash;
+}
+
+// SHA-256 of a file, or null where workers are unavailable
+async function contentHash(file) {
+    if (typeof Worker === 'undefined') return null;
+    try {
+        return await hashFile(file);
+    } catch (error) {
+        return null;
+    }
+}
+
+// Runs inside a Web Worker: decode, downscale and re-encode one image
+// off the main thread
+function imageWorkerMain() {
+    self.onmessage = async event => {
+        const { id, file, maxDimension, quality, type } = event.data;
+        try {
+            const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+            const { width, height } = bitmap;
+            const scale = Math.min(1, maxDimension / Math.max(width, height));
+            const canvas = new OffscreenCanvas(Math.max(1, Math.round(width * scale)),
+                                               Math.max(1, Math.round(height * scale)));
+            const context = canvas.getContext('2d');
+            context.imageSmoothingQuality = 'high';
+            context.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+            bitmap.close();
+            const blob = await canvas.convertToBlob({ type, quality });
+            self.postMessage({ id, blob, width, height });
+        } catch (error) {
+            self.postMessage({ id, error: String(error) });
+        }
+    };
+}
+
+const imageWorker = workerClient(imageWorkerMain);
+
+// What each optimizable type is re-encoded as
+const OPTIMIZE_TYPES = {
+    'image/jpeg': 'image/jpeg',
+    'image/heic': 'image/jpeg',
+    'image/heif': 'image/jpeg',
+    'image/png': 'image/png',
+    'image/webp': 'image/webp'
+};
+const OPTIMIZE_EXTENSIONS = { 'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp' };
+
+function getImageOptimization() {
+    return {
+        maxDimension: parseInt(localStorage.getItem('optimizeImages') || '0', 10) || 0,
+        quality: parseFloat(localStorage.getItem('optimizeQuality') || '0.85') || 0.85
+    };
+}
+
+function setImageOptimization(value) {
+    localStorage.setItem('optimizeImages', String(value));
+}
+
+function setOptimizeQuality(value) {
+    localStorage.setItem('optimizeQuality', String(value));
+}
+
+function canOptimizeImage(file) {
+    return file.type in OPTIMIZE_TYPES && typeof OffscreenCanvas !== 'undefined' &&
+        typeof Worker !== 'undefined';
+}
+
+// A smaller copy of the image, or null to send the original (the
+// browser can't decode it, or re-encoding saved nothing)
+async function optimizeImage(file, settings) {
+    try {
+        const type = OPTIMIZE_TYPES[file.type];
+        const result = await imageWorker({ file, type, ...settings });
+        if (result.blob.size >= file.size) return null;
+        let name = file.name;
+        if (type !== file.type) name = name.replace(/\.[^.]*$/, '') + OPTIMIZE_EXTENSIONS[type];
+        return {
+            file: new File([result.blob], name, { type, lastModified: file.lastModified }),
+            width: result.width,
+            height: result.height
+        };
+    } catch (error) {
+        return null;
+    }
+}
+
+// Below this a hash round trip costs about as much as the upload
+const DEDUP_MIN_SIZE = 256 * 1024;
+
+// Ask the server whether it already has this content (or an optimized
+// copy of it); it answers 'present', 'linked' or 'copied' when nothing
+// needs sending
+async function checkExistingUpload(file, directory, sha256) {
+    try {
+        const response = await fetch('/api/upload/check', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                filename: file.name,
+                size: file.size,
+                sha256: sha256,
+                upload_directory: directory,
+                mtime: file.lastModified / 1000
+            })
+        });
+        if (!response.ok) return false;
+        const result = await response.json();
+        return result.status !== 'missing';
+    } catch (error) {
+        return false;
+    }
+}
+
+async function uploadFile(file, directory, onProgress) {
+    const settings = getImageOptimization();
+    const optimize = settings.maxDimension > 0 && canOptimizeImage(file);
+    const sha256 = optimize || file.size >= DEDUP_MIN_SIZE ? await contentHash(file) : null;
+    if (sha256 && await checkExistingUpload(file, directory, sha256)) {
+        onProgress(1);
+        return 'skipped';
+    }
+
+    // The server keeps the original's dimensions and hash beside the
+    // optimized copy
+    let original = null;
+    if (optimize && sha256) {
+        const optimized = await optimizeImage(file, settings);
+        if (optimized) {
+            original = { width: optimized.width, height: optimized.height, size: file.size, sha256 };
+            file = optimized.file;
+        }
+    }
+    if (!optimize && sha256 && file.size >= DELTA_MIN_SIZE) {
+        const result = await uploadDelta(file, directory, sha256, onProgress);
+        if (result !== null) return result;
+    }
+    // Small files go up in one streaming POST; large ones use resumable chunks
+    if (file.size > SINGLE_SHOT_LIMIT) {
+        return uploadFileChunked(file, directory, onProgress, original);
+    }
+
+    // The directory, mtime and original_* fields go first so the server
+    // can stream the file part straight into place
+    const formData = new FormData();
+    formData.append('upload_directory', directory);
+    formData.append('mtime', file.lastModified / 1000);
+    if (original) {
+        Object.entries(original).forEach(([key, value]) => formData.append('original_' + key, value));
+    }
+    formData.append('file', file);
+
+    let body = formData;
+    const headers = {};
+    if (shouldCompressUpload(file)) {
+        // Compress the whole multipart body; the server inflates it as it reads
+        const envelope = new Response(formData);
+        const compressed = await gzipBlob(envelope.body);
+        if (compressed.size < file.size * COMPRESS_MAX_RATIO) {
+            body = compressed;
+            headers['Content-Type'] = envelope.headers.get('Content-Type');
+            headers['Content-Encoding'] = 'gzip';
+        }
+    }
+
+    const response = await fetch('/api/upload', {
+        method: 'POST',
+        headers: headers,
+        body: body
+    });
+    onProgress(1);
+    return response.ok;
+}
+
+// Text-like formats worth gzipping; media and archives are already
+// compressed and are sent as they are
+const COMPRESSIBLE_EXTENSIONS = new Set([
+    'txt', 'log', 'csv', 'tsv', 'json', 'ndjson', 'xml', 'html', 'htm', 'css', 'js', 'ts', 'md',
+    'yaml', 'yml', 'ini', 'conf', 'sql', 'svg', 'rtf', 'tex', 'srt', 'vtt', 'ics', 'vcf', 'ipynb',
+    'py', 'java', 'c', 'h', 'cpp', 'sh', 'doc', 'xls', 'ppt', 'bmp', 'tif', 'tiff', 'ps', 'eps'
+]);
+const COMPRESS_MIN_SIZE = 4 * 1024;
+// Send uncompressed unless gzip saves at least 10%
+const COMPRESS_MAX_RATIO = 0.9;
+
+function shouldCompressUpload(file) {
+    if (typeof CompressionStream === 'undefined' || file.size < COMPRESS_MIN_SIZE) return false;
+    const extension = file.name.split('.').pop().toLowerCase();
+    return file.type.startsWith('text/') || COMPRESSIBLE_EXTENSIONS.has(extension);
+}
+
+function gzipBlob(stream) {
+    return new Response(stream.pipeThrough(new CompressionStream('gzip'))).blob();
+}
+
+// Upload one file through a resumable chunked session.
+// The server remembers which byte ranges it has, so after a dropped
+// connection (or a page reload) only the missing chunks are sent.
+async function uploadFileChunked(file, directory, onProgress, original = null) {
+    const response = await fetch('/api/upload/session', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            filename: file.name,
+            size: file.size,
+            upload_directory: directory,
+            fingerprint: `${file.name}:${file.size}:${file.lastModified}`,
+            original: original,
+            mtime: file.lastModified / 1000
+        })
+    });
+    if (!response.ok) return false;
+    let session = await response.json();
+
+    const compress = shouldCompressUpload(file);
+    for (const offset of missingChunkOffsets(session)) {
+        const end = Math.min(offset + session.chunk_size, session.size);
+        session = await uploadChunkWithRetry(session, file, offset, end, compress);
+        if (!session) return false;
+        onProgress(uploadedBytes(session) / Math.max(session.size, 1));
+    }
+
+    const finalizeResponse = await fetch(`/api/upload/session/${session.session_id}/finalize`, {
+        method: 'POST'
+    });
+    onProgress(1);
+    return finalizeResponse.ok;
+}
+
+function missingChunkOffsets(session) {
+    const offsets = [];
+    for (let offset = 0; offset < session.size; offset += session.chunk_size) {
+        const end = Math.min(offset + session.chunk_size, session.size);
+        if (!session.received.some(range => range[0] <= offset && range[1] >= end)) {
+            offsets.push(offset);
+        }
+    }
+    return offsets;
+}
+
+function uploadedBytes(session) {
+    return session.received.reduce((total, range) => total + range[1] - range[0], 0);
+}
+
+async function uploadChunkWithRetry(session, file, offset, end, compress) {
+    let body = file.slice(offset, end);
+    const headers = {
+        'Content-Type': 'application/octet-stream'
+    };
+    if (compress) {
+        const compressed = await gzipBlob(body.stream());
+        if (compressed.size < body.size * COMPRESS_MAX_RATIO) {
+            body = compressed;
+            headers['Content-Encoding'] = 'gzip';
+        }
+    }
+    for (let attempt = 0; attempt < CHUNK_MAX_RETRIES && uploadState.isUploading; attempt++) {
+        try {
+            const response = await fetch(`/api/upload/session/${session.session_id}?offset=${offset}`, {
+                method: 'PUT',
+                headers: headers,
+                body: body
+            });
+            if (response.ok) return await response.json();
+            // Unknown session or a body over the server's size limit: retrying won't help
+            if (response.status === 404 || response.status === 413) return null;
+        } catch (error) {
+            // Network dropped (Wi-Fi change, screen lock); back off and retry
+        }
+        await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** attempt, 30000)));
+    }
+    return null;
+}
+
+// Resume uploads on page load
+function resumeUploads() {
+    const storedState = localStorage.getItem('uploadState');
+    if (storedState) {
+        try {
+            const state = JSON.parse(storedState);
+            const done = (state.completed || []).filter(Boolean).length;
+            if (state.isUploading && done < state.files.length) {
+                uploadState = state;
+                showStatus(`🔄 Resuming upload: ${done}/${state.files.length} files`, 'success');
+                processUploadQueue();
+            }
+        } catch (error) {
+            localStorage.removeItem('uploadState');
+        }
+    }
+}
+
+// Pause uploads when page becomes hidden
+document.addEventListener('visibilitychange', function() {
+    if (document.hidden && uploadState.isUploading) {
+        showUploadStatus(`⏸️ Upload paused (screen locked). Unlock to resume.`, true);
+    } else if (!document.hidden && uploadState.isUploading) {
+        showUploadStatus(`▶️ Upload resumed`, false);
+    }
+});
+
+function showUploadStatus(message, showResume = false, showCancel = false) {
+    const statusDiv = document.getElementById('uploadStatus');
+    const statusText = document.getElementById('uploadStatusText');
+    const resumeBtn = document.getElementById('resumeUploadBtn');
+    const cancelBtn = document.getElementById('cancelUploadBtn');
+
+    statusText.textContent = message;
+    statusDiv.style.display = 'block';
+    resumeBtn.style.display = showResume ? 'inline-block' : 'none';
+    cancelBtn.style.display = showCancel ? 'inline-block' : 'none';
+
+    if (!showResume && !showCancel) {
+        setTimeout(() => {
+            statusDiv.style.display = 'none';
+        }, 3000);
+    }
+}
+
+function cancelUploads() {
+    uploadState.isUploading = false;
+    inFlightUploads.clear();
+    document.getElementById('uploadQueue').innerHTML = '';
+    localStorage.removeItem('uploadState');
+    showUploadStatus('❌ Upload cancelled', false, false);
+    document.getElementById('progress').style.display = 'none';
+}
+
+const PAGE_SIZE = 500;
+let listSort = 'name';
+let listOrder = 'asc';
+let nextCursor = null;
+
+function listingUrl(cursor) {
+    let url = '/api/files?path=' + encodeURIComponent(currentPath) +
+        '&base_path=' + encodeURIComponent(baseUploadDirectory) +
+        `&sort=${listSort}&order=${listOrder}&limit=${PAGE_SIZE}&format=columnar`;
+    if (cursor) url += '&cursor=' + encodeURIComponent(cursor);
+    return url;
+}
+
+// Columnar pages carry one array per field; rebuild the entry objects
+function rowsFromColumns(page) {
+    const c = page.columns;
+    const rows = new Array(c.name.length);
+    for (let i = 0; i < rows.length; i++) {
+        rows[i] = {
+            name: c.name[i],
+            path: page.prefix + c.name[i],
+            is_dir: c.is_dir[i] === 1,
+            size: c.size[i],
+            date: c.date[i],
+            mtime: c.mtime[i],
+            permissions: c.permissions[i]
+        };
+    }
+    return rows;
+}
+
+async function loadFiles() {
+    clearSearch();
+    try {
+        const response = await fetch(listingUrl(null));
+        const page = await response.json();
+        allFiles = rowsFromColumns(page);
+        nextCursor = page.next_cursor;
+        selectedFiles.clear();
+
+        // Add ".." entry at the top if we're in a subdirectory
+        if (currentPath && currentPath.trim() !== '') {
+            const parentPath = currentPath.split('/').slice(0, -1).join('/');
+            const parentEntry = {
+                name: '..',
+                path: parentPath,
+                is_dir: true,
+                size: null,
+                date: 'Parent directory'
+            };
+            allFiles.unshift(parentEntry);
+        }
+
+        displayFiles(allFiles);
+        updateBulkActions();
+        liveChannel.subscribe();
+    } catch (error) {
+        showStatus('Error loading files', 'error');
+    }
+}
+
+// Minimal Socket.IO (Engine.IO v4) client over a plain WebSocket;
+// the server pushes directory deltas so the list is patched in
+// place instead of refetched.
+const liveChannel = {
+    socket: null,
+    connected: false,
+    retryDelay: 1000,
+
+    connect() {
+        const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${location.host}/socket.io/?EIO=4&transport=websocket`);
+        this.socket = socket;
+        socket.onmessage = event => this.handlePacket(event.data);
+        socket.onclose = () => {
+            const wasConnected = this.connected;
+            this.connected = false;
+            setTimeout(() => this.connect(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+            // Deltas may have been missed while disconnected
+            if (wasConnected) loadFiles();
+        };
+    },
+
+    handlePacket(packet) {
+        if (packet.startsWith('0')) {
+            this.socket.send('40');             // open -> join default namespace
+        } else if (packet === '2') {
+            this.socket.send('3');              // ping -> pong
+        } else if (packet.startsWith('40')) {
+            this.connected = true;
+            this.retryDelay = 1000;
+            this.subscribe();
+        } else if (packet.startsWith('42')) {
+            const [event, data] = JSON.parse(packet.slice(2));
+            if (event === 'delta') applyDirectoryDelta(data);
+        }
+    },
+
+    emit(event, data) {
+        if (this.connected) this.socket.send('42' + JSON.stringify([event, data]));
+    },
+
+    subscribe() {
+        this.emit('subscribe', { path: currentPath, base_path: baseUploadDirectory });
+    }
+};
+
+function refreshAfterChange() {
+    if (!liveChannel.connected) loadFiles();
+}
+
+function compareEntries(a, b) {
+    if (a.is_dir !== b.is_dir) return a.is_dir ? -1 : 1;
+    let result;
+    if (listSort === 'size') {
+        result = (a.size || 0) - (b.size || 0);
+    } else if (listSort === 'mtime') {
+        result = a.mtime - b.mtime;
+    } else {
+        result = a.name.toLowerCase().localeCompare(b.name.toLowerCase());
+    }
+    return listOrder === 'desc' ? -result : result;
+}
+
+function applyDirectoryDelta(delta) {
+    if (delta.path !== currentPath || searchQuery) return;
+
+    const removed = new Set(delta.removed);
+    delta.changed.forEach(entry => removed.add(entry.name));
+    const parentEntry = allFiles.length && allFiles[0].name === '..' ? allFiles[0] : null;
+    let entries = allFiles.filter(f => f !== parentEntry && !removed.has(f.name));
+    delta.removed.forEach(name => {
+        const path = currentPath ? `${currentPath}/${name}` : name;
+        selectedFiles.delete(path);
+    });
+
+    // With more pages still on the server, only keep new entries
+    // that sort inside the part already loaded
+    const last = entries[entries.length - 1];
+    const incoming = delta.added.concat(delta.changed).filter(entry =>
+        !nextCursor || !last || compareEntries(entry, last) <= 0);
+    entries = entries.concat(incoming).sort(compareEntries);
+
+    allFiles = parentEntry ? [parentEntry].concat(entries) : entries;
+    displayFiles(allFiles);
+    updateBulkActions();
+}
+
+async function loadMoreFiles() {
+    if (!nextCursor) return;
+    try {
+        const response = await fetch(listingUrl(nextCursor));
+        const page = await response.json();
+        allFiles = allFiles.concat(rowsFromColumns(page));
+        nextCursor = page.next_cursor;
+        displayFiles(allFiles);
+    } catch (error) {
+        showStatus('Error loading files', 'error');
+    }
+}
+
+let searchQuery = '';
+let searchController = null;
+let searchTimer = null;
+
+function onSearchInput(value) {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        const query = value.trim();
+        if (query) {
+            searchFiles(query);
+        } else if (searchQuery) {
+            loadFiles();
+        }
+    }, 250);
+}
+
+function clearSearch() {
+    if (searchController) searchController.abort();
+    searchController = null;
+    searchQuery = '';
+    document.getElementById('searchInput').value = '';
+}
+
+// Results arrive as newline-delimited JSON and are shown as they
+// stream in; names are replaced by paths so matches in subfolders
+// can be told apart
+async function searchFiles(query) {
+    if (searchController) searchController.abort();
+    const controller = new AbortController();
+    searchController = controller;
+    searchQuery = query;
+    const mode = /[*?[]/.test(query) ? 'glob' : 'substring';
+    const url = '/api/search?q=' + encodeURIComponent(query) + `&mode=${mode}` +
+        '&path=' + encodeURIComponent(currentPath) +
+        '&base_path=' + encodeURIComponent(baseUploadDirectory);
+
+    allFiles = [];
+    nextCursor = null;
+    selectedFiles.clear();
+    try {
+        const response = await fetch(url, { signal: controller.signal });
+        if (!response.ok) {
+            // e.g. an unfinished glob such as [z-a]
+            const result = await response.json().catch(() => ({}));
+            throw new Error(result.error || 'Search failed');
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let truncated = false;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line).forEach(line => {
+                const item = JSON.parse(line);
+                if (item.done) {
+                    truncated = item.truncated;
+                } else {
+                    allFiles.push({ ...item, name: item.path });
+                }
+            });
+            displayFiles(allFiles);
+        }
+        displayFiles(allFiles);
+        updateBulkActions();
+        if (truncated) showStatus(`Showing the first ${allFiles.length} matches`, 'success');
+    } catch (error) {
+        if (error.name !== 'AbortError') showStatus(`Search failed: ${error.message}`, 'error');
+    }
+}
+
+function changeSort(value) {
+    [listSort, listOrder] = value.split(':');
+    loadFiles();
+}
+
+const IMAGE_EXTENSIONS = new Set(['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff']);
+
+function isImageFile(fileName) {
+    return IMAGE_EXTENSIONS.has(fileName.split('.').pop().toLowerCase());
+}
+
+// v (the mtime) makes the URL specific to one version of the file,
+// so the browser may cache it for good
+function thumbnailUrl(file) {
+    return '/api/thumbnail?path=' + encodeURIComponent(file.path) +
+        '&base_path=' + encodeURIComponent(baseUploadDirectory) +
+        `&size=128&v=${Math.round(file.mtime || 0)}`;
+}
+
+// Thumbnails are only fetched for rows scrolled into (or near) view;
+// the emoji icon stays if the server can't make one
+const thumbnailObserver = 'IntersectionObserver' in window ?
+    new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            thumbnailObserver.unobserve(entry.target);
+            loadThumbnail(entry.target);
+        });
+    }, { rootMargin: '200px' }) : null;
+
+function loadThumbnail(iconElement) {
+    const url = iconElement.dataset.thumb;
+    const img = new Image();
+    img.className = 'file-thumb';
+    img.alt = '';
+    img.onload = () => {
+        // The row may have been reused for another file meanwhile
+        if (iconElement.dataset.thumb !== url) return;
+        iconElement.textContent = '';
+        iconElement.appendChild(img);
+    };
+    img.src = url;
+}
+
+// The list is virtual: only the rows on screen (plus a margin) exist
+// in the DOM, absolutely placed inside a list as tall as all rows
+// together. Rows are keyed by path, so a refresh leaves unchanged rows
+// (and their loaded thumbnails) alone, and rows scrolled out of view
+// are recycled for the ones scrolling in.
+const ROW_OVERSCAN = 10;
+const fileView = {
+    files: [],
+    list: null,
+    loadMore: null,
+    rows: new Map(),
+    spare: [],
+    rowHeight: 0,
+    frame: 0
+};
+
+function rowKey(file) {
+    return file.name === '..' ? '\0..' : file.path;
+}
+
+function createRow() {
+    const row = document.createElement('li');
+    row.className = 'file-item';
+    row.innerHTML = `
+        <div class="file-item-content">
+            <input type="checkbox" class="file-checkbox">
+            <div class="file-icon"></div>
+            <div class="file-info">
+                <div class="file-name"></div>
+                <div class="file-details"></div>
+            </div>
+            <button class="file-menu-btn">⋯</button>
+        </div>`;
+    row.checkbox = row.querySelector('.file-checkbox');
+    row.icon = row.querySelector('.file-icon');
+    row.nameElement = row.querySelector('.file-name');
+    row.details = row.querySelector('.file-details');
+    row.menuButton = row.querySelector('.file-menu-btn');
+    return row;
+}
+
+// Rows have a fixed height (set in CSS, larger on phones); measure it
+// once per layout
+function rowHeight() {
+    if (!fileView.rowHeight) {
+        const probe = createRow();
+        probe.style.visibility = 'hidden';
+        fileView.list.appendChild(probe);
+        fileView.rowHeight = probe.offsetHeight || 50;
+        probe.remove();
+    }
+    return fileView.rowHeight;
+}
+
+function bindRow(row, file, index, height) {
+    row.dataset.index = index;
+    const top = index * height;
+    if (row.top !== top) {
+        row.top = top;
+        row.style.transform = `translateY(${top}px)`;
+    }
+
+    const selected = selectedFiles.has(file.path);
+    if (row.selected !== selected) {
+        row.selected = selected;
+        row.classList.toggle('selected', selected);
+        row.checkbox.checked = selected;
+    }
+
+    const signature = `${file.path}\n${file.name}\n${file.is_dir}\n${file.size}\n${file.mtime}\n${file.date}`;
+    if (row.signature === signature) return;
+    row.signature = signature;
+
+    const isParentDir = file.name === '..';
+    row.checkbox.style.visibility = isParentDir ? 'hidden' : '';
+    row.menuButton.style.visibility = isParentDir ? 'hidden' : '';
+    row.nameElement.textContent = file.name;
+    row.nameElement.classList.toggle('clickable', file.is_dir);
+    row.details.textContent = `${file.size ? formatFileSize(file.size) : ''} • ${file.date}`;
+
+    const icon = row.icon;
+    if (thumbnailObserver) thumbnailObserver.unobserve(icon);
+    icon.textContent = isParentDir ? '⬆️' : (file.is_dir ? '📁' : getFileIcon(file.name));
+    if (!file.is_dir && isImageFile(file.name)) {
+        icon.dataset.thumb = thumbnailUrl(file);
+        if (thumbnailObserver) thumbnailObserver.observe(icon);
+        else loadThumbnail(icon);
+    } else {
+        delete icon.dataset.thumb;
+    }
+}
+
+function renderVisibleRows() {
+    fileView.frame = 0;
+    const list = fileView.list;
+    if (!list) return;
+    const files = fileView.files;
+    const height = rowHeight();
+    const top = list.getBoundingClientRect().top;
+    const first = Math.max(0, Math.floor(-top / height) - ROW_OVERSCAN);
+    const last = Math.min(files.length, Math.ceil((window.innerHeight - top) / height) + ROW_OVERSCAN);
+
+    const wanted = new Map();
+    for (let i = first; i < last; i++) {
+        wanted.set(rowKey(files[i]), i);
+    }
+    fileView.rows.forEach((row, key) => {
+        if (!wanted.has(key)) {
+            fileView.rows.delete(key);
+            row.remove();
+            fileView.spare.push(row);
+        }
+    });
+    wanted.forEach((index, key) => {
+        let row = fileView.rows.get(key);
+        if (!row) {
+            row = fileView.spare.pop() || createRow();
+            fileView.rows.set(key, row);
+            list.appendChild(row);
+        }
+        bindRow(row, files[index], index, height);
+    });
+}
+
+function scheduleRender() {
+    if (!fileView.frame) fileView.frame = requestAnimationFrame(renderVisibleRows);
+}
+
+window.addEventListener('scroll', scheduleRender, { passive: true });
+window.addEventListener('resize', () => {
+    if (!fileView.list) return;
+    fileView.rowHeight = 0;
+    fileView.list.style.height = fileView.files.length * rowHeight() + 'px';
+    scheduleRender();
+});
+
+function displayFiles(files) {
+    const fileList = document.getElementById('fileList');
+    fileView.files = files;
+    if (fileMenu.file && !files.includes(fileMenu.file)) closeFileMenu();
+
+    if (files.length === 0) {
+        fileView.rows.forEach(row => fileView.spare.push(row));
+        fileView.rows.clear();
+        fileView.list = null;
+        fileList.innerHTML = `
+            <div class="empty-state">
+                <p>📁 No files found</p>
+                <p>Upload some files from your phone to get started</p>
+            </div>
+        `;
+        return;
+    }
+
+    if (!fileView.list) {
+        fileList.innerHTML = `<ul class="file-list"></ul>
+            <button class="load-more-btn" onclick="loadMoreFiles()">Load more</button>`;
+        fileView.list = fileList.querySelector('.file-list');
+        fileView.loadMore = fileList.querySelector('.load-more-btn');
+    }
+    fileView.list.style.height = files.length * rowHeight() + 'px';
+    fileView.loadMore.style.display = nextCursor ? '' : 'none';
+    renderVisibleRows();
+}
+
+// One set of listeners for every row, present and future
+document.getElementById('fileList').addEventListener('click', event => {
+    const row = event.target.closest('.file-item');
+    if (!row) return;
+    const file = fileView.files[row.dataset.index];
+    const menuButton = event.target.closest('.file-menu-btn');
+    if (menuButton) {
+        showFileMenu(file, menuButton);
+    } else if (file.is_dir && event.target.closest('.file-name')) {
+        navigateTo(file.path);
+    }
+});
+
+document.getElementById('fileList').addEventListener('change', event => {
+    if (!event.target.classList.contains('file-checkbox')) return;
+    const row = event.target.closest('.file-item');
+    toggleFileSelection(fileView.files[row.dataset.index].path);
+});
+
+function getFileIcon(fileName) {
+    const ext = fileName.split('.').pop()?.toLowerCase();
+    const icons = {
+        'jpg': '🖼️', 'jpeg': '🖼️', 'png': '🖼️', 'gif': '🖼️',
+        'mp4': '🎥', 'avi': '🎥', 'mov': '🎥',
+        'mp3': '🎵', 'wav': '🎵', 'flac': '🎵',
+        'pdf': '📄', 'doc': '📄', 'docx': '📄',
+        'zip': '📦', 'rar': '📦', '7z': '📦'
+    };
+    return icons[ext] || '📄';
+}
+
+function formatFileSize(bytes) {
+    if (!bytes) return '';
+    const sizes = ['B', 'KB', 'MB', 'GB'];
+    const i = Math.floor(Math.log(bytes) / Math.log(1024));
+    return Math.round(bytes / Math.pow(1024, i) * 100) / 100 + ' ' + sizes[i];
+}
+
+async function navigateTo(path) {
+    currentPath = path;
+    loadFiles();
+
+    // Update upload directory to match the current directory
+    uploadDirectory = baseUploadDirectory + (path ? '/' + path : '');
+    updateUploadPathDisplay();
+
+    showStatus(`Upload directory updated to: ${path || 'Downloads folder'}`, 'success');
+}
+
+function downloadUrl(path) {
+    return '/api/download?path=' + encodeURIComponent(path) + '&base_path=' + encodeURIComponent(baseUploadDirectory);
+}
+
+// Let the browser's download manager fetch the file: it streams to
+// disk and can resume with Range requests, unlike fetch() + Blob
+function downloadFile(path) {
+    const a = document.createElement('a');
+    a.href = downloadUrl(path);
+    a.download = path.split('/').pop();
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+}
+
+async function deleteFile(path) {
+    if (!confirm('Are you sure you want to delete this file?')) return;
+
+    try {
+        const response = await fetch('/api/delete', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ path: path })
+        });
+
+        if (response.ok) {
+            showStatus('File deleted successfully', 'success');
+            refreshAfterChange();
+        } else {
+            showStatus('Failed to delete file', 'error');
+        }
+    } catch (error) {
+        showStatus('Error deleting file', 'error');
+    }
+}
+
+function showStatus(message, type) {
+    const status = document.getElementById('status');
+    status.innerHTML = `<div class="status ${type}">${message}</div>`;
+    setTimeout(() => {
+        status.innerHTML = '';
+    }, 3000);
+}
+
+function toggleFileSelection(filePath) {
+    if (selectedFiles.has(filePath)) {
+        selectedFiles.delete(filePath);
+    } else {
+        selectedFiles.add(filePath);
+    }
+    updateBulkActions();
+    displayFiles(allFiles); // Refresh display to show selection state
+}
+
+function updateBulkActions() {
+    const bulkActions = document.getElementById('bulkActions');
+    const selectedCount = document.getElementById('selectedCount');
+
+    if (selectedFiles.size > 0) {
+        bulkActions.classList.add('show');
+        selectedCount.textContent = `${selectedFiles.size} file${selectedFiles.size === 1 ? '' : 's'} selected`;
+    } else {
+        bulkActions.classList.remove('show');
+    }
+}
+
+function toggleSelectAll() {
+    const allSelected = selectedFiles.size === allFiles.length;
+
+    if (allSelected) {
+        selectedFiles.clear();
+    } else {
+        allFiles.forEach(file => {
+            selectedFiles.add(file.path);
+        });
+    }
+
+    updateBulkActions();
+    displayFiles(allFiles);
+}
+
+// Ask the server for one streamed ZIP of the given paths. A form
+// submit lets the browser save the response straight to disk.
+function downloadArchive(paths) {
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/api/archive';
+    form.style.display = 'none';
+    const fields = paths.map(path => ['path', path]);
+    fields.push(['base_path', baseUploadDirectory], ['format', 'zip']);
+    fields.forEach(([name, value]) => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value;
+        form.appendChild(input);
+    });
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+}
+
+function downloadSelected() {
+    if (selectedFiles.size === 0) return;
+
+    const paths = Array.from(selectedFiles);
+    const first = allFiles.find(f => f.path === paths[0]);
+    if (paths.length === 1 && first && !first.is_dir) {
+        downloadFile(paths[0]);
+        return;
+    }
+
+    downloadArchive(paths);
+    showStatus(`Downloading ${paths.length} item${paths.length === 1 ? '' : 's'} as ZIP`, 'success');
+}
+
+async function deleteSelected() {
+    if (selectedFiles.size === 0) return;
+
+    const fileCount = selectedFiles.size;
+    if (!confirm(`Are you sure you want to delete ${fileCount} file${fileCount === 1 ? '' : 's'}?`)) {
+        return;
+    }
+
+    let successCount = 0;
+    let failCount = 0;
+
+    for (const filePath of selectedFiles) {
+        try {
+            const response = await fetch('/api/delete', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ path: filePath })
+            });
+
+            if (response.ok) {
+                successCount++;
+            } else {
+                failCount++;
+            }
+        } catch (error) {
+            failCount++;
+        }
+    }
+
+    if (successCount > 0) {
+        showStatus(`Successfully deleted ${successCount} file${successCount === 1 ? '' : 's'}`, 'success');
+    }
+    if (failCount > 0) {
+        showStatus(`Failed to delete ${failCount} file${failCount === 1 ? '' : 's'}`, 'error');
+    }
+
+    selectedFiles.clear();
+    refreshAfterChange();
+}
+
+function updateUploadPathDisplay() {
+    document.getElementById('currentUploadPath').textContent = uploadDirectory;
+}
+
+async function selectUploadDirectory() {
+    const newPath = prompt('Enter the full path to the directory where you want to save files:', uploadDirectory);
+    if (newPath && newPath.trim() !== '') {
+        // Validate the path by trying to list it
+        try {
+            const response = await fetch(`/api/validate-directory?path=${encodeURIComponent(newPath.trim())}`);
+            if (response.ok) {
+                baseUploadDirectory = newPath.trim();
+                uploadDirectory = baseUploadDirectory + (currentPath ? '/' + currentPath : '');
+                updateUploadPathDisplay();
+                showStatus('Upload directory updated successfully', 'success');
+            } else {
+                showStatus('Invalid directory path. Please check the path and try again.', 'error');
+            }
+        } catch (error) {
+            showStatus('Error validating directory path', 'error');
+        }
+    }
+}
+
+function resetUploadDirectory() {
+    uploadDirectory = '~/Downloads';
+    baseUploadDirectory = '~/Downloads';
+    updateUploadPathDisplay();
+    showStatus('Upload directory reset to default', 'success');
+}
+
+
+
+async function createFolderInCurrentDirectory() {
+    const folderName = prompt('Enter the name for the new folder:', '');
+    if (folderName && folderName.trim() !== '') {
+        try {
+            // Create folder in the current directory being viewed
+            const currentDir = baseUploadDirectory + (currentPath ? '/' + currentPath : '');
+            const response = await fetch('/api/create-folder', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ 
+                    path: currentDir,
+                    folder_name: folderName.trim()
+                })
+            });
+
+            if (response.ok) {
+                showStatus(`Folder "${folderName}" created successfully`, 'success');
+                refreshAfterChange(); // Show the new folder
+            } else {
+                showStatus('Failed to create folder', 'error');
+            }
+        } catch (error) {
+            showStatus('Error creating folder', 'error');
+        }
+    }
+}
+
+
+
+// A single popup serves every row; it is filled in for the row whose
+// button was pressed
+const fileMenu = document.createElement('div');
+fileMenu.className = 'file-menu-popup';
+document.body.appendChild(fileMenu);
+
+function showFileMenu(file, button) {
+    if (fileMenu.classList.contains('show') && fileMenu.file === file) {
+        closeFileMenu();
+        return;
+    }
+    fileMenu.file = file;
+    fileMenu.innerHTML = (file.is_dir ?
+        `<div class="file-menu-item" data-action="open">
+            <span class="icon">📂</span>Open
+        </div>
+        <div class="file-menu-item" data-action="zip">
+            <span class="icon">🗜️</span>Download as ZIP
+        </div>` :
+        `<div class="file-menu-item" data-action="download">
+            <span class="icon">⬇️</span>Download
+        </div>`) +
+        `<div class="file-menu-item danger" data-action="delete">
+            <span class="icon">🗑️</span>Delete
+        </div>`;
+
+    // Below the button, aligned to its right edge
+    const rect = button.getBoundingClientRect();
+    fileMenu.style.top = rect.bottom + window.scrollY + 'px';
+    fileMenu.style.right = document.documentElement.clientWidth - rect.right + 'px';
+    fileMenu.classList.add('show');
+}
+
+function closeFileMenu() {
+    fileMenu.classList.remove('show');
+    fileMenu.file = null;
+}
+
+fileMenu.addEventListener('click', event => {
+    const item = event.target.closest('.file-menu-item');
+    const file = fileMenu.file;
+    if (!item || !file) return;
+    closeFileMenu();
+    const action = item.dataset.action;
+    if (action === 'open') navigateTo(file.path);
+    else if (action === 'zip') downloadArchive([file.path]);
+    else if (action === 'download') downloadFile(file.path);
+    else if (action === 'delete') deleteFile(file.path);
+});
+
+// Close the menu when clicking outside
+document.addEventListener('click', function(event) {
+    if (!event.target.closest('.file-menu-btn') && !event.target.closest('.file-menu-popup')) {
+        closeFileMenu();
+    }
+});
@@ -1,20 +1,418 @@
 import os
+import sys
 import json
+import argparse
 import time
 import shutil
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory, render_template_string
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+from flask_socketio import SocketIO, join_room, leave_room
 import threading
-import subprocess
 import socket
+import uuid
+import ctypes
+import ctypes.util
+import struct
+import mimetypes
+import mmap
+import io
+import tarfile
+import zipfile
+import base64
+import stat
+import re
+import bisect
+import heapq
+import itertools
+import hashlib
+import sqlite3
+import queue
+import gzip
+import zlib
+import math
+from collections import OrderedDict
+from urllib.parse import quote
+from werkzeug.http import http_date
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from concurrent.futures import ProcessPoolExecutor
 
-app = Flask(__name__)
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Thumbnails are optional; without Pillow the UI keeps its icons
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; browsers get gzip without it
+    brotli = None
+
+# Static files are served by StaticBundle, not Flask's static route
+app = Flask(__name__, static_folder=None)
 CORS(app)
+socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading')
+
+# Per-user state (upload sessions, indexes, caches) lives here
+CONFIG_DIR = Path.home() / '.android_file_transfer'
+
+def read_directory_entries(directory):
+    """Read one directory with os.scandir, one stat per entry.
+
+    Returns {name: (is_dir, size, mtime, mode, is_real_dir, inode)};
+    size is None for anything but regular files and is_real_dir is False
+    for symlinks so tree walks don't follow them.
+    """
+    entries = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                st = entry.stat()
+                is_real_dir = entry.is_dir(follow_symlinks=False)
+            except (OSError, PermissionError):
+                continue
+            entries[entry.name] = (
+                stat.S_ISDIR(st.st_mode),
+                st.st_size if stat.S_ISREG(st.st_mode) else None,
+                st.st_mtime,
+                st.st_mode,
+                is_real_dir,
+                st.st_ino
+            )
+    return entries
+
+def read_directory_entry(path):
+    """The read_directory_entries tuple for a single path"""
+    st = os.stat(path)
+    return (
+        stat.S_ISDIR(st.st_mode),
+        st.st_size if stat.S_ISREG(st.st_mode) else None,
+        st.st_mtime,
+        st.st_mode,
+        stat.S_ISDIR(os.lstat(path).st_mode),
+        st.st_ino
+    )
+
+class SortedListing:
+    """A directory listing plus lazily built sort orders for paging"""
+
+    SORT_KEYS = {
+        'name': lambda e: (e['name'].lower(), e['name']),
+        'size': lambda e: (e['size'] or 0, e['name'].lower()),
+        'mtime': lambda e: (e['mtime'], e['name'].lower())
+    }
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.orders = {}
+        # (directory, base, version) while the listing is cacheable
+        self.validator = None
+
+    def ordered(self, sort='name', order='asc'):
+        """Entries in the given order (directories always first) and a
+        name -> position map for resolving cursors"""
+        key = (sort, order)
+        if key not in self.orders:
+            sort_key = self.SORT_KEYS[sort]
+            reverse = order == 'desc'
+            dirs = sorted((e for e in self.entries if e['is_dir']), key=sort_key, reverse=reverse)
+            files = sorted((e for e in self.entries if not e['is_dir']), key=sort_key, reverse=reverse)
+            ordered = dirs + files
+            positions = {e['name']: i for i, e in enumerate(ordered)}
+            self.orders[key] = (ordered, positions)
+        return self.orders[key]
+
+    def page(self, sort='name', order='asc', limit=500, cursor=None):
+        """Return (entries, next_cursor) for one page"""
+        ordered, positions = self.ordered(sort, order)
+        start = 0
+        if cursor:
+            offset, last = decode_listing_cursor(cursor)
+            if 0 < offset <= len(ordered) and ordered[offset - 1]['name'] == last['name']:
+                start = offset
+            elif last['name'] in positions:
+                # The directory changed since the previous page; continue after the same entry
+                start = positions[last['name']] + 1
+            else:
+                # The last entry is gone; continue at the first entry that sorts after it
+                sort_key = self.SORT_KEYS[sort]
+                last_key = (not last['is_dir'], sort_key(last))
+                start = len(ordered)
+                for i, entry in enumerate(ordered):
+                    key = (not entry['is_dir'], sort_key(entry))
+                    if key[0] != last_key[0]:
+                        after = key[0] > last_key[0]
+                    else:
+                        after = key[1] < last_key[1] if order == 'desc' else key[1] > last_key[1]
+                    if after:
+                        start = i
+                        break
+        page = ordered[start:start + limit]
+        end = start + len(page)
+        next_cursor = encode_listing_cursor(end, page[-1]) if page and end < len(ordered) else None
+        return page, next_cursor
+
+def encode_listing_cursor(offset, last):
+    """Opaque cursor: the position and sort fields of the last entry served"""
+    fields = [offset, last['name'], last['is_dir'], last['size'], last['mtime']]
+    raw = json.dumps(fields).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_listing_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        offset, name, is_dir, size, mtime = json.loads(raw)
+        return int(offset), {'name': str(name), 'is_dir': bool(is_dir), 'size': size, 'mtime': float(mtime)}
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+class DirectoryListingCache:
+    """LRU cache of directory listings.
+
+    An entry is reused while the directory's mtime is unchanged; the
+    server also drops entries itself whenever it changes a directory.
+    """
+
+    # A directory modified this recently may change again within the same
+    # mtime tick, so its listing is not cached yet
+    RACY_SECONDS = 2
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, directory, base, scan, version=None):
+        """Return the cached listing of directory, rescanning if it changed.
+
+        `version` overrides the directory mtime as the validator (the
+        tree index passes its per-directory generation).
+        """
+        key = (str(directory), str(base))
+        racy = False
+        if version is None:
+            version = os.stat(directory).st_mtime_ns
+            racy = time.time_ns() - version <= self.RACY_SECONDS * 1_000_000_000
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] == version:
+                self.entries.move_to_end(key)
+                return cached[1]
+        
+        listing = SortedListing(scan())
+        if not racy:
+            listing.validator = key + (version,)
+            with self.lock:
+                self.entries[key] = (version, listing)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return listing
+
+    def invalidate(self, directory, recursive=False):
+        """Forget listings of a directory (and, if recursive, everything below it)"""
+        directory = str(directory)
+        prefix = directory.rstrip(os.sep) + os.sep
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == directory or (recursive and key[0].startswith(prefix)):
+                    del self.entries[key]
+
+def _png_details(header):
+    if len(header) < 29 or header[12:16] != b'IHDR':
+        return 'PNG image data'
+    width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', header[16:29])
+    colors = {0: 'grayscale', 2: 'RGB', 3: 'colormap', 4: 'gray+alpha', 6: 'RGBA'}.get(color, 'unknown')
+    return (f"PNG image data, {width} x {height}, {depth}-bit{'/color' if color != 0 else ''} {colors}, "
+            f"{'interlaced' if interlace else 'non-interlaced'}")
+
+def _gif_details(header):
+    width, height = struct.unpack('<HH', header[6:10]) if len(header) >= 10 else (0, 0)
+    return f"GIF image data, version {header[3:6].decode('ascii')}, {width} x {height}"
+
+def _zip_details(header):
+    version = header[4] if len(header) > 4 else 20
+    return f"Zip archive data, at least v{version // 10}.{version % 10} to extract"
+
+def _pdf_details(header):
+    version = header[5:8].decode('ascii', 'replace')
+    return f"PDF document, version {version}"
+
+def _iso_media_details(header):
+    brand = header[8:12]
+    if brand in (b'heic', b'heix', b'heim', b'heis', b'mif1', b'msf1'):
+        return 'image/heic', 'ISO Media, HEIF Image'
+    if brand == b'avif':
+        return 'image/avif', 'ISO Media, AVIF Image'
+    if brand == b'qt  ':
+        return 'video/quicktime', 'ISO Media, Apple QuickTime movie'
+    if brand in (b'M4A ', b'M4B '):
+        return 'audio/mp4', 'ISO Media, Apple iTunes ALAC/AAC-LC (.M4A) Audio'
+    if brand.startswith(b'3g'):
+        return 'video/3gpp', 'ISO Media, MPEG v4 system, 3GPP'
+    return 'video/mp4', 'ISO Media, MP4 Base Media'
+
+def _riff_details(header):
+    kind = header[8:12]
+    if kind == b'WEBP':
+        return 'image/webp', 'RIFF (little-endian) data, Web/P image'
+    if kind == b'WAVE':
+        return 'audio/x-wav', 'RIFF (little-endian) data, WAVE audio'
+    if kind == b'AVI ':
+        return 'video/x-msvideo', 'RIFF (little-endian) data, AVI'
+    return 'application/octet-stream', 'RIFF (little-endian) data'
+
+# (offset, magic, mime, description); description may be a function of
+# the header, and mime may be None when the function returns both
+FILE_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg', 'JPEG image data'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png', _png_details),
+    (0, b'GIF87a', 'image/gif', _gif_details),
+    (0, b'GIF89a', 'image/gif', _gif_details),
+    (0, b'BM', 'image/bmp', 'PC bitmap'),
+    (0, b'II*\x00', 'image/tiff', 'TIFF image data, little-endian'),
+    (0, b'MM\x00*', 'image/tiff', 'TIFF image data, big-endian'),
+    (4, b'ftyp', None, _iso_media_details),
+    (0, b'RIFF', None, _riff_details),
+    (0, b'\x1aE\xdf\xa3', 'video/x-matroska', 'Matroska data'),
+    (0, b'%PDF-', 'application/pdf', _pdf_details),
+    (0, b'PK\x03\x04', 'application/zip', _zip_details),
+    (0, b'PK\x05\x06', 'application/zip', 'Zip archive data (empty)'),
+    (0, b'\x1f\x8b', 'application/gzip', 'gzip compressed data'),
+    (0, b'BZh', 'application/x-bzip2', 'bzip2 compressed data'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz', 'XZ compressed data'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed', '7-zip archive data'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar', 'RAR archive data'),
+    (257, b'ustar', 'application/x-tar', 'POSIX tar archive'),
+    (0, b'ID3', 'audio/mpeg', 'Audio file with ID3 version 2'),
+    (0, b'\xff\xfb', 'audio/mpeg', 'MPEG ADTS, layer III'),
+    (0, b'fLaC', 'audio/flac', 'FLAC audio bitstream data'),
+    (0, b'OggS', 'audio/ogg', 'Ogg data'),
+    (0, b'SQLite format 3\x00', 'application/vnd.sqlite3', 'SQLite 3.x database'),
+    (0, b'\x7fELF', 'application/x-executable', 'ELF'),
+    (0, b'\xcf\xfa\xed\xfe', 'application/x-mach-binary', 'Mach-O 64-bit executable'),
+    (0, b'\xca\xfe\xba\xbe', 'application/x-mach-binary', 'Mach-O universal binary'),
+]
+
+SCRIPT_KINDS = {
+    'sh': 'POSIX shell script',
+    'bash': 'Bourne-Again shell script',
+    'zsh': 'Paul Falstad\'s zsh script',
+    'python': 'Python script',
+    'perl': 'Perl script text',
+    'ruby': 'Ruby script',
+    'node': 'Node.js script',
+}
+
+def sniff_file_type(header, name=''):
+    """Classify a file from its first few KB.
+
+    Returns (mime, description), with descriptions worded like file(1)
+    for the formats phones and cameras produce. `name` is only used to
+    refine the MIME type of containers such as zip and of plain text.
+    """
+    if not header:
+        return 'inode/x-empty', 'empty'
+    guessed = mimetypes.guess_type(name)[0]
+    for offset, magic, mime, description in FILE_SIGNATURES:
+        if header[offset:offset + len(magic)] != magic:
+            continue
+        if callable(description):
+            description = description(header)
+        if mime is None:
+            mime, description = description
+        if mime == 'application/zip' and guessed and guessed != mime:
+            # docx, xlsx, apk, jar... are zip files with their own types
+            mime = guessed
+        return mime, description
+    
+    if b'\x00' in header:
+        return guessed or 'application/octet-stream', 'data'
+    try:
+        text = header.decode('ascii')
+        encoding = 'ASCII text'
+    except UnicodeDecodeError:
+        try:
+            text = header.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # Tolerate a multi-byte character cut off by the read limit
+            if e.start < len(header) - 3:
+                return guessed or 'application/octet-stream', 'data'
+            text = header[:e.start].decode('utf-8')
+        encoding = 'Unicode text, UTF-8 text'
+    
+    start = text.lstrip()[:64].lower()
+    if start.startswith('<!doctype html') or start.startswith('<html'):
+        mime, description = 'text/html', f'HTML document, {encoding}'
+    elif start.startswith('<?xml'):
+        mime, description = 'text/xml', f'XML 1.0 document, {encoding}'
+    elif text.startswith('#!'):
+        interpreter = text[2:].split('\n', 1)[0].strip().split('/')[-1].split(' ')[-1]
+        kind = SCRIPT_KINDS.get(interpreter.rstrip('0123456789.'), f'{interpreter} script')
+        mime, description = 'text/x-script', f'{kind}, {encoding} executable'
+    else:
+        mime, description = guessed if guessed and guessed.startswith('text/') else 'text/plain', encoding
+    if '\r\n' in text:
+        description += ', with CRLF line terminators'
+    elif '\n' not in text and '\r' not in text:
+        description += ', with no line terminators'
+    return mime, description
+
+class FileTypeDetector:
+    """In-process replacement for `file -b`, memoized per file version.
+
+    Results are kept in an LRU keyed by (inode, size, mtime), so a file
+    is only read again after it changes.
+    """
+
+    HEADER_BYTES = 8192
+
+    def __init__(self, max_entries=8192):
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def detect(self, path, st=None):
+        """(mime, description) for one path"""
+        if st is None:
+            st = os.stat(path)
+        if stat.S_ISDIR(st.st_mode):
+            return 'inode/directory', 'directory'
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            result = self.results.get(key)
+            if result is not None:
+                self.results.move_to_end(key)
+                return result
+        
+        with open(path, 'rb') as f:
+            header = f.read(self.HEADER_BYTES)
+        result = sniff_file_type(header, os.path.basename(path))
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+        return result
+
+    def classify_directory(self, directory):
+        """{name: (mime, description)} for every entry of a directory"""
+        types = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    types[entry.name] = self.detect(entry.path, entry.stat())
+                except (OSError, PermissionError):
+                    continue
+        return types
 
 class WebFileManager:
     def __init__(self):
         self.base_path = os.path.expanduser("~/Downloads")
+        self.listing_cache = DirectoryListingCache()
+        self.change_listeners = []
+        self.tree_index = None
         self.ensure_base_path()
         
     def ensure_base_path(self):
@@ -33,6 +431,12 @@ class WebFileManager:
         except:
             return "127.0.0.1"
     
+    def invalidate(self, path, recursive=False):
+        """Drop cached listings after the server changes a directory"""
+        self.listing_cache.invalidate(Path(path), recursive=recursive)
+        for listener in self.change_listeners:
+            listener(Path(path), recursive)
+    
     def list_files(self, path="", base_path=None):
         """List files in the transfer directory"""
         try:
@@ -45,55 +449,84 @@ class WebFileManager:
                 full_path = Path(self.base_path) / path if path else Path(self.base_path)
             
             if not full_path.exists():
-                return []
-            
-            files = []
-            for item in full_path.iterdir():
-                try:
-                    stat = item.stat()
-                    # Calculate relative path from the actual base path used
-                    actual_base = Path(base_path).expanduser() if base_path and base_path.startswith('~/') else Path(base_path) if base_path else Path(self.base_path)
-                    file_info = {
-                        'name': item.name,
-                        'path': str(item.relative_to(actual_base)),
-                        'is_dir': item.is_dir(),
-                        'size': stat.st_size if item.is_file() else None,
-                        'date': time.strftime('%b %d %H:%M', time.localtime(stat.st_mtime)),
-                        'permissions': oct(stat.st_mode)[-3:]
-                    }
-                    files.append(file_info)
-                except (OSError, PermissionError):
-                    continue
+                return SortedListing([])
             
-            # Sort: directories first, then files
-            files.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
-            return files
+            actual_base = Path(base_path) if base_path else Path(self.base_path)
+            index = self.tree_index
+            if index is not None and index.covers(full_path):
+                # Served from the in-memory index: no syscalls at all
+                return self.listing_cache.get(
+                    full_path, actual_base,
+                    lambda: self._build_listing(index.entries(full_path).items(), full_path, actual_base),
+                    version=('index', index.instance, index.directory_generation(full_path)))
+            return self.listing_cache.get(full_path, actual_base,
+                                          lambda: self._scan_directory(full_path, actual_base))
         except Exception as e:
             print(f"Error listing files: {e}")
-            return []
+            return SortedListing([])
+    
+    def _scan_directory(self, full_path, actual_base):
+        """Read a directory listing from disk"""
+        return self._build_listing(read_directory_entries(full_path).items(), full_path, actual_base)
     
-    def get_file_info(self, file_path):
+    def _build_listing(self, entries, full_path, actual_base):
+        """Turn (name, entry tuple) pairs into listing dicts"""
+        # Per-directory work happens once, not once per entry
+        relative_dir = full_path.relative_to(actual_base).as_posix()
+        prefix = '' if relative_dir == '.' else relative_dir + '/'
+        localtime = time.localtime
+        strftime = time.strftime
+        dates = {}
+        
+        files = []
+        for name, (is_dir, size, mtime, mode, _, _) in entries:
+            minute = int(mtime) // 60
+            date = dates.get(minute)
+            if date is None:
+                date = dates[minute] = strftime('%b %d %H:%M', localtime(mtime))
+            files.append({
+                'name': name,
+                'path': prefix + name,
+                'is_dir': is_dir,
+                'size': size,
+                'date': date,
+                'mtime': mtime,
+                'permissions': oct(mode)[-3:]
+            })
+        
+        # Sort: directories first, then files
+        files.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
+        return files
+    
+    def get_file_info(self, file_path, base_path=None):
         """Get detailed file information"""
         try:
-            full_path = Path(self.base_path) / file_path
+            full_path = Path(base_path or self.base_path) / file_path
             
             if not full_path.exists():
                 return None
             
             stat = full_path.stat()
             
-            # Get file type using file command
-            try:
-                result = subprocess.run(['file', '-b', str(full_path)], 
-                                      capture_output=True, text=True)
-                file_type = result.stdout.strip()
-            except:
-                file_type = "Unknown"
+            # Type, MIME and hash are remembered until the file changes
+            known = metadata_store.lookup(full_path, stat) or {}
+            file_type = known.get('description')
+            mime = known.get('mime')
+            if file_type is None:
+                try:
+                    mime, file_type = file_types.detect(str(full_path), stat)
+                except OSError:
+                    mime, file_type = 'application/octet-stream', "Unknown"
+                metadata_store.put_type(str(full_path), stat, mime, file_type)
             
             return {
                 'path': file_path,
                 'size': stat.st_size,
                 'type': file_type,
+                'mime': mime,
+                'sha256': known.get('sha256'),
+                'original': metadata_store.original(full_path, stat),
+                'inode': stat.st_ino,
                 'modified': stat.st_mtime,
                 'permissions': oct(stat.st_mode)[-3:]
             }
@@ -106,6 +539,7 @@ class WebFileManager:
         try:
             full_path = Path(self.base_path) / parent_path / dir_name
             full_path.mkdir(parents=True, exist_ok=True)
+            self.invalidate(full_path.parent)
             return True
         except Exception as e:
             print(f"Error creating directory: {e}")
@@ -121,1249 +555,1824 @@ class WebFileManager:
             
             if full_path.is_dir():
                 shutil.rmtree(full_path)
+                self.invalidate(full_path, recursive=True)
             else:
                 full_path.unlink()
+            self.invalidate(full_path.parent)
             
             return True
         except Exception as e:
             print(f"Error deleting file: {e}")
             return False
+    
+    def iter_archive_entries(self, paths, base_path=None):
+        """Walk the selected files and directories for an archive.
 
-file_manager = WebFileManager()
-
-# HTML template for the mobile web interface
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Android File Transfer</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: #f5f5f7;
-            color: #1d1d1f;
-        }
-        
-        .header {
-            background: #007aff;
-            color: white;
-            padding: 20px;
-            text-align: center;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        
-        .header h1 {
-            font-size: 24px;
-            font-weight: 600;
-        }
-        
-        .header p {
-            font-size: 14px;
-            opacity: 0.9;
-            margin-top: 5px;
-        }
-        
-        .container {
-            max-width: 1000px;
-            margin: 0 auto;
-            padding: 16px;
-        }
-        
-        @media (max-width: 768px) {
-            .container {
-                padding: 8px;
-            }
-        }
-        
-        .upload-section {
-            background: white;
-            border-radius: 8px;
-            padding: 16px;
-            margin-bottom: 16px;
-            border: 1px solid #e2e8f0;
-        }
-        
-        @media (max-width: 768px) {
-            .upload-section {
-                padding: 12px;
-                margin-bottom: 12px;
-            }
-        }
-        
-        .directory-selector {
-            background: #f8fafc;
-            border: 1px solid #e2e8f0;
-            border-radius: 6px;
-            padding: 12px;
-            margin-bottom: 12px;
-        }
-        
-        .directory-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 8px;
-        }
-        
-        .directory-title {
-            font-weight: 600;
-            color: #495057;
-        }
-        
-        .directory-path {
-            font-family: monospace;
-            background: white;
-            border: 1px solid #ced4da;
-            border-radius: 4px;
-            padding: 8px 12px;
-            font-size: 14px;
-            color: #6c757d;
-            margin-bottom: 10px;
-            word-break: break-all;
-        }
-        
-        .directory-actions {
-            display: flex;
-            gap: 6px;
-            flex-wrap: wrap;
-        }
-        
-        @media (max-width: 768px) {
-            .directory-actions {
-                flex-direction: column;
-                gap: 4px;
-            }
-        }
-        
-        .dir-btn {
-            background: #64748b;
-            color: white;
-            border: none;
-            padding: 6px 10px;
-            border-radius: 4px;
-            font-size: 12px;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        
-        @media (max-width: 768px) {
-            .dir-btn {
-                padding: 8px 12px;
-                font-size: 13px;
-                width: 100%;
-            }
-        }
-        
-        .dir-btn:hover {
-            background: #475569;
-        }
-        
-        .dir-btn.primary {
-            background: #3b82f6;
-        }
-        
-        .dir-btn.primary:hover {
-            background: #2563eb;
-        }
-        
-        .upload-btn {
-            background: #3b82f6;
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 6px;
-            font-size: 14px;
-            font-weight: 500;
-            cursor: pointer;
-            width: 100%;
-            margin-bottom: 8px;
-            transition: background-color 0.2s;
-        }
-        
-        @media (max-width: 768px) {
-            .upload-btn {
-                padding: 14px 20px;
-                font-size: 16px;
-                margin-bottom: 12px;
-            }
-        }
-        
-        .upload-btn:hover {
-            background: #2563eb;
-        }
-        
-        .file-input {
-            display: none;
-        }
-        
-        .progress {
-            width: 100%;
-            height: 4px;
-            background: #e5e5e7;
-            border-radius: 2px;
-            overflow: hidden;
-            margin-top: 10px;
-        }
-        
-        .progress-bar {
-            height: 100%;
-            background: #34c759;
-            width: 0%;
-            transition: width 0.3s ease;
-        }
-        
-        .files-section {
-            background: white;
-            border-radius: 8px;
-            padding: 16px;
-            border: 1px solid #e2e8f0;
-        }
-        
-        @media (max-width: 768px) {
-            .files-section {
-                padding: 12px;
-            }
-        }
-        
-        .files-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 12px;
-        }
-        
-        .files-header-left {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        
-        @media (max-width: 768px) {
-            .files-header {
-                flex-direction: column;
-                align-items: flex-start;
-                gap: 12px;
-            }
-            
-            .files-header-left {
-                width: 100%;
-                justify-content: space-between;
-                flex-wrap: wrap;
-                gap: 8px;
-            }
+        Yields (full_path, arcname, is_dir); arcnames are relative to the
+        parent of each selected item so a folder keeps its own name.
+        """
+        root = Path(base_path or self.base_path)
+        for path in paths:
+            full_path = Path(path).expanduser() if path.startswith('~/') else root / path
+            if not full_path.exists():
+                continue
+            if not full_path.is_dir():
+                yield full_path, full_path.name, False
+                continue
             
-            .files-title {
-                font-size: 16px;
-            }
-        }
-        
-        .files-title {
-            font-size: 16px;
-            font-weight: 600;
-        }
-        
-        .refresh-btn {
-            background: #f1f5f9;
-            border: 1px solid #e2e8f0;
-            padding: 6px 12px;
-            border-radius: 4px;
-            font-size: 13px;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        
-        .create-folder-btn {
-            background: #10b981;
-            color: white;
-            border: none;
-            padding: 6px 12px;
-            border-radius: 4px;
-            font-size: 13px;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        
+            parent = full_path.parent
+            for dir_path, dir_names, file_names in os.walk(full_path):
+                dir_names.sort()
+                dir_path = Path(dir_path)
+                yield dir_path, str(dir_path.relative_to(parent)), True
+                for name in sorted(file_names):
+                    yield dir_path / name, str((dir_path / name).relative_to(parent)), False
 
-        
-        @media (max-width: 768px) {
-            .refresh-btn {
-                padding: 10px 16px;
-                font-size: 14px;
-                width: 100%;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 6px;
-            }
-            
-            .create-folder-btn {
-                padding: 10px 16px;
-                font-size: 14px;
-                min-width: 120px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 6px;
-            }
-            
+# In-progress uploads are written here, never beside their destination,
+# so half-written files don't show up in listings, searches, sizes or
+# archives. Finishing an upload is a rename, so the staging directory
+# must be on the destination's filesystem.
+STAGING_DIR = CONFIG_DIR / 'staging'
+STAGING_NAME = '.aft-staging'
+_staging_dirs = {}
 
-        }
-        
-        .file-list {
-            list-style: none;
-        }
-        
-        .file-item {
-            display: flex;
-            align-items: center;
-            padding: 8px 0;
-            border-bottom: 1px solid #f1f5f9;
-        }
+def staging_directory(directory):
+    """Staging directory on the same filesystem as directory: STAGING_DIR
+    when it shares it, else .aft-staging at that filesystem's root (the
+    directory itself if neither is writable)"""
+    directory = Path(directory)
+    device = directory.stat().st_dev
+    staging = _staging_dirs.get(device)
+    if staging is None:
+        STAGING_DIR.mkdir(parents=True, exist_ok=True)
+        if STAGING_DIR.stat().st_dev == device:
+            staging = STAGING_DIR
+        else:
+            top = directory.resolve()
+            while top.parent != top and top.parent.stat().st_dev == device:
+                top = top.parent
+            staging = top / STAGING_NAME
+        try:
+            staging.mkdir(exist_ok=True)
+        except OSError as e:
+            print(f"Error creating staging directory {staging}: {e}")
+            return directory
+        _staging_dirs[device] = staging
+    # Recreate it if someone removed it meanwhile
+    staging.mkdir(exist_ok=True)
+    return staging
+
+class UploadSessionManager:
+    """Track chunked upload sessions so interrupted transfers can resume"""
+
+    CHUNK_SIZE = 8 * 1024 * 1024
+    STALE_AFTER = 7 * 24 * 3600
+
+    def __init__(self, state_dir):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _state_file(self, session_id):
+        return self.state_dir / f"{session_id}.json"
+
+    def _save(self, session):
+        """Persist session state so it survives a server restart"""
+        state_file = self._state_file(session['id'])
+        tmp_file = state_file.with_suffix('.tmp')
+        tmp_file.write_text(json.dumps(session))
+        os.replace(tmp_file, state_file)
+
+    def get_session(self, session_id):
+        """Return a session by id, loading it from disk if needed"""
+        if not session_id or not session_id.isalnum():
+            return None
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                try:
+                    session = json.loads(self._state_file(session_id).read_text())
+                except (OSError, ValueError):
+                    return None
+                self.sessions[session_id] = session
+            return session
+
+    def find_session(self, fingerprint, dest_path):
+        """Find an unfinished session for the same file and destination"""
+        with self.lock:
+            for session in self.sessions.values():
+                if session['fingerprint'] == fingerprint and session['dest_path'] == str(dest_path):
+                    return session
+        return None
+
+    def create_session(self, filename, size, upload_directory, fingerprint=None, original=None, mtime=None,
+                       max_chunk_size=None):
+        """Create a new upload session, or return the matching unfinished one.
+
+        max_chunk_size (the request size limit, if any) caps the chunk size
+        so every chunk fits in one request.
+        """
+        filename = Path(filename or '').name
+        if not filename:
+            raise ValueError('No file selected')
+        if size is None or int(size) < 0:
+            raise ValueError('Invalid file size')
+        size = int(size)
+
+        dest_path = Path(upload_directory) / filename
+        if fingerprint:
+            existing = self.find_session(fingerprint, dest_path)
+            if existing and existing['size'] == size and Path(existing['part_path']).exists() and \
+                    existing['chunk_size'] <= (max_chunk_size or self.CHUNK_SIZE):
+                return existing
+
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        session_id = uuid.uuid4().hex
+        # Stage the partial file on the destination's filesystem so finalize is a rename
+        part_path = staging_directory(dest_path.parent) / f".{filename}.{session_id}.part"
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+
+        session = {
+            'id': session_id,
+            'filename': filename,
+            'size': size,
+            'chunk_size': min(self.CHUNK_SIZE, max_chunk_size or self.CHUNK_SIZE),
+            'dest_path': str(dest_path),
+            'part_path': str(part_path),
+            'fingerprint': fingerprint,
+            'original': original,
+            'mtime': mtime,
+            'received': [],
+            'updated': time.time()
+        }
+        with self.lock:
+            self.sessions[session_id] = session
+            self._save(session)
+        return session
+
+    @staticmethod
+    def _add_range(ranges, start, end):
+        """Merge [start, end) into a sorted list of byte ranges"""
+        merged = []
+        for r_start, r_end in sorted(ranges + [[start, end]]):
+            if merged and r_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], r_end)
+            else:
+                merged.append([r_start, r_end])
+        return merged
+
+    @staticmethod
+    def next_offset(session):
+        """First byte the server does not have yet"""
+        received = session['received']
+        if received and received[0][0] == 0:
+            return received[0][1]
+        return 0
+
+    def write_chunk(self, session, offset, stream, length):
+        """Write one chunk at its offset, streaming it from the request body"""
+        chunk_size = session['chunk_size']
+        if offset < 0 or offset % chunk_size or offset >= session['size']:
+            raise ValueError('Invalid chunk offset')
+        expected = min(chunk_size, session['size'] - offset)
+        if length != expected:
+            raise ValueError(f'Chunk at offset {offset} must be {expected} bytes')
+
+        written = 0
+        fd = os.open(session['part_path'], os.O_WRONLY)
+        try:
+            while written < length:
+                data = stream.read(min(64 * 1024, length - written))
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + written)
+                written += len(data)
+        finally:
+            os.close(fd)
+
+        if written != length:
+            # Connection dropped mid-chunk; the client will resend it
+            raise ValueError('Incomplete chunk')
+        if stream.read(1):
+            # An inflated body can run past the chunk's slot in the layout
+            raise ValueError(f'Chunk at offset {offset} is longer than {expected} bytes')
+
+        with self.lock:
+            session['received'] = self._add_range(session['received'], offset, offset + length)
+            session['updated'] = time.time()
+            self._save(session)
+        return session
+
+    def finalize(self, session):
+        """Atomically move a complete upload into place"""
+        if session['received'] != [[0, session['size']]] and session['size'] > 0:
+            raise ValueError('Upload is incomplete')
+
+        part_path = Path(session['part_path'])
+        with open(part_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        if session.get('mtime'):
+            os.utime(part_path, (time.time(), session['mtime']))
+        os.replace(part_path, session['dest_path'])
+        file_manager.invalidate(Path(session['dest_path']).parent)
+        self._discard(session['id'])
+        return Path(session['dest_path'])
+
+    def abort(self, session):
+        """Drop a session and its partial data"""
+        try:
+            Path(session['part_path']).unlink()
+        except FileNotFoundError:
+            pass
+        self._discard(session['id'])
+
+    def _discard(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+            try:
+                self._state_file(session_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    def load_sessions(self):
+        """Reload persisted sessions and clean up stale ones"""
+        now = time.time()
+        for state_file in self.state_dir.glob('*.json'):
+            try:
+                session = json.loads(state_file.read_text())
+            except (OSError, ValueError):
+                continue
+            if now - session.get('updated', 0) > self.STALE_AFTER or not Path(session['part_path']).exists():
+                self.abort(session)
+            else:
+                self.sessions[session['id']] = session
         
-        @media (max-width: 768px) {
-            .file-item {
-                padding: 12px 0;
-                flex-direction: column;
-                align-items: flex-start;
-                gap: 8px;
-            }
+        # Leftovers of uploads cut off by a crash
+        live = {session['part_path'] for session in self.sessions.values()}
+        for part_path in STAGING_DIR.glob('*.part'):
+            try:
+                if str(part_path) not in live and now - part_path.stat().st_mtime > self.STALE_AFTER:
+                    part_path.unlink()
+            except OSError:
+                continue
+
+class InflatingReader:
+    """Read-only stream that inflates a gzip or deflate request body as
+    it is read, so compressed uploads stream to disk like plain ones"""
+
+    def __init__(self, stream, encoding, limit=None):
+        self.stream = stream
+        self.decompressor = zlib.decompressobj(31 if encoding == 'gzip' else 15)
+        self.limit = limit
+        self.total = 0
+
+    def read(self, size=64 * 1024):
+        if size is None or size < 0:
+            size = 64 * 1024
+        while True:
+            if self.decompressor.unconsumed_tail:
+                data = self.decompressor.decompress(self.decompressor.unconsumed_tail, size)
+            elif self.decompressor.eof:
+                return b''
+            else:
+                raw = self.stream.read(64 * 1024)
+                if not raw:
+                    raise ValueError('Incomplete compressed upload')
+                data = self.decompressor.decompress(raw, size)
+            if data:
+                self.total += len(data)
+                if self.limit is not None and self.total > self.limit:
+                    raise RequestEntityTooLarge('Upload too large once inflated')
+                return data
+
+def receive_streaming_upload(stream, boundary, upload_directory):
+    """Parse a multipart upload incrementally, writing the file part
+    straight into a .part file in the destination's staging directory.
+
+    Returns (dest_path, filename, fields); dest_path is None if no file
+    part was sent.
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size=1024 * 1024)
+    fields = {}
+    current = None          # 'field', 'file' or 'skip' for the part being read
+    field_name = None
+    field_value = bytearray()
+    part_file = None
+    part_path = None
+    filename = None
+
+    def resolve_directory():
+        directory = fields.get('upload_directory') or upload_directory
+        if directory.startswith('~/'):
+            directory = str(Path(directory).expanduser())
+        return Path(directory)
+
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                if decoder.complete:
+                    raise ValueError('Incomplete upload')
+                decoder.receive_data(stream.read(256 * 1024) or None)
+            elif isinstance(event, File):
+                current = 'skip'
+                if event.name == 'file' and part_file is None:
+                    filename = Path(event.filename or '').name
+                    if filename:
+                        directory = resolve_directory()
+                        directory.mkdir(parents=True, exist_ok=True)
+                        part_path = staging_directory(directory) / f".{filename}.{uuid.uuid4().hex}.part"
+                        part_file = open(part_path, 'wb')
+                        current = 'file'
+            elif isinstance(event, Field):
+                current = 'field'
+                field_name = event.name
+                field_value = bytearray()
+            elif isinstance(event, Data):
+                if current == 'file':
+                    part_file.write(event.data)
+                    if not event.more_data:
+                        part_file.close()
+                elif current == 'field':
+                    field_value += event.data
+                    if not event.more_data:
+                        fields[field_name] = field_value.decode('utf-8', 'replace')
+            elif isinstance(event, Epilogue):
+                break
+
+        if part_file is None:
+            return None, filename, fields
+
+        # The directory field may arrive after the file part, naming
+        # one on another filesystem
+        dest_directory = resolve_directory()
+        dest_directory.mkdir(parents=True, exist_ok=True)
+        staging = staging_directory(dest_directory)
+        if staging != part_path.parent:
+            moved_path = staging / part_path.name
+            shutil.move(str(part_path), str(moved_path))
+            part_path = moved_path
+
+        dest_path = dest_directory / filename
+        os.replace(part_path, dest_path)
+        file_manager.invalidate(dest_directory)
+        return dest_path, filename, fields
+    except BaseException:
+        if part_file is not None:
+            part_file.close()
+            try:
+                part_path.unlink()
+            except FileNotFoundError:
+                pass
+        raise
+
+def delta_block_size(size):
+    """Signature block size: 2 KB, doubled until the file has at most
+    4096 blocks, but never above 128 KB"""
+    block_size = 2048
+    while block_size * 4096 < size and block_size < 128 * 1024:
+        block_size *= 2
+    return block_size
+
+def delta_signature(path):
+    """(block_size, weak, strong) for a file: Adler-32 and the first 8
+    bytes of SHA-256 (hex) of each block. Adler-32 can be rolled a byte
+    at a time, so the client can search for blocks at any offset."""
+    block_size = delta_block_size(os.path.getsize(path))
+    weak, strong = [], []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            weak.append(zlib.adler32(block))
+            strong.append(hashlib.sha256(block).hexdigest()[:16])
+    return block_size, weak, strong
+
+def read_exact(stream, length):
+    """Read exactly length bytes from a stream"""
+    data = b''
+    while len(data) < length:
+        more = stream.read(length - len(data))
+        if not more:
+            raise ValueError('Incomplete delta')
+        data += more
+    return data
+
+def apply_delta(stream, dest_path, size, sha256):
+    """Rebuild dest_path from a delta stream and atomically replace it.
+
+    The stream is a series of ops: b'C' + block index + block count
+    (big-endian uint32s) copies blocks of the current file; b'L' +
+    length + bytes inserts new data. The result must have the given
+    size and SHA-256 or the current file is left alone. Returns
+    (copied, literal) byte counts.
+    """
+    block_size = delta_block_size(os.path.getsize(dest_path))
+    part_path = staging_directory(dest_path.parent) / f".{dest_path.name}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    copied = literal = 0
+    try:
+        with open(dest_path, 'rb') as basis, open(part_path, 'wb') as out:
+            basis_size = os.fstat(basis.fileno()).st_size
+            while True:
+                op = stream.read(1)
+                if not op:
+                    break
+                if op == b'C':
+                    index, count = struct.unpack('>II', read_exact(stream, 8))
+                    start = index * block_size
+                    end = min((index + count) * block_size, basis_size)
+                    if count == 0 or start >= basis_size:
+                        raise ValueError('Invalid block range')
+                    basis.seek(start)
+                    remaining = end - start
+                    copied += remaining
+                    while remaining:
+                        data = basis.read(min(1024 * 1024, remaining))
+                        out.write(data)
+                        digest.update(data)
+                        remaining -= len(data)
+                elif op == b'L':
+                    (remaining,) = struct.unpack('>I', read_exact(stream, 4))
+                    literal += remaining
+                    while remaining:
+                        data = stream.read(min(256 * 1024, remaining))
+                        if not data:
+                            raise ValueError('Incomplete delta')
+                        out.write(data)
+                        digest.update(data)
+                        remaining -= len(data)
+                else:
+                    raise ValueError('Invalid delta op')
+                if copied + literal > size:
+                    raise ValueError('Delta is longer than the file')
+            out.flush()
+            os.fsync(out.fileno())
+        
+        if copied + literal != size or digest.hexdigest() != sha256:
+            raise ValueError('Rebuilt file does not match')
+        shutil.copymode(dest_path, part_path)
+        os.replace(part_path, dest_path)
+        return copied, literal
+    except BaseException:
+        try:
+            part_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+class MetadataStore:
+    """SQLite record of the served files, kept across restarts.
+
+    Stores path, size, mtime, inode and mode for everything the tree
+    index sees, plus content hash and file type once computed. Hash and
+    type are dropped whenever (size, mtime, inode) changes, so only files
+    that actually changed are ever hashed again. Uploads that the phone
+    downscaled first also keep the original's dimensions, size and hash.
+    Writes go through a queue and are committed in batches by one
+    thread; WAL mode lets readers carry on meanwhile.
+    """
+
+    BATCH_SECONDS = 0.5
+    BATCH_SIZE = 5000
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            size INTEGER,
+            mtime REAL NOT NULL,
+            mode INTEGER NOT NULL,
+            is_real_dir INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            sha256 TEXT,
+            mime TEXT,
+            description TEXT
+        );
+        CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+        CREATE TABLE IF NOT EXISTS directories (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS originals (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            inode INTEGER NOT NULL,
+            original_width INTEGER NOT NULL,
+            original_height INTEGER NOT NULL,
+            original_size INTEGER NOT NULL,
+            original_sha256 TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS originals_sha256 ON originals (original_sha256);
+    """
+
+    # Derived columns survive only while (size, mtime, inode) are unchanged
+    UPSERT = """
+        INSERT INTO files (path, parent, name, is_dir, size, mtime, mode, is_real_dir, inode)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (path) DO UPDATE SET
+            sha256 = CASE WHEN unchanged THEN files.sha256 END,
+            mime = CASE WHEN unchanged THEN files.mime END,
+            description = CASE WHEN unchanged THEN files.description END,
+            is_dir = excluded.is_dir,
+            size = excluded.size,
+            mtime = excluded.mtime,
+            mode = excluded.mode,
+            is_real_dir = excluded.is_real_dir,
+            inode = excluded.inode
+    """.replace('unchanged', '(files.size IS excluded.size AND files.mtime = excluded.mtime '
+                             'AND files.inode = excluded.inode)')
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _reader(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    @staticmethod
+    def _row(directory, name, entry):
+        is_dir, size, mtime, mode, is_real_dir, inode = entry
+        return (os.path.join(directory, name), directory, name, is_dir, size, mtime, mode, is_real_dir, inode)
+
+    def _submit(self, op):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+        self.queue.put(op)
+
+    def put_directory(self, directory, mtime_ns, entries):
+        """Record a directory's entries (None: only its mtime changed)"""
+        self._submit(('directory', directory, mtime_ns, entries))
+
+    def put_entry(self, directory, name, entry):
+        """Record one entry; entry None means it was removed"""
+        self._submit(('entry', directory, name, entry))
+
+    def remove_subtree(self, directory):
+        """Forget everything below a directory that no longer exists"""
+        self._submit(('remove', directory))
+
+    def put_hash(self, path, st, sha256):
+        """Remember a content hash for the file as it was when stat'ed"""
+        self._submit(('derived', path, st, 'sha256', sha256))
+
+    def put_type(self, path, st, mime, description):
+        """Remember detected MIME type and description"""
+        self._submit(('derived', path, st, 'mime', mime))
+        self._submit(('derived', path, st, 'description', description))
+
+    def put_original(self, path, st, original):
+        """Remember the image an optimized upload was made from, as
+        {width, height, size, sha256}"""
+        self._submit(('original', path, st, original))
+
+    def flush(self):
+        """Block until every queued write is committed"""
+        self.queue.join()
+
+    def lookup(self, path, st):
+        """Stored row for path as a dict, or None if missing or if the
+        file no longer matches st"""
+        row = self._reader().execute(
+            'SELECT size, mtime, inode, sha256, mime, description FROM files WHERE path = ?',
+            (str(path),)).fetchone()
+        if row is None or row[1] != st.st_mtime or row[2] != st.st_ino or \
+                (stat.S_ISREG(st.st_mode) and row[0] != st.st_size):
+            return None
+        return {'sha256': row[3], 'mime': row[4], 'description': row[5]}
+
+    def original(self, path, st):
+        """The original behind an optimized upload, or None if there is
+        none or the file has changed since"""
+        row = self._reader().execute(
+            'SELECT size, mtime, inode, original_width, original_height, original_size, original_sha256 '
+            'FROM originals WHERE path = ?', (str(path),)).fetchone()
+        if row is None or row[:3] != (st.st_size, st.st_mtime, st.st_ino):
+            return None
+        return {'width': row[3], 'height': row[4], 'size': row[5], 'sha256': row[6]}
+
+    def paths_with_original(self, sha256):
+        """Paths recorded as optimized copies of the given original"""
+        return [path for (path,) in self._reader().execute(
+            'SELECT path FROM originals WHERE original_sha256 = ?', (sha256,))]
+
+    def originals_in(self, directory):
+        """{name: (size, mtime, inode, original_size)} for the optimized
+        copies recorded directly in directory"""
+        directory = str(directory)
+        low, high = directory + os.sep, directory + chr(ord(os.sep) + 1)
+        copies = {}
+        for path, *row in self._reader().execute(
+                'SELECT path, size, mtime, inode, original_size FROM originals '
+                'WHERE path >= ? AND path < ?', (low, high)):
+            name = path[len(low):]
+            if os.sep not in name:
+                copies[name] = tuple(row)
+        return copies
+
+    def load_tree(self, root):
+        """Saved (dirs, dir_mtimes) for root and everything below it"""
+        root = str(root)
+        low, high = root + os.sep, root + chr(ord(os.sep) + 1)
+        conn = self._reader()
+        dir_mtimes = dict(conn.execute(
+            'SELECT path, mtime_ns FROM directories WHERE path = ? OR (path >= ? AND path < ?)',
+            (root, low, high)))
+        dirs = {directory: {} for directory in dir_mtimes}
+        for parent, name, is_dir, size, mtime, mode, is_real_dir, inode in conn.execute(
+                'SELECT parent, name, is_dir, size, mtime, mode, is_real_dir, inode FROM files '
+                'WHERE parent = ? OR (parent >= ? AND parent < ?)', (root, low, high)):
+            if parent in dirs:
+                dirs[parent][name] = (bool(is_dir), size, mtime, mode, bool(is_real_dir), inode)
+        return dirs, dir_mtimes
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            ops = [self.queue.get()]
+            deadline = time.monotonic() + self.BATCH_SECONDS
+            while len(ops) < self.BATCH_SIZE:
+                try:
+                    ops.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    for op in ops:
+                        self._apply(conn, op)
+            except Exception as e:
+                # Drop the batch but keep the writer alive; nothing restarts it
+                print(f"Error writing metadata: {e}")
+            finally:
+                for _ in ops:
+                    self.queue.task_done()
+
+    def _apply(self, conn, op):
+        kind = op[0]
+        if kind == 'directory':
+            _, directory, mtime_ns, entries = op
+            conn.execute('INSERT INTO directories (path, mtime_ns) VALUES (?, ?) '
+                         'ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns',
+                         (directory, mtime_ns))
+            if entries is None:
+                return
+            stored = [name for (name,) in conn.execute('SELECT name FROM files WHERE parent = ?', (directory,))]
+            conn.executemany('DELETE FROM files WHERE path = ?',
+                             [(os.path.join(directory, name),) for name in stored if name not in entries])
+            conn.executemany(self.UPSERT, [self._row(directory, name, entry) for name, entry in entries.items()])
+        elif kind == 'entry':
+            _, directory, name, entry = op
+            if entry is None:
+                conn.execute('DELETE FROM files WHERE path = ?', (os.path.join(directory, name),))
+                conn.execute('DELETE FROM originals WHERE path = ?', (os.path.join(directory, name),))
+            else:
+                conn.execute(self.UPSERT, self._row(directory, name, entry))
+        elif kind == 'remove':
+            _, directory = op
+            bounds = (directory, directory + os.sep, directory + chr(ord(os.sep) + 1))
+            conn.execute('DELETE FROM files WHERE parent = ? OR (parent >= ? AND parent < ?)', bounds)
+            conn.execute('DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)', bounds)
+            conn.execute('DELETE FROM originals WHERE path >= ? AND path < ?', bounds[1:])
+        elif kind == 'derived':
+            _, path, st, column, value = op
+            directory, name = os.path.split(path)
+            entry = (stat.S_ISDIR(st.st_mode), st.st_size if stat.S_ISREG(st.st_mode) else None,
+                     st.st_mtime, st.st_mode, stat.S_ISDIR(st.st_mode), st.st_ino)
+            conn.execute(self.UPSERT, self._row(directory, name, entry))
+            conn.execute(f'UPDATE files SET {column} = ? WHERE path = ?', (value, path))
+        elif kind == 'original':
+            _, path, st, original = op
+            conn.execute('INSERT OR REPLACE INTO originals VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (path, st.st_size, st.st_mtime, st.st_ino, original['width'],
+                          original['height'], original['size'], original['sha256']))
+
+class ContentHashIndex:
+    """SHA-256 of files the server holds, cached in the metadata store.
+
+    Hashes are computed lazily, only for files that could duplicate an
+    upload, and reused until the file's (size, mtime, inode) changes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def hash_file(self, path):
+        """SHA-256 of a file, from the store when it hasn't changed"""
+        path = str(path)
+        st = os.stat(path)
+        row = self.store.lookup(path, st)
+        if row and row['sha256']:
+            return row['sha256']
+        
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                digest.update(block)
+        self.store.put_hash(path, st, digest.hexdigest())
+        return digest.hexdigest()
+
+    def find(self, size, sha256, candidates):
+        """First candidate path with the given size and hash, or None"""
+        for path in candidates:
+            try:
+                if os.path.getsize(path) == size and self.hash_file(path) == sha256:
+                    return Path(path)
+            except OSError:
+                continue
+        return None
+
+def place_duplicate(source, dest_path, link=True):
+    """Put a copy of source at dest_path, hard-linking when link is set
+    and the filesystem allows it; returns 'linked' or 'copied'"""
+    tmp_path = staging_directory(dest_path.parent) / f".{dest_path.name}.{uuid.uuid4().hex}.part"
+    method = 'copied'
+    if link:
+        try:
+            os.link(source, tmp_path)
+            method = 'linked'
+        except OSError:
+            # Different filesystem, or one without hard links
+            pass
+    if method == 'copied':
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, dest_path)
+    return method
+
+class DirectoryChangeNotifier:
+    """Push incremental listing deltas to clients subscribed to a directory.
+
+    Each subscribed directory keeps a snapshot of its entries; when the
+    server changes it, or its mtime moves, the listing is re-read and
+    only the added, removed and changed entries are sent to its room.
+    """
+
+    POLL_INTERVAL = 1.0
+    DEBOUNCE = 0.2
+
+    def __init__(self, socketio, file_manager):
+        self.socketio = socketio
+        self.file_manager = file_manager
+        self.subscriptions = {}
+        self.client_rooms = {}
+        self.dirty = set()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, sid, path, base_path):
+        """Subscribe a client to a directory and return its room name"""
+        directory = str(Path(base_path) / path if path else Path(base_path))
+        room = f"{base_path}|{directory}"
+        listing = self.file_manager.list_files(path, base_path)
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        
+        with self.lock:
+            subscription = self.subscriptions.get(room)
+            if subscription is None:
+                subscription = self.subscriptions[room] = {
+                    'path': path,
+                    'base_path': base_path,
+                    'directory': directory,
+                    'mtime_ns': mtime_ns,
+                    'snapshot': {e['name']: e for e in listing.entries},
+                    'clients': set()
+                }
+            subscription['clients'].add(sid)
+            self.client_rooms[sid] = room
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return room
+
+    def unsubscribe(self, sid):
+        """Drop a client's subscription; returns the room it left"""
+        with self.lock:
+            room = self.client_rooms.pop(sid, None)
+            subscription = self.subscriptions.get(room)
+            if subscription is not None:
+                subscription['clients'].discard(sid)
+                if not subscription['clients']:
+                    del self.subscriptions[room]
+        return room
+
+    def directory_changed(self, directory, recursive=False):
+        """Called after the server changes a directory"""
+        directory = str(directory)
+        prefix = directory.rstrip(os.sep) + os.sep
+        with self.lock:
+            for room, subscription in self.subscriptions.items():
+                watched = subscription['directory']
+                if watched == directory or (recursive and watched.startswith(prefix)):
+                    self.dirty.add(room)
+            if not self.dirty:
+                return
+        self.wakeup.set()
+
+    def _refresh(self, room, subscription):
+        listing = self.file_manager.list_files(subscription['path'], subscription['base_path'])
+        current = {e['name']: e for e in listing.entries}
+        with self.lock:
+            previous = subscription['snapshot']
+            subscription['snapshot'] = current
+        
+        added = [e for name, e in current.items() if name not in previous]
+        removed = [name for name in previous if name not in current]
+        changed = [e for name, e in current.items() if name in previous and
+                   (e['is_dir'], e['size'], e['mtime']) != (previous[name]['is_dir'], previous[name]['size'], previous[name]['mtime'])]
+        if added or removed or changed:
+            self.socketio.emit('delta', {
+                'path': subscription['path'],
+                'base_path': subscription['base_path'],
+                'added': added,
+                'removed': removed,
+                'changed': changed
+            }, to=room)
+
+    def _run(self):
+        """Flush server-side changes and poll subscribed directories' mtimes"""
+        while True:
+            if self.wakeup.wait(self.POLL_INTERVAL):
+                # Coalesce bursts of changes (e.g. a batch upload) into one delta
+                time.sleep(self.DEBOUNCE)
+                self.wakeup.clear()
             
-            .file-item-content {
-                display: flex;
-                align-items: center;
-                width: 100%;
-            }
-        }
-        
-        .file-item:last-child {
-            border-bottom: none;
-        }
-        
-        .file-icon {
-            width: 32px;
-            height: 32px;
-            background: #f8fafc;
-            border-radius: 6px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            margin-right: 10px;
-            font-size: 16px;
-        }
-        
-        @media (max-width: 768px) {
-            .file-icon {
-                width: 40px;
-                height: 40px;
-                font-size: 20px;
-                margin-right: 12px;
-            }
-        }
-        
-        .file-info {
-            flex: 1;
-        }
-        
-        @media (max-width: 768px) {
-            .file-info {
-                flex: 1;
-                min-width: 0;
-            }
-        }
-        
-        .file-name {
-            font-weight: 500;
-            margin-bottom: 1px;
-            font-size: 14px;
-        }
-        
-        .file-name.clickable {
-            cursor: pointer;
-            color: #3b82f6;
-            text-decoration: underline;
-        }
-        
-        .file-name.clickable:hover {
-            color: #2563eb;
-        }
-        
-        .file-menu-btn {
-            background: none;
-            border: none;
-            padding: 6px;
-            cursor: pointer;
-            border-radius: 4px;
-            font-size: 18px;
-            color: #64748b;
-            transition: background-color 0.2s;
-            min-width: 32px;
-            height: 32px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .file-menu-btn:hover {
-            background: #f1f5f9;
-            color: #374151;
-        }
-        
-        .file-menu-popup {
-            position: absolute;
-            background: white;
-            border: 1px solid #e2e8f0;
-            border-radius: 6px;
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-            padding: 4px 0;
-            z-index: 1000;
-            min-width: 120px;
-            display: none;
-        }
-        
-        .file-menu-popup.show {
-            display: block;
-        }
-        
-        .file-menu-item {
-            display: flex;
-            align-items: center;
-            padding: 8px 12px;
-            cursor: pointer;
-            font-size: 13px;
-            color: #374151;
-            transition: background-color 0.2s;
-        }
-        
-        .file-menu-item:hover {
-            background: #f8fafc;
-        }
-        
-        .file-menu-item.danger {
-            color: #ef4444;
-        }
-        
-        .file-menu-item.danger:hover {
-            background: #fef2f2;
-        }
-        
-        .file-menu-item .icon {
-            margin-right: 8px;
-            font-size: 14px;
-        }
-        
-        .file-details {
-            font-size: 11px;
-            color: #64748b;
-        }
-        
-        .file-actions {
-            display: flex;
-            gap: 6px;
-        }
-        
-        @media (max-width: 768px) {
-            .file-actions {
-                flex-direction: column;
-                gap: 4px;
-                margin-top: 8px;
-            }
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+                subscriptions = list(self.subscriptions.items())
+            for room, subscription in subscriptions:
+                try:
+                    mtime_ns = os.stat(subscription['directory']).st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+                if room in dirty or mtime_ns != subscription['mtime_ns']:
+                    subscription['mtime_ns'] = mtime_ns
+                    try:
+                        self._refresh(room, subscription)
+                    except Exception as e:
+                        print(f"Error sending directory delta: {e}")
+
+class TreeIndex:
+    """In-memory index of the served tree, kept current by a watcher.
+
+    Maps every directory under `root` to {name: entry tuple} (see
+    read_directory_entries), so listings, searches and size queries are
+    answered without touching the filesystem.
+    """
+
+    def __init__(self, root):
+        self.root = str(Path(root))
+        # Generations restart with every index, so validators include this
+        self.instance = uuid.uuid4().hex
+        self.dirs = {}
+        self.dir_mtimes = {}
+        self.generations = {}
+        self.generation = 0
+        self.search = None
+        self.search_parts = {}
+        self.search_order = []
+        self.search_stale = set()
+        # size -> {(directory, name)} of every indexed regular file
+        self.sizes = {}
+        self.dirty = set()
+        self.listeners = []
+        self.watch_directory = None
+        self.store = None
+        self.ready = threading.Event()
+        self.lock = threading.RLock()
+
+    def covers(self, directory):
+        """True once the index is built and holds directory.
+
+        Symlinked directories are not followed, so they fall back to a scan.
+        """
+        return self.ready.is_set() and str(directory) in self.dirs
+
+    def build(self):
+        """Index the whole tree"""
+        self.index_subtree(self.root)
+        self.ready.set()
+
+    def seed(self, dirs, dir_mtimes):
+        """Start from a snapshot saved by a previous run.
+
+        The index is usable at once; directories whose mtime has moved
+        since are re-read before they are served. verify() then brings
+        everything else up to date.
+        """
+        stale = []
+        for directory, mtime_ns in dir_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    stale.append(directory)
+            except OSError:
+                stale.append(directory)
+        with self.lock:
+            for directory, entries in dirs.items():
+                self._set_entries(directory, entries)
+            self.dir_mtimes.update(dir_mtimes)
+            self.dirty.update(stale)
+        self.ready.set()
+
+    def verify(self):
+        """Re-read every seeded directory, picking up anything that
+        changed while the server was down"""
+        for directory in sorted(self.dirs):
+            if directory in self.dirs:
+                with self.lock:
+                    self.dirty.discard(directory)
+                self.rescan_directory(directory)
+
+    def _read(self, directory):
+        if self.watch_directory is not None:
+            # Watch before reading so nothing that changes in between is missed
+            self.watch_directory(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        return read_directory_entries(directory), mtime_ns
+
+    def index_subtree(self, top):
+        """Read top and every real directory below it"""
+        stack = [str(top)]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries, mtime_ns = self._read(directory)
+            except (OSError, PermissionError):
+                continue
+            with self.lock:
+                self._set_entries(directory, entries)
+                self.dir_mtimes[directory] = mtime_ns
+                # refresh_entry edits the indexed dict in place; the writer
+                # thread gets a copy of its own
+                snapshot = dict(entries)
+            if self.store is not None:
+                self.store.put_directory(directory, mtime_ns, snapshot)
+            stack.extend(os.path.join(directory, name) for name, entry in entries.items() if entry[4])
+
+    def _bump(self, directory):
+        self.generations[directory] = self.generations.get(directory, 0) + 1
+        self.generation += 1
+        self.search_stale.add(directory)
+
+    def _add_size(self, directory, name, entry):
+        if entry[1] is not None:
+            self.sizes.setdefault(entry[1], set()).add((directory, name))
+
+    def _forget_size(self, directory, name, entry):
+        if entry[1] is not None:
+            paths = self.sizes.get(entry[1])
+            if paths is not None:
+                paths.discard((directory, name))
+                if not paths:
+                    del self.sizes[entry[1]]
+
+    def _set_entries(self, directory, entries):
+        """Replace a directory's entries (None drops it), updating the
+        size map for just the entries that changed; call with the lock held"""
+        previous = self.dirs.get(directory) or {}
+        current = entries or {}
+        for name, entry in previous.items():
+            if current.get(name) != entry:
+                self._forget_size(directory, name, entry)
+        for name, entry in current.items():
+            if previous.get(name) != entry:
+                self._add_size(directory, name, entry)
+        if entries is None:
+            self.dirs.pop(directory, None)
+        else:
+            self.dirs[directory] = entries
+        self._bump(directory)
+
+    def _set_entry(self, directory, name, entry):
+        """Replace one entry (None removes it); call with the lock held"""
+        entries = self.dirs[directory]
+        previous = entries.pop(name, None)
+        if previous is not None:
+            self._forget_size(directory, name, previous)
+        if entry is not None:
+            entries[name] = entry
+            self._add_size(directory, name, entry)
+        self._bump(directory)
+
+    def _remove_subtree(self, directory):
+        prefix = directory + os.sep
+        with self.lock:
+            for path in [d for d in self.dirs if d == directory or d.startswith(prefix)]:
+                self._set_entries(path, None)
+                self.dir_mtimes.pop(path, None)
+        if self.store is not None:
+            self.store.remove_subtree(directory)
+
+    def _notify(self, directory):
+        for listener in self.listeners:
+            try:
+                listener(directory)
+            except Exception as e:
+                print(f"Error handling index change: {e}")
+
+    def rescan_directory(self, directory):
+        """Re-read one directory, following added and removed subdirectories"""
+        directory = str(directory)
+        try:
+            entries, mtime_ns = self._read(directory)
+        except (OSError, PermissionError):
+            if directory in self.dirs:
+                self._remove_subtree(directory)
+                self._notify(directory)
+            return
+        
+        with self.lock:
+            previous = self.dirs.get(directory, {})
+            self.dir_mtimes[directory] = mtime_ns
+            unchanged = entries == previous
+            if not unchanged:
+                self._set_entries(directory, entries)
+            snapshot = None if unchanged else dict(entries)
+        if self.store is not None:
+            self.store.put_directory(directory, mtime_ns, snapshot)
+        if unchanged:
+            return
+        
+        for name, entry in previous.items():
+            if entry[4] and not (name in entries and entries[name][4]):
+                self._remove_subtree(os.path.join(directory, name))
+        for name, entry in entries.items():
+            if entry[4] and not (name in previous and previous[name][4]):
+                self.index_subtree(os.path.join(directory, name))
+        self._notify(directory)
+
+    def refresh_entry(self, directory, name):
+        """Update a single entry after a watcher event"""
+        with self.lock:
+            entries = self.dirs.get(directory)
+            if entries is None:
+                return
+            previous = entries.get(name)
+        
+        path = os.path.join(directory, name)
+        try:
+            entry = read_directory_entry(path)
+        except (OSError, PermissionError):
+            entry = None
+        if entry == previous:
+            return
+        
+        with self.lock:
+            if self.dirs.get(directory) is not entries:
+                # Replaced by a rescan meanwhile
+                return
+            self._set_entry(directory, name, entry)
+        if self.store is not None:
+            self.store.put_entry(directory, name, entry)
+        if previous is not None and previous[4] and not (entry and entry[4]):
+            self._remove_subtree(path)
+        if entry is not None and entry[4] and not (previous and previous[4]):
+            self.index_subtree(path)
+        self._notify(directory)
+
+    def mark_dirty(self, directory, recursive=False):
+        """The server changed a directory; re-read it before it is next used"""
+        with self.lock:
+            self.dirty.add(str(directory))
+
+    def _clean(self, directory):
+        with self.lock:
+            dirty = directory in self.dirty
+            self.dirty.discard(directory)
+        if dirty:
+            self.rescan_directory(directory)
+
+    def entries(self, directory):
+        """Snapshot of {name: entry tuple} for an indexed directory"""
+        directory = str(directory)
+        self._clean(directory)
+        with self.lock:
+            return dict(self.dirs.get(directory, {}))
+
+    def directory_generation(self, directory):
+        """Changes whenever the indexed contents of directory change"""
+        directory = str(directory)
+        self._clean(directory)
+        with self.lock:
+            return self.generations.get(directory, 0)
+
+    def _clean_all(self):
+        with self.lock:
+            dirty = list(self.dirty)
+        for directory in dirty:
+            self._clean(directory)
+
+    def search_index(self):
+        """FilenameSearch for the current contents; only directories that
+        changed since the last call have their names re-indexed"""
+        self._clean_all()
+        with self.lock:
+            for directory in self.search_stale:
+                entries = self.dirs.get(directory)
+                if entries is None:
+                    if self.search_parts.pop(directory, None) is not None:
+                        del self.search_order[bisect.bisect_left(self.search_order, directory)]
+                    continue
+                if directory not in self.search_parts:
+                    bisect.insort(self.search_order, directory)
+                relative_dir = os.path.relpath(directory, self.root).replace(os.sep, '/')
+                prefix = '' if relative_dir == '.' else relative_dir + '/'
+                self.search_parts[directory] = DirectoryNames(prefix, entries)
+            self.search_stale.clear()
+            if self.search is None or self.search.generation != self.generation:
+                self.search = FilenameSearch([self.search_parts[d] for d in self.search_order], self.generation)
+            return self.search
+
+    def paths_with_size(self, size):
+        """Paths of all indexed regular files of exactly size bytes"""
+        self._clean_all()
+        with self.lock:
+            return sorted(os.path.join(directory, name) for directory, name in self.sizes.get(size, ()))
+
+    def subtree_stats(self, directory):
+        """Total size, file count and directory count below directory"""
+        size = files = dirs = 0
+        stack = [str(directory)]
+        with self.lock:
+            while stack:
+                current = stack.pop()
+                for name, (is_dir, entry_size, _, _, is_real_dir, _) in self.dirs.get(current, {}).items():
+                    if is_dir:
+                        dirs += 1
+                        if is_real_dir:
+                            stack.append(os.path.join(current, name))
+                    else:
+                        files += 1
+                        size += entry_size or 0
+        return size, files, dirs
+
+def glob_to_regex(pattern):
+    """Translate a shell glob into a regex that never crosses a newline.
+
+    Returns (regex source, longest run of literal characters); every name
+    the glob matches contains that literal.
+    """
+    parts = []
+    literals = ['']
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == '*':
+            parts.append('[^\n]*')
+        elif char == '?':
+            parts.append('[^\n]')
+        elif char == '[' and pattern.find(']', i + 1 if pattern[i:i + 1] in ('!', ']') else i) != -1:
+            end = pattern.find(']', i + 1 if pattern[i:i + 1] in ('!', ']') else i)
+            body = pattern[i:end].replace('\\', '\\\\')
+            if body.startswith('!'):
+                body = '^\n' + body[1:]
+            elif body.startswith('^'):
+                body = '\\' + body
+            parts.append(f'[{body}]')
+            i = end + 1
+        else:
+            parts.append(re.escape(char))
+            literals[-1] += char
+            continue
+        literals.append('')
+    return ''.join(parts), max(literals, key=len)
+
+def compile_glob(pattern):
+    """(compiled regex matching whole lines, literal) for a lowercased
+    glob; raises re.error for patterns like [z-a]"""
+    source, literal = glob_to_regex(pattern)
+    return re.compile(f'^(?:{source})$', re.MULTILINE), literal
+
+class DirectoryNames:
+    """Name index of one directory.
+
+    The lowercased names are joined into one newline-separated string so
+    substring and glob queries run as a single str.find / regex scan in
+    C; a sorted copy of the names answers prefix queries with bisect.
+    """
+
+    __slots__ = ('prefix', 'records', 'blob', 'starts', 'sorted_ids', 'sorted_names')
+
+    def __init__(self, prefix, entries):
+        self.prefix = prefix
+        self.records = list(entries.items())
+        names = [name.lower() for name, _ in self.records]
+        self.blob = '\n'.join(names)
+        # starts[i] is where name i begins; the extra item closes the last one
+        self.starts = list(itertools.accumulate((len(name) + 1 for name in names), initial=0))
+        self.sorted_ids = sorted(range(len(names)), key=names.__getitem__)
+        self.sorted_names = [names[i] for i in self.sorted_ids]
+
+    def matches(self, query, mode, glob):
+        """Yield ids of records whose lowercased name matches query, in
+        directory order (prefix mode: as (name, id) in name order)"""
+        if mode == 'prefix':
+            position = bisect.bisect_left(self.sorted_names, query)
+            while position < len(self.sorted_names) and self.sorted_names[position].startswith(query):
+                yield self.sorted_names[position], self.sorted_ids[position]
+                position += 1
+        elif mode == 'glob':
+            regex, literal = glob
+            if literal:
+                # Narrow with a plain find on the literal part, then check
+                # just those names against the full pattern
+                for i in self._substring_ids(literal):
+                    if regex.fullmatch(self.blob, self.starts[i], self.starts[i + 1] - 1):
+                        yield i
+            else:
+                for match in regex.finditer(self.blob):
+                    yield bisect.bisect_right(self.starts, match.start()) - 1
+        else:
+            yield from self._substring_ids(query)
+
+    def _substring_ids(self, query):
+        position = self.blob.find(query)
+        while position != -1:
+            i = bisect.bisect_right(self.starts, position) - 1
+            yield i
+            # One hit per name: continue from the start of the next one
+            position = self.blob.find(query, self.starts[i + 1])
+
+class FilenameSearch:
+    """Immutable name index over one TreeIndex generation: the
+    DirectoryNames of every directory, in path order. TreeIndex reuses
+    the parts of directories that did not change."""
+
+    MODES = ('substring', 'prefix', 'glob')
+
+    def __init__(self, parts, generation):
+        self.parts = parts
+        self.generation = generation
+
+    def matches(self, query, mode, glob=None, scope=''):
+        """Yield (prefix, name, entry) for names matching query in
+        directories whose relative prefix starts with scope, in path
+        order (prefix mode yields them in name order). In glob mode,
+        glob is compile_glob(query), compiled up front by the caller."""
+        query = query.lower()
+        if mode == 'glob' and glob is None:
+            glob = compile_glob(query)
+        parts = [part for part in self.parts if part.prefix.startswith(scope)]
+        if mode == 'prefix':
+            def named(part):
+                for name, i in part.matches(query, mode, glob):
+                    yield name, part, i
+            for _, part, i in heapq.merge(*(named(part) for part in parts), key=lambda match: match[0]):
+                yield (part.prefix,) + part.records[i]
+        else:
+            for part in parts:
+                for i in part.matches(query, mode, glob):
+                    yield (part.prefix,) + part.records[i]
+
+class InotifyWatcher:
+    """Linux inotify watcher that feeds single-entry updates to a TreeIndex"""
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+                  IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, index):
+        self.index = index
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        self.lock = threading.Lock()
+
+    def watch(self, directory):
+        """Add a watch; raises OSError (e.g. ENOSPC) when the limit is hit"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            errno_value = ctypes.get_errno()
+            raise OSError(errno_value, f"inotify_add_watch failed for {directory}: {os.strerror(errno_value)}")
+        with self.lock:
+            self.watches[wd] = directory
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                data = os.read(self.fd, 256 * 1024)
+            except InterruptedError:
+                continue
+            changed = set()
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + self.EVENT_HEADER.size:offset + self.EVENT_HEADER.size + length]
+                offset += self.EVENT_HEADER.size + length
+                name = os.fsdecode(name.rstrip(b'\0'))
+                
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were lost; fall back to a full comparison
+                    changed.add(('*', None))
+                    continue
+                with self.lock:
+                    directory = self.watches.get(wd)
+                    if mask & self.IN_IGNORED:
+                        self.watches.pop(wd, None)
+                if directory is None or mask & self.IN_IGNORED:
+                    continue
+                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    changed.add((os.path.dirname(directory), os.path.basename(directory)))
+                elif name:
+                    changed.add((directory, name))
             
-            .file-actions button {
-                padding: 8px 12px;
-                font-size: 13px;
-                min-width: 90px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 4px;
-            }
-        }
-        
-        .action-btn {
-            background: #f8fafc;
-            border: 1px solid #e2e8f0;
-            padding: 4px 8px;
-            border-radius: 4px;
-            font-size: 11px;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        
-        .action-btn.danger {
-            background: #ef4444;
-            color: white;
-            border-color: #ef4444;
-        }
-        
-        .action-btn:hover {
-            background: #f1f5f9;
-        }
-        
-        .action-btn.danger:hover {
-            background: #dc2626;
-        }
-        
-        .file-checkbox {
-            margin-right: 8px;
-            transform: scale(1.1);
-        }
-        
-        @media (max-width: 768px) {
-            .file-checkbox {
-                transform: scale(1.3);
-                margin-right: 12px;
-            }
-        }
-        
-        .file-item.selected {
-            background: #eff6ff;
-            border-radius: 6px;
-        }
-        
-        .bulk-actions {
-            display: none;
-            background: #f8fafc;
-            padding: 12px;
-            border-radius: 6px;
-            margin-bottom: 12px;
-            border: 1px solid #e2e8f0;
-        }
-        
-        .bulk-actions.show {
-            display: block;
-        }
-        
-        .bulk-actions-content {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        
-        .bulk-actions-left {
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .bulk-actions-right {
-            display: flex;
-            gap: 8px;
-        }
-        
-        .select-all-btn {
-            background: #6c757d;
-            color: white;
-            border: none;
-            padding: 6px 12px;
-            border-radius: 6px;
-            font-size: 12px;
-            cursor: pointer;
-        }
-        
-        .bulk-delete-btn {
-            background: #dc3545;
-            color: white;
-            border: none;
-            padding: 6px 12px;
-            border-radius: 6px;
-            font-size: 12px;
-            cursor: pointer;
-        }
-        
-        .bulk-download-btn {
-            background: #28a745;
-            color: white;
-            border: none;
-            padding: 6px 12px;
-            border-radius: 6px;
-            font-size: 12px;
-            cursor: pointer;
-        }
-        
-        .empty-state {
-            text-align: center;
-            padding: 40px 20px;
-            color: #8e8e93;
-        }
-        
-        .empty-state p {
-            margin-bottom: 10px;
-        }
-        
-        .status {
-            text-align: center;
-            padding: 10px;
-            margin-bottom: 20px;
-            border-radius: 8px;
-            font-size: 14px;
-        }
-        
-        .status.success {
-            background: #d4edda;
-            color: #155724;
-        }
-        
-        .status.error {
-            background: #f8d7da;
-            color: #721c24;
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>📱 Android File Transfer</h1>
-        <p>Upload files from your phone to your Mac</p>
-    </div>
+            for directory, name in changed:
+                try:
+                    if directory == '*':
+                        for path in list(self.index.dirs):
+                            self.index.rescan_directory(path)
+                    else:
+                        self.index.refresh_entry(directory, name)
+                except Exception as e:
+                    print(f"Error applying filesystem event: {e}")
+
+class PollingWatcher:
+    """Fallback watcher: re-reads directories whose mtime moved"""
+
+    INTERVAL = 2.0
+
+    def __init__(self, index):
+        self.index = index
+
+    def watch(self, directory):
+        pass
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.INTERVAL)
+            for directory in list(self.index.dirs):
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+                if mtime_ns != self.index.dir_mtimes.get(directory):
+                    try:
+                        self.index.rescan_directory(directory)
+                    except Exception as e:
+                        print(f"Error rescanning {directory}: {e}")
+
+def start_tree_index(index):
+    """Build the index in the background and keep it current with
+    inotify on Linux, or polling elsewhere (or if inotify runs out of
+    watches). With a metadata store, the last run's snapshot is served
+    while the tree is re-checked."""
+    def scan():
+        if index.ready.is_set():
+            index.verify()
+        else:
+            index.build()
     
-    <div class="container">
-        <div id="status"></div>
-        
-        <div class="upload-section">
-            <h3>Upload Files</h3>
-            
-            <div class="directory-selector">
-                <div class="directory-header">
-                    <div class="directory-title">📁 Target Directory</div>
-                </div>
-                <div class="directory-path" id="currentUploadPath">~/Downloads</div>
-                <div class="directory-actions">
-                    <button class="dir-btn primary" onclick="selectUploadDirectory()">📂 Choose Directory</button>
-                    <button class="dir-btn" onclick="resetUploadDirectory()">🏠 Reset to Default</button>
+    def run():
+        if index.store is not None:
+            try:
+                dirs, dir_mtimes = index.store.load_tree(index.root)
+            except sqlite3.Error as e:
+                print(f"Error loading saved index: {e}")
+                dirs = {}
+            if index.root in dirs:
+                index.seed(dirs, dir_mtimes)
+        
+        watcher = None
+        if sys.platform.startswith('linux'):
+            try:
+                watcher = InotifyWatcher(index)
+                watcher.start()
+                index.watch_directory = watcher.watch
+                scan()
+            except OSError as e:
+                print(f"inotify unavailable ({e}); polling for changes instead")
+                if watcher is not None:
+                    os.close(watcher.fd)
+                watcher = None
+                index.watch_directory = None
+        if watcher is None:
+            scan()
+            PollingWatcher(index).start()
+        print(f"📇 Indexed {len(index.dirs)} directories under {index.root}")
     
-                </div>
-            </div>
-            
-            <input type="file" id="fileInput" class="file-input" multiple>
-            <button class="upload-btn" onclick="document.getElementById('fileInput').click()">
-                📁 Choose Files to Upload
-            </button>
-            <div class="progress" id="progress" style="display: none;">
-                <div class="progress-bar" id="progressBar"></div>
-            </div>
-            <div id="uploadStatus" style="display: none; margin-top: 10px; padding: 10px; background: #f8f9fa; border-radius: 4px; text-align: center;">
-                <span id="uploadStatusText"></span>
-                <button id="resumeUploadBtn" onclick="resumeUploads()" style="display: none; margin-left: 10px; padding: 5px 10px; background: #007bff; color: white; border: none; border-radius: 4px; cursor: pointer;">Resume</button>
-                <button id="cancelUploadBtn" onclick="cancelUploads()" style="display: none; margin-left: 10px; padding: 5px 10px; background: #dc3545; color: white; border: none; border-radius: 4px; cursor: pointer;">Cancel</button>
-            </div>
-        </div>
-        
-        <div class="files-section">
-            <div class="files-header">
-                <div class="files-header-left">
-                    <div class="files-title">Files on Mac</div>
-                    <button class="create-folder-btn" onclick="createFolderInCurrentDirectory()">📁 Create Folder</button>
-                </div>
-                <button class="refresh-btn" onclick="loadFiles()">🔄 Refresh</button>
-            </div>
-            
-            <div class="bulk-actions" id="bulkActions">
-                <div class="bulk-actions-content">
-                    <div class="bulk-actions-left">
-                        <span id="selectedCount">0 files selected</span>
-                        <button class="select-all-btn" onclick="toggleSelectAll()">Select All</button>
-                    </div>
-                    <div class="bulk-actions-right">
-                        <button class="bulk-download-btn" onclick="downloadSelected()">⬇️ Download Selected</button>
-                        <button class="bulk-delete-btn" onclick="deleteSelected()">🗑️ Delete Selected</button>
-                    </div>
-                </div>
-            </div>
-            
-            <div id="fileList"></div>
-        </div>
-    </div>
-
-    <script>
-        let currentPath = '';
-        let selectedFiles = new Set();
-        let allFiles = [];
-        let uploadDirectory = '~/Downloads';
-        let baseUploadDirectory = '~/Downloads';
-        
-        // Load files on page load
-        document.addEventListener('DOMContentLoaded', function() {
-            loadFiles();
-            updateUploadPathDisplay();
-            resumeUploads(); // Check for interrupted uploads
-        });
-        
-        // File upload handling
-        document.getElementById('fileInput').addEventListener('change', function(e) {
-            const files = e.target.files;
-            if (files.length > 0) {
-                uploadFiles(files);
-            }
-        });
-        
-        // Store upload state for resumability
-        let uploadState = {
-            files: [],
-            currentIndex: 0,
-            successCount: 0,
-            failCount: 0,
-            isUploading: false
-        };
-        
-        async function uploadFiles(files) {
-            const progress = document.getElementById('progress');
-            const progressBar = document.getElementById('progressBar');
-            
-            // Initialize upload state
-            uploadState.files = Array.from(files);
-            uploadState.currentIndex = 0;
-            uploadState.successCount = 0;
-            uploadState.failCount = 0;
-            uploadState.isUploading = true;
-            
-            progress.style.display = 'block';
-            progressBar.style.width = '0%';
-            showUploadStatus(`📤 Starting upload of ${files.length} files...`, false, true);
-            
-            // Store state in localStorage for recovery
-            localStorage.setItem('uploadState', JSON.stringify(uploadState));
-            
-            await processUploadQueue();
-        }
-        
-        async function processUploadQueue() {
-            const progress = document.getElementById('progress');
-            const progressBar = document.getElementById('progressBar');
-            
-            while (uploadState.currentIndex < uploadState.files.length && uploadState.isUploading) {
-                const file = uploadState.files[uploadState.currentIndex];
-                const formData = new FormData();
-                formData.append('file', file);
-                formData.append('upload_directory', uploadDirectory);
-                
-                try {
-                    const response = await fetch('/api/upload', {
-                        method: 'POST',
-                        body: formData
-                    });
-                    
-                    if (response.ok) {
-                        uploadState.successCount++;
-                        showStatus(`✅ Uploaded ${uploadState.currentIndex + 1}/${uploadState.files.length}: ${file.name}`, 'success');
-                    } else {
-                        uploadState.failCount++;
-                        showStatus(`❌ Failed ${uploadState.currentIndex + 1}/${uploadState.files.length}: ${file.name}`, 'error');
-                    }
-                } catch (error) {
-                    uploadState.failCount++;
-                    showStatus(`❌ Error ${uploadState.currentIndex + 1}/${uploadState.files.length}: ${file.name}`, 'error');
-                }
-                
-                uploadState.currentIndex++;
-                
-                // Update progress
-                const progressPercent = (uploadState.currentIndex / uploadState.files.length) * 100;
-                progressBar.style.width = progressPercent + '%';
-                
-                // Update stored state
-                localStorage.setItem('uploadState', JSON.stringify(uploadState));
-                
-                // Small delay to prevent overwhelming the server
-                if (uploadState.currentIndex < uploadState.files.length) {
-                    await new Promise(resolve => setTimeout(resolve, 100));
-                }
-            }
-            
-            // Check if upload completed
-            if (uploadState.currentIndex >= uploadState.files.length) {
-                // Show final summary
-                if (uploadState.successCount > 0 && uploadState.failCount === 0) {
-                    showStatus(`🎉 All ${uploadState.successCount} files uploaded successfully!`, 'success');
-                } else if (uploadState.successCount > 0 && uploadState.failCount > 0) {
-                    showStatus(`⚠️ ${uploadState.successCount} uploaded, ${uploadState.failCount} failed`, 'error');
-                } else {
-                    showStatus(`❌ All ${uploadState.failCount} uploads failed`, 'error');
-                }
-                
-                // Clear state
-                uploadState.isUploading = false;
-                localStorage.removeItem('uploadState');
-                
-                // Hide progress after a delay
-                setTimeout(() => {
-                    progress.style.display = 'none';
-                }, 5000);
-                
-                // Refresh file list
-                loadFiles();
-            }
-        }
-        
-        // Resume uploads on page load
-        function resumeUploads() {
-            const storedState = localStorage.getItem('uploadState');
-            if (storedState) {
-                try {
-                    const state = JSON.parse(storedState);
-                    if (state.isUploading && state.currentIndex < state.files.length) {
-                        uploadState = state;
-                        showStatus(`🔄 Resuming upload: ${state.currentIndex}/${state.files.length} files`, 'success');
-                        processUploadQueue();
-                    }
-                } catch (error) {
-                    localStorage.removeItem('uploadState');
-                }
-            }
-        }
-        
-        // Pause uploads when page becomes hidden
-        document.addEventListener('visibilitychange', function() {
-            if (document.hidden && uploadState.isUploading) {
-                showUploadStatus(`⏸️ Upload paused (screen locked). Unlock to resume.`, true);
-            } else if (!document.hidden && uploadState.isUploading) {
-                showUploadStatus(`▶️ Upload resumed`, false);
-            }
-        });
-        
-        function showUploadStatus(message, showResume = false, showCancel = false) {
-            const statusDiv = document.getElementById('uploadStatus');
-            const statusText = document.getElementById('uploadStatusText');
-            const resumeBtn = document.getElementById('resumeUploadBtn');
-            const cancelBtn = document.getElementById('cancelUploadBtn');
-            
-            statusText.textContent = message;
-            statusDiv.style.display = 'block';
-            resumeBtn.style.display = showResume ? 'inline-block' : 'none';
-            cancelBtn.style.display = showCancel ? 'inline-block' : 'none';
-            
-            if (!showResume && !showCancel) {
-                setTimeout(() => {
-                    statusDiv.style.display = 'none';
-                }, 3000);
-            }
-        }
-        
-        function cancelUploads() {
-            uploadState.isUploading = false;
-            localStorage.removeItem('uploadState');
-            showUploadStatus('❌ Upload cancelled', false, false);
-            document.getElementById('progress').style.display = 'none';
-        }
-        
-        async function loadFiles() {
-            try {
-                const response = await fetch('/api/files?path=' + encodeURIComponent(currentPath) + '&base_path=' + encodeURIComponent(baseUploadDirectory));
-                const files = await response.json();
-                allFiles = files;
-                selectedFiles.clear();
-                
-                // Add ".." entry at the top if we're in a subdirectory
-                if (currentPath && currentPath.trim() !== '') {
-                    const parentPath = currentPath.split('/').slice(0, -1).join('/');
-                    const parentEntry = {
-                        name: '..',
-                        path: parentPath,
-                        is_dir: true,
-                        size: null,
-                        date: 'Parent directory'
-                    };
-                    allFiles.unshift(parentEntry);
-                }
-                
-                displayFiles(allFiles);
-                updateBulkActions();
-            } catch (error) {
-                showStatus('Error loading files', 'error');
-            }
-        }
-        
-        function displayFiles(files) {
-            const fileList = document.getElementById('fileList');
-            
-            if (files.length === 0) {
-                fileList.innerHTML = `
-                    <div class="empty-state">
-                        <p>📁 No files found</p>
-                        <p>Upload some files from your phone to get started</p>
-                    </div>
-                `;
-                return;
-            }
-            
-            let html = '<ul class="file-list">';
-            
-            files.forEach(file => {
-                const isParentDir = file.name === '..';
-                const icon = isParentDir ? '⬆️' : (file.is_dir ? '📁' : getFileIcon(file.name));
-                const size = file.size ? formatFileSize(file.size) : '';
-                const isSelected = selectedFiles.has(file.path);
-                const selectedClass = isSelected ? 'selected' : '';
-                
-                const safeId = file.path.replace(/[^a-zA-Z0-9]/g, '_');
-                
-                html += `
-                    <li class="file-item ${selectedClass}">
-                        <div class="file-item-content">
-                            ${!isParentDir ? `<input type="checkbox" class="file-checkbox" ${isSelected ? 'checked' : ''} 
-                                   onchange="toggleFileSelection('${file.path}')">` : ''}
-                            <div class="file-icon">${icon}</div>
-                            <div class="file-info">
-                                <div class="file-name ${file.is_dir ? 'clickable' : ''}" 
-                                     ${file.is_dir ? `onclick="navigateTo('${file.path}')"` : ''}>${file.name}</div>
-                                <div class="file-details">${size} • ${file.date}</div>
-                            </div>
-                            ${!isParentDir ? `<div style="position: relative;">
-                                <button class="file-menu-btn" onclick="showFileMenu('${file.path}', ${file.is_dir}, event)">⋯</button>
-                                <div class="file-menu-popup" id="menu-${safeId}">
-                                    ${file.is_dir ? 
-                                        `<div class="file-menu-item" onclick="navigateTo('${file.path}')">
-                                            <span class="icon">📂</span>Open
-                                        </div>` :
-                                        `<div class="file-menu-item" onclick="downloadFile('${file.path}')">
-                                            <span class="icon">⬇️</span>Download
-                                        </div>`
-                                    }
-                                    <div class="file-menu-item danger" onclick="deleteFile('${file.path}')">
-                                        <span class="icon">🗑️</span>Delete
-                                    </div>
-                                </div>
-                            </div>` : ''}
-                        </div>
-                    </li>
-                `;
-            });
-            
-            html += '</ul>';
-            fileList.innerHTML = html;
-        }
-        
-        function getFileIcon(fileName) {
-            const ext = fileName.split('.').pop()?.toLowerCase();
-            const icons = {
-                'jpg': '🖼️', 'jpeg': '🖼️', 'png': '🖼️', 'gif': '🖼️',
-                'mp4': '🎥', 'avi': '🎥', 'mov': '🎥',
-                'mp3': '🎵', 'wav': '🎵', 'flac': '🎵',
-                'pdf': '📄', 'doc': '📄', 'docx': '📄',
-                'zip': '📦', 'rar': '📦', '7z': '📦'
-            };
-            return icons[ext] || '📄';
-        }
-        
-        function formatFileSize(bytes) {
-            if (!bytes) return '';
-            const sizes = ['B', 'KB', 'MB', 'GB'];
-            const i = Math.floor(Math.log(bytes) / Math.log(1024));
-            return Math.round(bytes / Math.pow(1024, i) * 100) / 100 + ' ' + sizes[i];
-        }
-        
-        async function navigateTo(path) {
-            currentPath = path;
-            loadFiles();
-            
-            // Update upload directory to match the current directory
-            uploadDirectory = baseUploadDirectory + (path ? '/' + path : '');
-            updateUploadPathDisplay();
-            
-            showStatus(`Upload directory updated to: ${path || 'Downloads folder'}`, 'success');
-        }
-        
-        async function downloadFile(path) {
-            try {
-                const response = await fetch('/api/download?path=' + encodeURIComponent(path));
-                if (response.ok) {
-                    const blob = await response.blob();
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.href = url;
-                    a.download = path.split('/').pop();
-                    a.click();
-                    window.URL.revokeObjectURL(url);
-                }
-            } catch (error) {
-                showStatus('Error downloading file', 'error');
-            }
-        }
-        
-        async function deleteFile(path) {
-            if (!confirm('Are you sure you want to delete this file?')) return;
-            
-            try {
-                const response = await fetch('/api/delete', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ path: path })
-                });
-                
-                if (response.ok) {
-                    showStatus('File deleted successfully', 'success');
-                    loadFiles();
-                } else {
-                    showStatus('Failed to delete file', 'error');
-                }
-            } catch (error) {
-                showStatus('Error deleting file', 'error');
-            }
-        }
-        
-        function showStatus(message, type) {
-            const status = document.getElementById('status');
-            status.innerHTML = `<div class="status ${type}">${message}</div>`;
-            setTimeout(() => {
-                status.innerHTML = '';
-            }, 3000);
-        }
-        
-        function toggleFileSelection(filePath) {
-            if (selectedFiles.has(filePath)) {
-                selectedFiles.delete(filePath);
-            } else {
-                selectedFiles.add(filePath);
-            }
-            updateBulkActions();
-            displayFiles(allFiles); // Refresh display to show selection state
-        }
-        
-        function updateBulkActions() {
-            const bulkActions = document.getElementById('bulkActions');
-            const selectedCount = document.getElementById('selectedCount');
-            
-            if (selectedFiles.size > 0) {
-                bulkActions.classList.add('show');
-                selectedCount.textContent = `${selectedFiles.size} file${selectedFiles.size === 1 ? '' : 's'} selected`;
-            } else {
-                bulkActions.classList.remove('show');
-            }
-        }
-        
-        function toggleSelectAll() {
-            const allSelected = selectedFiles.size === allFiles.length;
-            
-            if (allSelected) {
-                selectedFiles.clear();
-            } else {
-                allFiles.forEach(file => {
-                    selectedFiles.add(file.path);
-                });
-            }
-            
-            updateBulkActions();
-            displayFiles(allFiles);
-        }
-        
-        async function downloadSelected() {
-            if (selectedFiles.size === 0) return;
-            
-            // Filter out directories (can't download directories)
-            const filesToDownload = Array.from(selectedFiles).filter(filePath => {
-                const file = allFiles.find(f => f.path === filePath);
-                return file && !file.is_dir;
-            });
-            
-            if (filesToDownload.length === 0) {
-                showStatus('No files selected for download (directories cannot be downloaded)', 'error');
-                return;
-            }
-            
-            if (filesToDownload.length !== selectedFiles.size) {
-                showStatus(`Downloading ${filesToDownload.length} files (directories skipped)`, 'success');
-            }
-            
-            // Download files one by one
-            for (const filePath of filesToDownload) {
-                try {
-                    const response = await fetch('/api/download?path=' + encodeURIComponent(filePath));
-                    if (response.ok) {
-                        const blob = await response.blob();
-                        const url = window.URL.createObjectURL(blob);
-                        const a = document.createElement('a');
-                        a.href = url;
-                        a.download = filePath.split('/').pop();
-                        a.click();
-                        window.URL.revokeObjectURL(url);
-                        
-                        // Small delay between downloads to avoid overwhelming the browser
-                        await new Promise(resolve => setTimeout(resolve, 100));
-                    } else {
-                        showStatus(`Failed to download: ${filePath.split('/').pop()}`, 'error');
-                    }
-                } catch (error) {
-                    showStatus(`Error downloading: ${filePath.split('/').pop()}`, 'error');
-                }
-            }
-            
-            showStatus(`Downloaded ${filesToDownload.length} file${filesToDownload.length === 1 ? '' : 's'}`, 'success');
-        }
-        
-        async function deleteSelected() {
-            if (selectedFiles.size === 0) return;
-            
-            const fileCount = selectedFiles.size;
-            if (!confirm(`Are you sure you want to delete ${fileCount} file${fileCount === 1 ? '' : 's'}?`)) {
-                return;
-            }
-            
-            let successCount = 0;
-            let failCount = 0;
-            
-            for (const filePath of selectedFiles) {
-                try {
-                    const response = await fetch('/api/delete', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({ path: filePath })
-                    });
-                    
-                    if (response.ok) {
-                        successCount++;
-                    } else {
-                        failCount++;
-                    }
-                } catch (error) {
-                    failCount++;
-                }
-            }
-            
-            if (successCount > 0) {
-                showStatus(`Successfully deleted ${successCount} file${successCount === 1 ? '' : 's'}`, 'success');
-            }
-            if (failCount > 0) {
-                showStatus(`Failed to delete ${failCount} file${failCount === 1 ? '' : 's'}`, 'error');
-            }
-            
-            selectedFiles.clear();
-            loadFiles();
-        }
-        
-        function updateUploadPathDisplay() {
-            document.getElementById('currentUploadPath').textContent = uploadDirectory;
-        }
-        
-        async function selectUploadDirectory() {
-            const newPath = prompt('Enter the full path to the directory where you want to save files:', uploadDirectory);
-            if (newPath && newPath.trim() !== '') {
-                // Validate the path by trying to list it
-                try {
-                    const response = await fetch(`/api/validate-directory?path=${encodeURIComponent(newPath.trim())}`);
-                    if (response.ok) {
-                        baseUploadDirectory = newPath.trim();
-                        uploadDirectory = baseUploadDirectory + (currentPath ? '/' + currentPath : '');
-                        updateUploadPathDisplay();
-                        showStatus('Upload directory updated successfully', 'success');
-                    } else {
-                        showStatus('Invalid directory path. Please check the path and try again.', 'error');
-                    }
-                } catch (error) {
-                    showStatus('Error validating directory path', 'error');
-                }
-            }
-        }
-        
-        function resetUploadDirectory() {
-            uploadDirectory = '~/Downloads';
-            baseUploadDirectory = '~/Downloads';
-            updateUploadPathDisplay();
-            showStatus('Upload directory reset to default', 'success');
-        }
-        
+    threading.Thread(target=run, daemon=True).start()
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)
 
-        
-        async function createFolderInCurrentDirectory() {
-            const folderName = prompt('Enter the name for the new folder:', '');
-            if (folderName && folderName.trim() !== '') {
-                try {
-                    // Create folder in the current directory being viewed
-                    const currentDir = baseUploadDirectory + (currentPath ? '/' + currentPath : '');
-                    const response = await fetch('/api/create-folder', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({ 
-                            path: currentDir,
-                            folder_name: folderName.trim()
-                        })
-                    });
-                    
-                    if (response.ok) {
-                        showStatus(`Folder "${folderName}" created successfully`, 'success');
-                        loadFiles(); // Refresh the file list to show the new folder
-                    } else {
-                        showStatus('Failed to create folder', 'error');
-                    }
-                } catch (error) {
-                    showStatus('Error creating folder', 'error');
-                }
-            }
-        }
-        
+def render_thumbnail(source, dest, size, fmt):
+    """Write a size x size-bounded thumbnail of source to dest.
 
+    Runs in a worker process, so it must stay importable at module level.
+    """
+    with Image.open(source) as image:
+        image.draft('RGB', (size, size))      # lets JPEG decode at reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if fmt == 'webp' and 'A' in image.getbands():
+            image = image.convert('RGBA')
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        tmp_path = f"{dest}.{os.getpid()}.tmp"
+        image.save(tmp_path, 'WEBP' if fmt == 'webp' else 'JPEG', quality=80)
+    os.replace(tmp_path, dest)
+    return os.path.getsize(dest)
+
+class ThumbnailCache:
+    """Content-addressed thumbnail store with size-bounded LRU eviction.
+
+    Thumbnails are named after the source's SHA-256, so duplicates and
+    renamed files share them and an edited file gets a new one. Renders
+    happen in a process pool, one per key even if requested repeatedly.
+    The directory may be shared by several gunicorn workers, so the size
+    limit is checked against what is on disk, re-read at most every
+    RESCAN_INTERVAL seconds.
+    """
+
+    RESCAN_INTERVAL = 10.0
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.entries = None             # name -> size, oldest first
+        self.total = 0
+        self.loaded_at = 0.0
+        self.pending = {}
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        # Rebuild the LRU order from mtimes, which hits refresh
+        found = []
+        for directory in self.cache_dir.glob('??'):
+            for path in directory.glob('*.*'):
+                if path.suffix == '.tmp':
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path.name, st.st_size))
+        found.sort()
+        self.entries = OrderedDict((name, size) for _, name, size in found)
+        self.total = sum(size for _, _, size in found)
+        self.loaded_at = time.monotonic()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / key
+
+    def get(self, source, key, size, fmt):
+        """Path of the thumbnail for key, rendering it first if needed"""
+        path = self._path(key)
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            try:
+                # Another worker may have rendered it since the last scan
+                cached_size = path.stat().st_size
+            except OSError:
+                cached_size = None
+            if cached_size is not None:
+                if key not in self.entries:
+                    self.entries[key] = cached_size
+                    self.total += cached_size
+                self.entries.move_to_end(key)
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+            future = self.pending.get(key)
+            if future is None:
+                if self.pool is None:
+                    # Created on first use so gunicorn workers get their own
+                    self.pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+                path.parent.mkdir(parents=True, exist_ok=True)
+                future = self.pending[key] = self.pool.submit(render_thumbnail, str(source), str(path), size, fmt)
         
-        function showFileMenu(filePath, isDirectory, event) {
-            // Create a safe ID from the file path
-            const safeId = filePath.replace(/[^a-zA-Z0-9]/g, '_');
-            const menuId = `menu-${safeId}`;
-            
-            // Hide all other menus first
-            const allMenus = document.querySelectorAll('.file-menu-popup');
-            allMenus.forEach(menu => {
-                if (menu.id !== menuId) {
-                    menu.classList.remove('show');
-                }
-            });
-            
-            // Toggle the current menu
-            const menu = document.getElementById(menuId);
-            if (menu) {
-                const isVisible = menu.classList.contains('show');
-                
-                if (isVisible) {
-                    menu.classList.remove('show');
-                } else {
-                    menu.classList.add('show');
-                    
-                    // Position the menu relative to the button
-                    const button = event.target;
-                    const rect = button.getBoundingClientRect();
-                    const menuRect = menu.getBoundingClientRect();
-                    
-                    // Position below the button, aligned to the right
-                    menu.style.top = '100%';
-                    menu.style.right = '0';
-                    menu.style.left = 'auto';
-                }
-            }
-        }
-        
-        // Close menus when clicking outside
-        document.addEventListener('click', function(event) {
-            if (!event.target.closest('.file-menu-btn') && !event.target.closest('.file-menu-popup')) {
-                const allMenus = document.querySelectorAll('.file-menu-popup');
-                allMenus.forEach(menu => {
-                    menu.classList.remove('show');
-                });
-            }
-        });
-    </script>
-</body>
-</html>
-"""
+        try:
+            written = future.result(timeout=60)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        
+        with self.lock:
+            if time.monotonic() - self.loaded_at >= self.RESCAN_INTERVAL:
+                # Pick up what other workers added and removed
+                self._load()
+            if key not in self.entries:
+                self.entries[key] = written
+                self.total += written
+            self.entries.move_to_end(key)
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total -= old_size
+                try:
+                    self._path(old_key).unlink()
+                except FileNotFoundError:
+                    pass
+        return path
+
+file_manager = WebFileManager()
+upload_sessions = UploadSessionManager(CONFIG_DIR / 'upload_sessions')
+upload_sessions.load_sessions()
+metadata_store = MetadataStore(CONFIG_DIR / 'metadata.db')
+file_types = FileTypeDetector()
+thumbnail_cache = ThumbnailCache(CONFIG_DIR / 'thumbnails')
+content_hashes = ContentHashIndex(metadata_store)
+change_notifier = DirectoryChangeNotifier(socketio, file_manager)
+file_manager.change_listeners.append(change_notifier.directory_changed)
+
+background_services_lock = threading.Lock()
+background_services_started = False
+
+def ensure_background_services():
+    """Start the tree index and its watcher in the serving process.
+
+    Started on first request rather than at import so that gunicorn
+    workers, which fork after import, each get live threads.
+    """
+    global background_services_started
+    if background_services_started:
+        return
+    with background_services_lock:
+        if background_services_started:
+            return
+        background_services_started = True
+        index = TreeIndex(Path(file_manager.base_path))
+        index.listeners.append(lambda directory: change_notifier.directory_changed(Path(directory)))
+        file_manager.change_listeners.append(index.mark_dirty)
+        index.store = metadata_store
+        file_manager.tree_index = index
+        start_tree_index(index)
+
+# The web interface lives in backend/static and is bundled at startup
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+
+def minify_css(source):
+    """Drop comments and the whitespace CSS doesn't need"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,])\s*', r'\1', source)
+    return source.replace(': ', ':').replace(';}', '}').strip()
+
+def minify_lines(source, comment=None):
+    """Strip indentation, blank lines and whole-line comments. Cautious
+    on purpose: it never looks inside a line, so strings stay intact."""
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not (comment and line.startswith(comment)))
+
+class StaticBundle:
+    """Front-end assets, minified and compressed once at startup.
+
+    CSS and JS get content-hashed names served with year-long immutable
+    caching, and index.html is rewritten to point at them. Each asset is
+    kept as identity, gzip and (with the brotli package) br bytes, so a
+    request only picks one of them.
+    """
+
+    CONTENT_TYPES = {
+        '.html': 'text/html; charset=utf-8',
+        '.css': 'text/css; charset=utf-8',
+        '.js': 'application/javascript; charset=utf-8'
+    }
+
+    def __init__(self, static_dir):
+        self.assets = {}
+        index_html = (static_dir / 'index.html').read_text(encoding='utf-8')
+        for path in sorted(static_dir.iterdir()):
+            if path.suffix == '.css':
+                body = minify_css(path.read_text(encoding='utf-8'))
+            elif path.suffix == '.js':
+                body = minify_lines(path.read_text(encoding='utf-8'), comment='//')
+            else:
+                continue
+            body = body.encode('utf-8')
+            hashed_name = f"{path.stem}.{hashlib.sha256(body).hexdigest()[:12]}{path.suffix}"
+            self._add(hashed_name, path.suffix, body, immutable=True)
+            index_html = index_html.replace(f'"/static/{path.name}"', f'"/static/{hashed_name}"')
+        self._add('index.html', '.html', minify_lines(index_html).encode('utf-8'), immutable=False)
+
+    def _add(self, name, suffix, body, immutable):
+        variants = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(body, quality=11)
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self.assets[name] = (self.CONTENT_TYPES[suffix], etag, variants, immutable)
+
+    def response(self, name):
+        """Response for one asset in the best encoding the client accepts,
+        or None if there is no such asset"""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        content_type, etag, variants, immutable = asset
+        
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in variants and request.accept_encodings[candidate] > 0:
+                encoding = candidate
+                break
+        if encoding != 'identity':
+            # Each encoding is a different representation
+            etag = f"{etag}-{encoding}"
+        headers = {
+            'ETag': f'"{etag}"',
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': 'public, max-age=31536000, immutable' if immutable else 'no-cache'
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(variants[encoding], content_type=content_type, headers=headers)
+
+static_bundle = StaticBundle(STATIC_DIR)
+
+@app.before_request
+def start_background_services():
+    """Make sure the index and watcher are running in this process"""
+    ensure_background_services()
+
+def matching_etag(etag):
+    """The tag in If-None-Match that names etag in any content coding,
+    or None. compress_response suffixes ETags with the coding used."""
+    for candidate in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if candidate in request.if_none_match:
+            return candidate
+    return None
+
+def conditional_response(etag, build, cache_control='no-cache', last_modified=None):
+    """Answer 304 when the client's copy matches etag, otherwise build()
+    the response and tag it. With etag None the body's hash is used."""
+    headers = {'Cache-Control': cache_control}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    if etag is not None and matching_etag(etag):
+        headers['ETag'] = f'"{matching_etag(etag)}"'
+        return Response(status=304, headers=headers)
+    
+    response = app.make_response(build())
+    if response.status_code != 200:
+        return response
+    if etag is None:
+        etag = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+        if matching_etag(etag):
+            headers['ETag'] = f'"{matching_etag(etag)}"'
+            return Response(status=304, headers=headers)
+    response.set_etag(etag)
+    response.headers.update(headers)
+    return response
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+
+def compress_stream(chunks, encoding, level):
+    """Compress a streamed body chunk by chunk. Each chunk is flushed so
+    the client can act on it straight away; producers should yield in
+    batches rather than per line to keep the ratio."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli encode JSON responses the client can accept.
+    Downloads (direct passthrough) are left alone so ranges keep working."""
+    if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_TYPES
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or request.method == 'HEAD'):
+        return response
+    if brotli is not None and request.accept_encodings['br'] > 0:
+        encoding, level = 'br', app.config.get('BROTLI_QUALITY', 5)
+    elif request.accept_encodings['gzip'] > 0:
+        encoding, level = 'gzip', app.config.get('COMPRESS_LEVEL', 6)
+    else:
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < app.config.get('COMPRESS_MIN_SIZE', 1024):
+            response.vary.add('Accept-Encoding')
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=level))
+        else:
+            response.set_data(gzip.compress(body, level, mtime=0))
+    
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag:
+        # Each coding is a different representation
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
 
 @app.route('/')
 def index():
     """Serve the main web interface"""
-    return render_template_string(HTML_TEMPLATE)
+    return static_bundle.response('index.html')
+
+@app.route('/static/<name>')
+def static_asset(name):
+    """Serve a bundled front-end asset"""
+    response = static_bundle.response(name)
+    if response is None:
+        return jsonify({'error': 'Not found'}), 404
+    return response
+
+LISTING_COLUMNS = ('name', 'is_dir', 'size', 'date', 'mtime', 'permissions')
+
+def columnar_listing(entries):
+    """Listing entries as parallel arrays, which repeat no keys and
+    compress far better than an array of objects"""
+    columns = {column: [entry[column] for entry in entries] for column in LISTING_COLUMNS}
+    columns['is_dir'] = [int(is_dir) for is_dir in columns['is_dir']]
+    # Every entry shares the directory's prefix
+    prefix = entries[0]['path'][:-len(entries[0]['name'])] if entries else ''
+    return {'columns': columns, 'prefix': prefix}
 
 @app.route('/api/files', methods=['GET'])
 def list_files():
-    """List files in the transfer directory"""
+    """List files in the transfer directory.
+
+    With `limit` or `cursor` the response is one page:
+    {entries, next_cursor, total}. `sort` (name/size/mtime) and `order`
+    (asc/desc) pick the order; directories always come first.
+    `format=columnar` replaces the entries with {columns, prefix}: one
+    array per field, and paths left as prefix + name.
+    """
     path = request.args.get('path', '')
     base_path = request.args.get('base_path', file_manager.base_path)
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    listing_format = request.args.get('format', 'entries')
+    
+    if sort not in SortedListing.SORT_KEYS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort or order'}), 400
+    if listing_format not in ('entries', 'columnar'):
+        return jsonify({'error': 'Invalid format'}), 400
     
     # Handle ~ expansion for relative paths
     if path and path.startswith('~/'):
@@ -1371,61 +2380,815 @@ def list_files():
     if base_path and base_path.startswith('~/'):
         base_path = str(Path(base_path).expanduser())
     
-    files = file_manager.list_files(path, base_path)
-    return jsonify(files)
+    if 'limit' in request.args and (limit is None or not 0 < limit <= 5000):
+        return jsonify({'error': 'Limit must be between 1 and 5000'}), 400
+    paged = limit is not None or cursor is not None
+    if paged and limit is None:
+        limit = 500
+    listing = file_manager.list_files(path, base_path)
+    
+    # The validator is the directory mtime or index generation, so an
+    # unchanged listing is answered without serializing it
+    etag = None
+    last_modified = None
+    if listing.validator is not None:
+        etag = hashlib.blake2b(repr((listing.validator, sort, order, limit, cursor,
+                                     listing_format)).encode(),
+                               digest_size=16).hexdigest()
+        version = listing.validator[2]
+        if isinstance(version, int):
+            last_modified = version // 1_000_000_000
+    
+    def build():
+        if not paged:
+            if listing_format == 'columnar':
+                return jsonify(columnar_listing(listing.ordered(sort, order)[0]))
+            return jsonify(listing.ordered(sort, order)[0])
+        try:
+            entries, next_cursor = listing.page(sort, order, limit, cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if listing_format == 'columnar':
+            page = columnar_listing(entries)
+        else:
+            page = {'entries': entries}
+        page['next_cursor'] = next_cursor
+        page['total'] = len(listing.entries)
+        return jsonify(page)
+    
+    return conditional_response(etag, build, last_modified=last_modified)
+
+def request_body_stream(limit=None):
+    """request.stream, inflated if the client sent it gzip or deflate
+    encoded. limit (default MAX_CONTENT_LENGTH) also caps the inflated size."""
+    encoding = request.headers.get('Content-Encoding', 'identity').strip().lower()
+    if encoding in ('', 'identity'):
+        return request.stream
+    if encoding not in ('gzip', 'deflate'):
+        raise ValueError(f'Unsupported Content-Encoding: {encoding}')
+    return InflatingReader(request.stream, encoding, limit or app.config.get('MAX_CONTENT_LENGTH'))
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Handle file upload from phone"""
+    """Handle file upload from phone; the body may be gzip or deflate
+    encoded (Content-Encoding)"""
     try:
-        if 'file' not in request.files:
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        # Stream the body straight to disk instead of letting Werkzeug
+        # spool the whole part to a temp file first
+        upload_directory = request.args.get('upload_directory', file_manager.base_path)
+        dest_path, filename, fields = receive_streaming_upload(
+            request_body_stream(), boundary.encode('latin-1'), upload_directory)
+        
+        if dest_path is None:
+            if filename == '':
+                return jsonify({'error': 'No file selected'}), 400
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['file']
-        upload_directory = request.form.get('upload_directory', file_manager.base_path)
+        # The file is already in place, so bad details are dropped rather than failing the upload
+        try:
+            original = parse_original({name[len('original_'):]: value for name, value in fields.items()
+                                       if name.startswith('original_')})
+        except ValueError as e:
+            print(f"Error recording original of {dest_path}: {e}")
+            original = None
+        apply_client_mtime(dest_path, parse_mtime(fields.get('mtime')))
+        if original is not None:
+            metadata_store.put_original(str(dest_path), os.stat(dest_path), original)
+        
+        print(f"File uploaded to: {dest_path}")
+        return jsonify({'success': True, 'filename': filename, 'path': str(dest_path)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except HTTPException as e:
+        # e.g. 413 from --max-request-size
+        return jsonify({'error': e.description}), e.code
+    except Exception as e:
+        print(f"Error uploading file: {e}")
+        return jsonify({'error': 'Upload failed'}), 500
+
+def parse_original(values):
+    """Validate the {width, height, size, sha256} an optimized image
+    upload sends about its original; None when it sent nothing"""
+    if not values:
+        return None
+    try:
+        original = {key: int(values[key]) for key in ('width', 'height', 'size')}
+        sha256 = str(values['sha256']).lower()
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invalid original image details')
+    if min(original.values()) < 0 or len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        raise ValueError('Invalid original image details')
+    original['sha256'] = sha256
+    return original
+
+def parse_mtime(value):
+    """A client file's modification time in seconds, or None if it sent
+    none (or nonsense)"""
+    try:
+        mtime = float(value)
+    except (TypeError, ValueError):
+        return None
+    return mtime if math.isfinite(mtime) and mtime > 0 else None
+
+def apply_client_mtime(path, mtime):
+    """Give an uploaded file the modification time it has on the phone,
+    so folder syncs can tell it is unchanged"""
+    if mtime is None:
+        return
+    os.utime(path, (time.time(), mtime))
+    file_manager.invalidate(Path(path).parent)
+
+@app.route('/api/upload/signature', methods=['GET'])
+def upload_signature():
+    """Block checksums of an existing destination file, for delta uploads.
+
+    Returns {basis, size, block_size, weak, strong}; basis names this
+    version of the file and must be passed back to /api/upload/delta.
+    """
+    try:
+        filename = Path(request.args.get('filename') or '').name
+        upload_directory = request.args.get('upload_directory') or file_manager.base_path
+        if not filename:
+            return jsonify({'error': 'No file selected'}), 400
+        
+        # Handle ~ expansion for upload directory
+        if upload_directory.startswith('~/'):
+            upload_directory = str(Path(upload_directory).expanduser())
+        dest_path = Path(upload_directory) / filename
+        if not dest_path.is_file():
+            return jsonify({'error': 'File not found'}), 404
+        
+        st = dest_path.stat()
+        block_size, weak, strong = delta_signature(dest_path)
+        return jsonify({
+            'basis': file_etag(st),
+            'size': st.st_size,
+            'block_size': block_size,
+            'weak': weak,
+            'strong': strong
+        })
+    except Exception as e:
+        print(f"Error computing signature: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/upload/delta', methods=['POST'])
+def upload_delta():
+    """Update an existing file from a delta against its current version.
+
+    Query: filename, upload_directory, basis (from /api/upload/signature),
+    size and sha256 of the new content, and optionally its mtime. The body (optionally gzip or
+    deflate encoded) holds the ops described in apply_delta. Answers 409
+    if the file changed since the signature was taken.
+    """
+    try:
+        filename = Path(request.args.get('filename') or '').name
+        upload_directory = request.args.get('upload_directory') or file_manager.base_path
+        size = request.args.get('size', type=int)
+        sha256 = (request.args.get('sha256') or '').lower()
+        if not filename:
+            return jsonify({'error': 'No file selected'}), 400
+        if size is None or size < 0 or len(sha256) != 64:
+            return jsonify({'error': 'Size and sha256 required'}), 400
+        
+        # Handle ~ expansion for upload directory
+        if upload_directory.startswith('~/'):
+            upload_directory = str(Path(upload_directory).expanduser())
+        dest_path = Path(upload_directory) / filename
+        try:
+            st = dest_path.stat()
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found'}), 404
+        if request.args.get('basis') != file_etag(st):
+            return jsonify({'error': 'File changed since the signature was taken'}), 409
+        
+        copied, literal = apply_delta(request_body_stream(), dest_path, size, sha256)
+        file_manager.invalidate(dest_path.parent)
+        apply_client_mtime(dest_path, parse_mtime(request.args.get('mtime')))
+        metadata_store.put_hash(str(dest_path), os.stat(dest_path), sha256)
+        
+        print(f"File updated by delta: {dest_path} ({literal} new bytes, {copied} reused)")
+        return jsonify({'success': True, 'filename': filename, 'path': str(dest_path),
+                        'copied': copied, 'literal': literal})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except HTTPException as e:
+        return jsonify({'error': e.description}), e.code
+    except Exception as e:
+        print(f"Error applying delta: {e}")
+        return jsonify({'error': 'Upload failed'}), 500
+
+def upload_session_status(session):
+    """Public view of an upload session"""
+    return {
+        'session_id': session['id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'chunk_size': session['chunk_size'],
+        'received': session['received'],
+        'next_offset': upload_sessions.next_offset(session)
+    }
+
+@app.route('/api/upload/check', methods=['POST'])
+def check_upload():
+    """Skip an upload whose content the server already has.
+
+    Takes {filename, size, sha256, upload_directory, mtime}. If the
+    destination already holds that content, or an optimized copy made
+    from it, the answer is 'present'. If an identical
+    file exists elsewhere in the served tree it is hard-linked (or
+    copied) into place and the answer is 'linked' or 'copied'. Otherwise
+    the answer is 'missing' and the client uploads as usual.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = Path(data.get('filename') or '').name
+        size = data.get('size')
+        sha256 = (data.get('sha256') or '').lower()
+        upload_directory = data.get('upload_directory') or file_manager.base_path
         
-        if file.filename == '':
+        if not filename:
             return jsonify({'error': 'No file selected'}), 400
+        if not isinstance(size, int) or size < 0:
+            return jsonify({'error': 'Invalid file size'}), 400
+        if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+            return jsonify({'error': 'Invalid sha256'}), 400
         
         # Handle ~ expansion for upload directory
         if upload_directory.startswith('~/'):
             upload_directory = str(Path(upload_directory).expanduser())
+        dest_path = Path(upload_directory) / filename
         
-        # Create destination path - upload_directory already contains the full path
-        dest_path = Path(upload_directory) / file.filename
+        present = content_hashes.find(size, sha256, [dest_path])
+        if not present:
+            for path in metadata_store.paths_with_original(sha256):
+                path = Path(path)
+                try:
+                    original = metadata_store.original(path, path.stat())
+                except OSError:
+                    continue
+                if path.parent == dest_path.parent and original and original['size'] == size:
+                    present = path
+                    break
+        source = None
+        if not present:
+            candidates = []
+            index = file_manager.tree_index
+            if index is not None and index.ready.is_set():
+                candidates = [p for p in index.paths_with_size(size)
+                              if not (os.path.basename(p).startswith('.') and p.endswith('.part'))]
+            source = content_hashes.find(size, sha256, candidates)
+        
+        mtime = parse_mtime(data.get('mtime'))
+        if present:
+            # Hard links share their mtime with the other names, so one
+            # that disagrees with the phone is split off into its own copy
+            st = os.stat(present)
+            if st.st_nlink > 1 and mtime is not None and \
+                    abs(st.st_mtime - mtime) > SYNC_MTIME_TOLERANCE:
+                place_duplicate(present, present, link=False)
+            if os.stat(present).st_nlink == 1:
+                apply_client_mtime(present, mtime)
+            return jsonify({'status': 'present', 'path': str(present)})
+        if source is None:
+            return jsonify({'status': 'missing'})
+        
+        # A link can only carry the phone's mtime if the source already has it
+        link = mtime is None or abs(source.stat().st_mtime - mtime) <= SYNC_MTIME_TOLERANCE
         dest_path.parent.mkdir(parents=True, exist_ok=True)
+        method = place_duplicate(source, dest_path, link)
+        file_manager.invalidate(dest_path.parent)
+        if method == 'copied':
+            apply_client_mtime(dest_path, mtime)
+        return jsonify({'status': method, 'path': str(dest_path), 'source': str(source)})
+    except Exception as e:
+        print(f"Error checking upload: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/upload/session', methods=['POST'])
+def create_upload_session():
+    """Start (or resume) a chunked upload"""
+    try:
+        data = request.json or {}
+        upload_directory = data.get('upload_directory') or file_manager.base_path
         
-        # Save the file
-        file.save(str(dest_path))
+        # Handle ~ expansion for upload directory
+        if upload_directory.startswith('~/'):
+            upload_directory = str(Path(upload_directory).expanduser())
+        
+        session = upload_sessions.create_session(
+            data.get('filename'), data.get('size'), upload_directory,
+            fingerprint=data.get('fingerprint'), original=parse_original(data.get('original')),
+            mtime=parse_mtime(data.get('mtime')), max_chunk_size=app.config.get('MAX_CONTENT_LENGTH'))
+        return jsonify(upload_session_status(session))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error creating upload session: {e}")
+        return jsonify({'error': 'Failed to create upload session'}), 500
+
+@app.route('/api/upload/session/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Report which byte ranges the server already has"""
+    session = upload_sessions.get_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    return jsonify(upload_session_status(session))
+
+@app.route('/api/upload/session/<session_id>', methods=['PUT'])
+def upload_chunk(session_id):
+    """Receive one chunk of a chunked upload at ?offset=, optionally
+    gzip or deflate encoded"""
+    try:
+        session = upload_sessions.get_session(session_id)
+        if session is None:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        offset = request.args.get('offset', type=int)
+        if offset is None or request.content_length is None:
+            return jsonify({'error': 'Offset and Content-Length required'}), 400
+        
+        stream = request_body_stream()
+        length = request.content_length
+        if stream is not request.stream:
+            # Inflated chunks are as long as the session layout says
+            length = min(session['chunk_size'], session['size'] - offset)
+        upload_sessions.write_chunk(session, offset, stream, length)
+        return jsonify(upload_session_status(session))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except HTTPException as e:
+        return jsonify({'error': e.description}), e.code
+    except Exception as e:
+        print(f"Error writing upload chunk: {e}")
+        return jsonify({'error': 'Chunk upload failed'}), 500
+
+@app.route('/api/upload/session/<session_id>/finalize', methods=['POST'])
+def finalize_upload_session(session_id):
+    """Move a completed chunked upload into its destination"""
+    try:
+        session = upload_sessions.get_session(session_id)
+        if session is None:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        dest_path = upload_sessions.finalize(session)
+        if session.get('original'):
+            metadata_store.put_original(str(dest_path), os.stat(dest_path), session['original'])
         
         print(f"File uploaded to: {dest_path}")
-        return jsonify({'success': True, 'filename': file.filename, 'path': str(dest_path)})
+        return jsonify({'success': True, 'filename': dest_path.name, 'path': str(dest_path)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
-        print(f"Error uploading file: {e}")
+        print(f"Error finalizing upload: {e}")
         return jsonify({'error': 'Upload failed'}), 500
 
+@app.route('/api/upload/session/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    """Cancel a chunked upload and discard its partial data"""
+    session = upload_sessions.get_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    upload_sessions.abort(session)
+    return jsonify({'success': True})
+
+# Phones, FAT cards and HFS+ keep mtimes to a second or two
+SYNC_MTIME_TOLERANCE = 2.0
+# Inflated manifest size; about 300,000 files
+SYNC_MANIFEST_LIMIT = 32 * 1024 * 1024
+
+def parse_sync_manifest(files):
+    """Validate a sync manifest; returns a list of
+    (path parts, size, mtime, sha256 or None)"""
+    if not isinstance(files, list):
+        raise ValueError('files must be a list')
+    manifest = []
+    for item in files:
+        try:
+            path = item['path']
+            size = item['size']
+            mtime = parse_mtime(item.get('mtime'))
+            sha256 = (item.get('sha256') or '').lower() or None
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError('Invalid manifest entry')
+        parts = path.split('/') if isinstance(path, str) else []
+        if not parts or any(part in ('', '.', '..') or os.sep in part or '\0' in part for part in parts):
+            raise ValueError(f'Invalid path in manifest: {path!r}')
+        if not isinstance(size, int) or size < 0:
+            raise ValueError(f'Invalid size for {path}')
+        if sha256 is not None and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+            raise ValueError(f'Invalid sha256 for {path}')
+        manifest.append((parts, size, mtime, sha256))
+    return manifest
+
+def optimized_copies(directory, entries):
+    """{(stem, original size): mtime} for the optimized uploads in a
+    directory that are still as they were recorded"""
+    copies = {}
+    for name, (size, mtime, inode, original_size) in metadata_store.originals_in(directory).items():
+        entry = entries.get(name)
+        if entry is not None and (entry[1], entry[2], entry[5]) == (size, mtime, inode):
+            copies[(os.path.splitext(name)[0].lower(), original_size)] = mtime
+    return copies
+
+def diff_sync_manifest(root, manifest):
+    """Compare a parsed manifest with the tree under root.
+
+    Each directory is read once, from the tree index when it covers it.
+    A file is unchanged if the server has one of the same size and mtime
+    (or the same hash, when the client sent one), or an optimized copy
+    made from it. Returns (upload, conflicts, unchanged): upload is a
+    list of (path, reason) with reason 'new', 'changed' or 'modified'
+    (same size, different mtime, no hash to settle it); conflicts are
+    paths the server holds as directories.
+    """
+    by_directory = {}
+    for parts, size, mtime, sha256 in manifest:
+        by_directory.setdefault(tuple(parts[:-1]), []).append((parts[-1], size, mtime, sha256))
+    
+    index = file_manager.tree_index
+    upload, conflicts, unchanged = [], [], 0
+    for parts, items in by_directory.items():
+        directory = os.path.join(root, *parts)
+        if index is not None and index.covers(directory):
+            entries = index.entries(directory)
+        else:
+            try:
+                entries = read_directory_entries(directory)
+            except (OSError, PermissionError):
+                entries = {}
+        copies = None
+        
+        for name, size, mtime, sha256 in items:
+            path = '/'.join(parts + (name,))
+            entry = entries.get(name)
+            same_time = entry is not None and mtime is not None and \
+                abs(entry[2] - mtime) <= SYNC_MTIME_TOLERANCE
+            if entry is None:
+                reason = 'new'
+            elif entry[0]:
+                conflicts.append(path)
+                continue
+            elif entry[1] != size:
+                reason = 'changed'
+            elif same_time:
+                unchanged += 1
+                continue
+            elif sha256 is not None:
+                try:
+                    same_content = content_hashes.hash_file(os.path.join(directory, name)) == sha256
+                except OSError:
+                    same_content = False
+                if same_content:
+                    unchanged += 1
+                    continue
+                reason = 'changed'
+            else:
+                reason = 'modified'
+            
+            if reason != 'modified' and mtime is not None:
+                # Photos the phone downscaled are stored smaller, maybe
+                # under another extension
+                if copies is None:
+                    copies = optimized_copies(directory, entries)
+                copy_mtime = copies.get((os.path.splitext(name)[0].lower(), size))
+                if copy_mtime is not None and abs(copy_mtime - mtime) <= SYNC_MTIME_TOLERANCE:
+                    unchanged += 1
+                    continue
+            upload.append((path, reason))
+    return upload, conflicts, unchanged
+
+@app.route('/api/sync/diff', methods=['POST'])
+def sync_diff():
+    """Work out which files of a phone folder the server lacks.
+
+    Takes {upload_directory, files: [{path, size, mtime, sha256}]}, paths
+    relative to upload_directory with '/' separators and sha256 optional;
+    the body may be gzip or deflate encoded, and inflated may be at most
+    SYNC_MANIFEST_LIMIT (or MAX_CONTENT_LENGTH, if smaller) bytes.
+    Returns {upload: [{path, reason}], conflicts, unchanged, total}; only
+    the files in upload need sending.
+    """
+    try:
+        limit = min(SYNC_MANIFEST_LIMIT, app.config.get('MAX_CONTENT_LENGTH') or SYNC_MANIFEST_LIMIT)
+        stream = request_body_stream(limit)
+        body = bytearray()
+        while True:
+            data = stream.read(256 * 1024)
+            if not data:
+                break
+            body += data
+            if len(body) > limit:
+                raise RequestEntityTooLarge('Manifest too large')
+        data = json.loads(body or b'{}')
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid manifest'}), 400
+        upload_directory = data.get('upload_directory') or file_manager.base_path
+        manifest = parse_sync_manifest(data.get('files', []))
+        
+        # Handle ~ expansion for upload directory
+        if upload_directory.startswith('~/'):
+            upload_directory = str(Path(upload_directory).expanduser())
+        
+        upload, conflicts, unchanged = diff_sync_manifest(upload_directory, manifest)
+        return jsonify({
+            'upload': [{'path': path, 'reason': reason} for path, reason in upload],
+            'conflicts': conflicts,
+            'unchanged': unchanged,
+            'total': len(manifest)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except HTTPException as e:
+        return jsonify({'error': e.description}), e.code
+    except Exception as e:
+        print(f"Error comparing sync manifest: {e}")
+        return jsonify({'error': 'Sync comparison failed'}), 500
+
+def file_etag(stat):
+    """Strong validator that changes whenever the file's bytes may have"""
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def content_disposition(filename):
+    """Attachment header that survives non-ASCII file names"""
+    try:
+        filename.encode('ascii')
+        escaped = filename.replace('\\', '\\\\').replace('"', '\\"')
+        return f'attachment; filename="{escaped}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{quote(filename, safe='')}"
+
+class MmapRangeIterator:
+    """Iterate a byte range of a file through an mmap, for servers that
+    don't offer a sendfile-capable wsgi.file_wrapper"""
+
+    def __init__(self, f, start, length, buffer_size=1024 * 1024):
+        self.file = f
+        self.start = start
+        self.end = start + length
+        self.buffer_size = buffer_size
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if length else None
+
+    def __iter__(self):
+        position = self.start
+        while position < self.end:
+            stop = min(position + self.buffer_size, self.end)
+            yield self.map[position:stop]
+            position = stop
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+def file_range_body(full_path, start, length):
+    """Response body for a byte range of a file.
+
+    Under gunicorn, wsgi.file_wrapper hands the open file to os.sendfile,
+    so the kernel copies it to the socket and Content-Length bounds the
+    range. Otherwise fall back to mmap-backed chunks.
+    """
+    f = open(full_path, 'rb')
+    try:
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and app.config.get('USE_SENDFILE', True):
+            f.seek(start)
+            return file_wrapper(f, 1024 * 1024)
+        return MmapRangeIterator(f, start, length)
+    except Exception:
+        f.close()
+        raise
+
+def send_file_ranged(full_path):
+    """Serve a file with strong ETags and Range/If-Range support so
+    interrupted downloads can resume instead of restarting"""
+    stat = full_path.stat()
+    size = stat.st_size
+    etag = file_etag(stat)
+    headers = {
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(int(stat.st_mtime)),
+        'Cache-Control': 'no-cache',
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': content_disposition(full_path.name)
+    }
+    
+    if request.if_none_match:
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+    elif request.if_modified_since is not None and \
+            int(stat.st_mtime) <= request.if_modified_since.timestamp():
+        return Response(status=304, headers=headers)
+    
+    start, end, status = 0, size, 200
+    byte_range = request.range
+    if byte_range is not None and len(byte_range.ranges) == 1:
+        # If-Range: only honour the range if the client's copy is still current
+        if_range_header = request.headers.get('If-Range')
+        if if_range_header is None:
+            range_valid = True
+        elif request.if_range.etag is not None:
+            range_valid = not if_range_header.startswith('W/') and request.if_range.etag == etag
+        else:
+            range_valid = request.if_range.date is not None and \
+                int(request.if_range.date.timestamp()) == int(stat.st_mtime)
+        
+        if range_valid:
+            satisfiable = byte_range.range_for_length(size)
+            if satisfiable is None:
+                headers['Content-Range'] = f'bytes */{size}'
+                return Response(status=416, headers=headers)
+            start, end = satisfiable
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    
+    headers['Content-Length'] = str(end - start)
+    mimetype = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+    return Response(file_range_body(full_path, start, end - start), status=status,
+                    headers=headers, mimetype=mimetype, direct_passthrough=True)
+
 @app.route('/api/download', methods=['GET'])
 def download_file():
     """Download a file to the phone"""
     try:
         path = request.args.get('path')
+        base_path = request.args.get('base_path', file_manager.base_path)
         if not path:
             return jsonify({'error': 'Path required'}), 400
         
         # Handle ~ expansion for relative paths
+        if base_path.startswith('~/'):
+            base_path = str(Path(base_path).expanduser())
         if path.startswith('~/'):
             full_path = Path(path).expanduser()
         else:
-            full_path = Path(file_manager.base_path) / path
+            full_path = Path(base_path) / path
         
-        if not full_path.exists():
+        if not full_path.is_file():
             return jsonify({'error': 'File not found'}), 404
         
-        return send_from_directory(full_path.parent, full_path.name)
+        return send_file_ranged(full_path)
     except Exception as e:
         print(f"Error downloading file: {e}")
         return jsonify({'error': 'Download failed'}), 500
 
+# Already-compressed formats are stored as-is; deflating them wastes CPU
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif',
+    '.mp4', '.mov', '.avi', '.mkv', '.webm', '.3gp',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.apk', '.jar', '.docx', '.xlsx', '.pptx', '.epub'
+}
+
+class ArchiveStream(io.RawIOBase):
+    """Write-only sink that collects archive bytes for a streaming response"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def iter_zip_archive(entries, buffer_size=1024 * 1024):
+    """Stream a ZIP64 archive without building it on disk first"""
+    sink = ArchiveStream()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for full_path, arcname, is_dir in entries:
+            try:
+                info = zipfile.ZipInfo.from_file(full_path, arcname, strict_timestamps=False)
+                if is_dir:
+                    archive.writestr(info, b'')
+                else:
+                    stored = full_path.suffix.lower() in STORED_EXTENSIONS
+                    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                    with open(full_path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as dest:
+                        while True:
+                            data = source.read(buffer_size)
+                            if not data:
+                                break
+                            dest.write(data)
+                            yield sink.drain()
+            except OSError as e:
+                print(f"Skipping {full_path} in archive: {e}")
+            yield sink.drain()
+    yield sink.drain()
+
+def iter_tar_archive(entries, buffer_size=1024 * 1024):
+    """Stream an uncompressed PAX tar archive"""
+    for full_path, arcname, is_dir in entries:
+        try:
+            stat = full_path.stat()
+            info = tarfile.TarInfo(arcname)
+            info.mtime = int(stat.st_mtime)
+            info.mode = stat.st_mode & 0o7777
+            if is_dir:
+                info.type = tarfile.DIRTYPE
+                yield info.tobuf(tarfile.PAX_FORMAT)
+                continue
+            
+            info.size = stat.st_size
+            with open(full_path, 'rb') as source:
+                yield info.tobuf(tarfile.PAX_FORMAT)
+                remaining = info.size
+                while remaining > 0:
+                    data = source.read(min(buffer_size, remaining))
+                    if not data:
+                        # File shrank while streaming; pad to the size in the header
+                        data = b'\0' * remaining
+                    remaining -= len(data)
+                    yield data
+            if info.size % tarfile.BLOCKSIZE:
+                yield b'\0' * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+        except OSError as e:
+            print(f"Skipping {full_path} in archive: {e}")
+    yield b'\0' * (tarfile.BLOCKSIZE * 2)
+
+@app.route('/api/archive', methods=['GET', 'POST'])
+def download_archive():
+    """Stream selected files and folders as one ZIP or tar download"""
+    try:
+        data = request.get_json(silent=True) or {}
+        paths = data.get('paths') or request.values.getlist('path')
+        base_path = data.get('base_path') or request.values.get('base_path', file_manager.base_path)
+        archive_format = data.get('format') or request.values.get('format', 'zip')
+        
+        if not paths:
+            return jsonify({'error': 'Path required'}), 400
+        if archive_format not in ('zip', 'tar'):
+            return jsonify({'error': 'Format must be zip or tar'}), 400
+        
+        # Handle ~ expansion for base path
+        if base_path.startswith('~/'):
+            base_path = str(Path(base_path).expanduser())
+        
+        entries = file_manager.iter_archive_entries(paths, base_path)
+        if archive_format == 'tar':
+            body = iter_tar_archive(entries)
+        else:
+            body = iter_zip_archive(entries)
+        
+        name = Path(paths[0]).name if len(paths) == 1 else 'files'
+        return Response(body, mimetype='application/zip' if archive_format == 'zip' else 'application/x-tar',
+                        headers={'Content-Disposition': content_disposition(f"{name or 'files'}.{archive_format}")})
+    except Exception as e:
+        print(f"Error creating archive: {e}")
+        return jsonify({'error': 'Archive failed'}), 500
+
+@app.route('/api/thumbnail', methods=['GET'])
+def thumbnail():
+    """Small JPEG (or WebP, if accepted) preview of an image.
+
+    With a `v` parameter (the file's mtime, as the UI sends) the URL
+    names one version of the file and is cached for a year.
+    """
+    if Image is None:
+        return jsonify({'error': 'Thumbnails need Pillow (pip install Pillow)'}), 501
+    
+    path = request.args.get('path', '')
+    base_path = request.args.get('base_path', file_manager.base_path)
+    requested = request.args.get('size', 128, type=int)
+    
+    # Handle ~ expansion for base path
+    if base_path.startswith('~/'):
+        base_path = str(Path(base_path).expanduser())
+    
+    full_path = Path(base_path) / path
+    if not path or not full_path.is_file():
+        return jsonify({'error': 'File not found'}), 404
+    
+    try:
+        if not file_types.detect(str(full_path))[0].startswith('image/'):
+            return jsonify({'error': 'Not an image'}), 415
+        size = min((s for s in THUMBNAIL_SIZES if s >= requested), default=THUMBNAIL_SIZES[-1])
+        fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+        key = f"{content_hashes.hash_file(full_path)}-{size}.{fmt}"
+        
+        headers = {
+            'ETag': f'"{key}"',
+            'Vary': 'Accept',
+            'Cache-Control': 'public, max-age=31536000, immutable' if request.args.get('v') else 'no-cache'
+        }
+        if key in request.if_none_match:
+            return Response(status=304, headers=headers)
+        thumb_path = thumbnail_cache.get(full_path, key, size, fmt)
+        return Response(thumb_path.read_bytes(), mimetype=f'image/{fmt}', headers=headers)
+    except Exception as e:
+        print(f"Error making thumbnail: {e}")
+        return jsonify({'error': 'Cannot make a thumbnail of this file'}), 415
+
 @app.route('/api/delete', methods=['POST'])
 def delete_file():
     """Delete a file"""
@@ -1511,6 +3274,7 @@ def create_folder():
             return jsonify({'error': 'Folder already exists'}), 409
         
         new_folder_path.mkdir(parents=True, exist_ok=True)
+        file_manager.invalidate(new_folder_path.parent)
         
         return jsonify({'success': True, 'path': str(new_folder_path)})
     except Exception as e:
@@ -1521,19 +3285,281 @@ def create_folder():
 def get_info():
     """Get server information"""
     local_ip = file_manager.get_local_ip()
-    return jsonify({
+    port = app.config.get('PORT', 5001)
+    return conditional_response(None, lambda: jsonify({
         'ip': local_ip,
-        'port': 5001,
-        'url': f'http://{local_ip}:5001'
-    })
+        'port': port,
+        'url': f'http://{local_ip}:{port}'
+    }))
+
+def iter_search_results(query, mode, full_path, actual_base, limit, glob=None):
+    """Yield NDJSON lines for names under full_path matching query
+    (glob: the compile_glob of query in glob mode)"""
+    index = file_manager.tree_index
+    relative_dir = full_path.relative_to(actual_base).as_posix()
+    scope = '' if relative_dir == '.' else relative_dir + '/'
+    count = 0
+    # Set only when a match beyond the limit exists; it is not sent
+    truncated = False
+    
+    def result(prefix, name, entry):
+        is_dir, size, mtime = entry[:3]
+        return json.dumps({
+            'name': name,
+            'path': prefix + name,
+            'is_dir': is_dir,
+            'size': size,
+            'date': time.strftime('%b %d %H:%M', time.localtime(mtime)),
+            'mtime': mtime
+        }) + '\n'
+    
+    if index is not None and index.covers(full_path) and index.covers(actual_base):
+        search = index.search_index()
+        root_relative = os.path.relpath(actual_base, index.root).replace(os.sep, '/')
+        root_prefix = '' if root_relative == '.' else root_relative + '/'
+        scope = root_prefix + scope
+        batch = []
+        for prefix, name, entry in search.matches(query, mode, glob, scope):
+            if count >= limit:
+                truncated = True
+                break
+            batch.append(result(prefix[len(root_prefix):], name, entry))
+            count += 1
+            if len(batch) >= 256:
+                # Yield in batches so each compressed flush carries many lines
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+    else:
+        # Outside the index: walk the tree, streaming matches as found
+        query = query.lower()
+        if mode == 'glob':
+            regex = (glob or compile_glob(query))[0]
+            match = lambda name: regex.fullmatch(name) is not None
+        elif mode == 'prefix':
+            match = lambda name: name.startswith(query)
+        else:
+            match = lambda name: query in name
+        for root, dirnames, filenames in os.walk(full_path):
+            relative_root = Path(root).relative_to(actual_base).as_posix()
+            prefix = '' if relative_root == '.' else relative_root + '/'
+            batch = []
+            for name in dirnames + filenames:
+                if not match(name.lower()):
+                    continue
+                try:
+                    entry = read_directory_entry(os.path.join(root, name))
+                except OSError:
+                    continue
+                if count >= limit:
+                    truncated = True
+                    break
+                batch.append(result(prefix, name, entry))
+                count += 1
+            if batch:
+                yield ''.join(batch)
+            if truncated:
+                break
+    
+    yield json.dumps({'done': True, 'count': count, 'truncated': truncated}) + '\n'
+
+@app.route('/api/search', methods=['GET'])
+def search_files():
+    """Recursive filename search below a directory.
+
+    Streams newline-delimited JSON, one entry per match, then a final
+    {done, count, truncated} line. `mode` is substring, prefix or glob.
+    """
+    query = request.args.get('q', '')
+    mode = request.args.get('mode', 'substring')
+    path = request.args.get('path', '')
+    base_path = request.args.get('base_path', file_manager.base_path)
+    limit = request.args.get('limit', 1000, type=int)
+    
+    if not query or '\n' in query:
+        return jsonify({'error': 'Query required'}), 400
+    if mode not in FilenameSearch.MODES:
+        return jsonify({'error': 'Invalid search mode'}), 400
+    if not 0 < limit <= 10000:
+        return jsonify({'error': 'Limit must be between 1 and 10000'}), 400
+    
+    # Handle ~ expansion for base path
+    if base_path.startswith('~/'):
+        base_path = str(Path(base_path).expanduser())
+    
+    actual_base = Path(base_path)
+    full_path = actual_base / path if path else actual_base
+    if not full_path.is_dir():
+        return jsonify({'error': 'Directory not found'}), 404
+    
+    # Compile before streaming: once the 200 is out an error can't be reported
+    glob = None
+    if mode == 'glob':
+        try:
+            glob = compile_glob(query.lower())
+        except re.error as e:
+            return jsonify({'error': f'Invalid pattern: {e}'}), 400
+    
+    return Response(iter_search_results(query, mode, full_path, actual_base, limit, glob),
+                    mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-store'})
+
+@app.route('/api/file-info', methods=['GET'])
+def file_info():
+    """Type, MIME type, size and (when known) content hash of one file"""
+    path = request.args.get('path', '')
+    base_path = request.args.get('base_path', file_manager.base_path)
+    
+    # Handle ~ expansion for base path
+    if base_path.startswith('~/'):
+        base_path = str(Path(base_path).expanduser())
+    
+    info = file_manager.get_file_info(path, base_path)
+    if info is None:
+        return jsonify({'error': 'File not found'}), 404
+    return jsonify(info)
+
+@app.route('/api/file-types', methods=['GET'])
+def directory_file_types():
+    """MIME type and description of every entry in a directory"""
+    path = request.args.get('path', '')
+    base_path = request.args.get('base_path', file_manager.base_path)
+    
+    # Handle ~ expansion for base path
+    if base_path.startswith('~/'):
+        base_path = str(Path(base_path).expanduser())
+    
+    full_path = Path(base_path) / path if path else Path(base_path)
+    try:
+        types = file_types.classify_directory(full_path)
+    except (OSError, PermissionError) as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({name: {'mime': mime, 'type': description} for name, (mime, description) in types.items()})
+
+@app.route('/api/size', methods=['GET'])
+def directory_size():
+    """Total size and file/folder counts of a directory, recursively"""
+    path = request.args.get('path', '')
+    base_path = request.args.get('base_path', file_manager.base_path)
+    
+    # Handle ~ expansion for base path
+    if base_path.startswith('~/'):
+        base_path = str(Path(base_path).expanduser())
+    
+    full_path = Path(base_path) / path if path else Path(base_path)
+    if not full_path.is_dir():
+        return jsonify({'error': 'Directory not found'}), 404
+    
+    index = file_manager.tree_index
+    if index is not None and index.covers(full_path):
+        size, files, dirs = index.subtree_stats(full_path)
+    else:
+        size = files = dirs = 0
+        for root, dirnames, filenames in os.walk(full_path):
+            dirs += len(dirnames)
+            for name in filenames:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    files += 1
+                    size += st.st_size
+    return jsonify({'size': size, 'files': files, 'directories': dirs})
+
+@socketio.on('subscribe')
+def subscribe_directory(data):
+    """Start sending listing deltas for the directory a client is viewing"""
+    data = data or {}
+    path = data.get('path') or ''
+    base_path = data.get('base_path') or file_manager.base_path
+    
+    # Handle ~ expansion for base path
+    if base_path.startswith('~/'):
+        base_path = str(Path(base_path).expanduser())
+    
+    previous_room = change_notifier.unsubscribe(request.sid)
+    if previous_room:
+        leave_room(previous_room)
+    join_room(change_notifier.subscribe(request.sid, path, base_path))
+
+@socketio.on('disconnect')
+def client_disconnected():
+    change_notifier.unsubscribe(request.sid)
+
+def run_production_server(host, port, workers, threads, keep_alive, timeout):
+    """Serve the app with gunicorn's threaded worker instead of the dev server"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ Production mode needs gunicorn: pip install -r requirements.txt")
+        sys.exit(1)
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('keepalive', keep_alive)
+            self.cfg.set('timeout', timeout)
+
+        def load(self):
+            return app
+
+    ProductionServer().run()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Android-macOS file transfer web server')
+    parser.add_argument('--serve', choices=['dev', 'production'], default='dev',
+                        help='dev: Flask debug server; production: multi-threaded gunicorn server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes (production); upload sessions and caches are '
+                             'per process, so keep this at 1 and scale with --threads')
+    parser.add_argument('--threads', type=int, default=32,
+                        help='request threads per worker (production); each open browser tab '
+                             'holds one for its Socket.IO websocket and up to six more for '
+                             'uploads and downloads, so allow about 7 per tab')
+    parser.add_argument('--keep-alive', type=int, default=5,
+                        help='seconds to hold idle keep-alive connections (production)')
+    parser.add_argument('--timeout', type=int, default=120,
+                        help='seconds before a silent worker is restarted (production)')
+    parser.add_argument('--max-request-size', type=int, default=None,
+                        help='answer 413 to request bodies larger than this many MB '
+                             '(upload chunks shrink to fit)')
+    parser.add_argument('--no-sendfile', action='store_true',
+                        help='serve downloads with chunked reads instead of sendfile')
+    parser.add_argument('--compress-level', type=int, default=6, choices=range(1, 10),
+                        metavar='1-9', help='gzip level for JSON responses')
+    parser.add_argument('--brotli-quality', type=int, default=5, choices=range(0, 12),
+                        metavar='0-11', help='brotli quality for JSON responses')
+    parser.add_argument('--compress-min-size', type=int, default=1024,
+                        help='send JSON bodies smaller than this many bytes uncompressed')
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
+    args = parse_args()
+    app.config['PORT'] = args.port
+    app.config['USE_SENDFILE'] = not args.no_sendfile
+    app.config['COMPRESS_LEVEL'] = args.compress_level
+    app.config['BROTLI_QUALITY'] = args.brotli_quality
+    app.config['COMPRESS_MIN_SIZE'] = args.compress_min_size
+    if args.max_request_size:
+        app.config['MAX_CONTENT_LENGTH'] = args.max_request_size * 1024 * 1024
+    
     local_ip = file_manager.get_local_ip()
-    print(f"🌐 Web server starting...")
-    print(f"📱 Open this URL on your phone: http://{local_ip}:5001")
-    print(f"💻 Or on your Mac: http://localhost:5001")
+    print(f"🌐 Web server starting ({args.serve} mode)...")
+    print(f"📱 Open this URL on your phone: http://{local_ip}:{args.port}")
+    print(f"💻 Or on your Mac: http://localhost:{args.port}")
     print(f"📁 Files will be saved to: {file_manager.base_path}")
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
-
-
+    if args.serve == 'production':
+        run_production_server(args.host, args.port, args.workers, args.threads,
+                              args.keep_alive, args.timeout)
+    else:
+        # Restart on front-end edits too, since the bundle is built at startup
+        socketio.run(app, host=args.host, port=args.port, debug=True,
+                     reloader_options={'extra_files': [str(path) for path in STATIC_DIR.iterdir()]})
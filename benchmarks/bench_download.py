@@ -0,0 +1,146 @@
+"""Measure download throughput and server CPU per GB.
+
+Serves a large file from a throwaway HOME four ways: the old
+send_from_directory route on the dev server and under gunicorn, then the
+production server with --no-sendfile (the mmap-backed chunked fallback)
+and with sendfile (the default). Reports bytes/sec and the server's CPU
+seconds per GB transferred.
+
+    python benchmarks/bench_download.py --size-mb 1024 --rounds 3
+"""
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import subprocess
+import http.client
+from pathlib import Path
+
+from bench_server import free_port, start_server, stop_server, wait_for_server
+
+
+def legacy_app(root):
+    """The download route before the sendfile rewrite, kept for comparison"""
+    from flask import Flask, request, jsonify, send_from_directory
+    app = Flask(__name__)
+
+    @app.route('/api/info')
+    def info():
+        return jsonify({})
+
+    @app.route('/api/download')
+    def download_file():
+        full_path = Path(root) / request.args['path']
+        if not full_path.exists():
+            return jsonify({'error': 'File not found'}), 404
+        return send_from_directory(full_path.parent, full_path.name)
+
+    return app
+
+
+def serve_legacy(mode, port, root):
+    app = legacy_app(root)
+    if mode == 'dev':
+        from werkzeug.serving import run_simple
+        run_simple('127.0.0.1', port, app, threaded=True)
+        return
+
+    # Same gunicorn settings as web_server.py --serve production
+    from gunicorn.app.base import BaseApplication
+
+    class LegacyServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'127.0.0.1:{port}')
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', 16)
+
+        def load(self):
+            return app
+
+    LegacyServer().run()
+
+
+def start_legacy_server(mode, port, home):
+    cmd = [sys.executable, __file__, '--serve-legacy', mode, str(port), str(Path(home) / 'Downloads')]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    if not wait_for_server(port):
+        stop_server(proc)
+        raise RuntimeError(f'legacy {mode} server did not start')
+    return proc
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def download(port, name):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request('GET', f'/api/download?path={name}')
+    response = conn.getresponse()
+    buffer = bytearray(1024 * 1024)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        n = response.readinto(view)
+        if not n:
+            break
+        total += n
+    conn.close()
+    return total
+
+
+def run(label, start, rounds):
+    # Server start/stop cost is measured separately and subtracted
+    port = free_port()
+    cpu_before = children_cpu()
+    stop_server(start(port))
+    idle_cpu = children_cpu() - cpu_before
+
+    port = free_port()
+    cpu_before = children_cpu()
+    proc = start(port)
+    try:
+        started = time.perf_counter()
+        transferred = sum(download(port, 'bench.bin') for _ in range(rounds))
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_server(proc)
+    cpu = max(children_cpu() - cpu_before - idle_cpu, 0.0)
+
+    gb = transferred / 1024 ** 3
+    print(f'{label:>15}: {transferred / elapsed / 1024 ** 2:8.1f} MB/s  '
+          f'{cpu / gb:6.2f} CPU s/GB  ({gb:.2f} GB in {elapsed:.1f}s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--serve-legacy', nargs=3, metavar=('MODE', 'PORT', 'ROOT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_legacy:
+        mode, port, root = args.serve_legacy
+        serve_legacy(mode, int(port), root)
+        return
+
+    with tempfile.TemporaryDirectory() as home:
+        downloads = Path(home) / 'Downloads'
+        downloads.mkdir()
+        with open(downloads / 'bench.bin', 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        run('legacy dev', lambda port: start_legacy_server('dev', port, home), args.rounds)
+        run('legacy gunicorn', lambda port: start_legacy_server('production', port, home), args.rounds)
+        run('mmap', lambda port: start_server('production', port, home, ['--no-sendfile']), args.rounds)
+        run('sendfile', lambda port: start_server('production', port, home), args.rounds)
+
+
+if __name__ == '__main__':
+    main()
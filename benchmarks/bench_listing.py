@@ -0,0 +1,127 @@
+"""Microbenchmark for directory listing: Path.iterdir() vs os.scandir.
+
+Builds synthetic directories of 1k/10k/100k files and times the old
+Path.iterdir()-based listing loop against WebFileManager._scan_directory.
+With --strace (Linux, needs strace installed) it also counts the
+stat/getdents syscalls each implementation makes.
+
+    python benchmarks/bench_listing.py --sizes 1000 10000 100000 --strace
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+SYSCALLS = 'stat,lstat,fstat,newfstatat,statx,getdents64,openat'
+
+
+def legacy_scan(full_path, base_path=None):
+    """The listing loop before the scandir rewrite, kept for comparison"""
+    files = []
+    for item in full_path.iterdir():
+        try:
+            stat = item.stat()
+            actual_base = Path(base_path).expanduser() if base_path and base_path.startswith('~/') \
+                else Path(base_path) if base_path else full_path
+            files.append({
+                'name': item.name,
+                'path': str(item.relative_to(actual_base)),
+                'is_dir': item.is_dir(),
+                'size': stat.st_size if item.is_file() else None,
+                'date': time.strftime('%b %d %H:%M', time.localtime(stat.st_mtime)),
+                'permissions': oct(stat.st_mode)[-3:]
+            })
+        except (OSError, PermissionError):
+            continue
+    files.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
+    return files
+
+
+def scandir_scan(full_path):
+    from web_server import file_manager
+    return file_manager._scan_directory(full_path, full_path)
+
+
+def make_directory(root, count):
+    directory = Path(root) / f'entries-{count}'
+    directory.mkdir()
+    for i in range(count):
+        if i % 20 == 0:
+            (directory / f'dir-{i:06d}').mkdir()
+        else:
+            (directory / f'IMG_{i:06d}.jpg').write_bytes(b'')
+    return directory
+
+
+def time_scan(scan, directory, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        scan(directory)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def count_syscalls(impl, directory):
+    """Run one scan under strace and return the number of matching syscalls"""
+    def traced(which):
+        with tempfile.NamedTemporaryFile('r', suffix='.strace') as out:
+            subprocess.run(['strace', '-f', '-c', '-e', f'trace={SYSCALLS}', '-o', out.name,
+                            sys.executable, __file__, '--scan-only', which, str(directory)],
+                           check=True, stdout=subprocess.DEVNULL)
+            for line in out.read().splitlines():
+                if line.strip().endswith('total'):
+                    return int(line.split()[2])
+        return 0
+    # Subtract interpreter start-up and imports
+    return traced(impl) - traced('noop')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--strace', action='store_true', help='also count syscalls with strace')
+    parser.add_argument('--scan-only', nargs=2, metavar=('IMPL', 'DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scan_only:
+        # Every run pays the same imports so the 'noop' baseline cancels them out
+        import web_server  # noqa: F401
+        impl, directory = args.scan_only
+        if impl == 'legacy':
+            legacy_scan(Path(directory))
+        elif impl == 'scandir':
+            scandir_scan(Path(directory))
+        return
+
+    if args.strace and not shutil.which('strace'):
+        parser.error('--strace needs strace on PATH')
+
+    # Importing web_server creates ~/Downloads; keep that out of the real home
+    root = tempfile.mkdtemp()
+    os.environ['HOME'] = root
+    try:
+        for count in args.sizes:
+            directory = make_directory(root, count)
+            legacy = time_scan(legacy_scan, directory, args.repeat)
+            scandir = time_scan(scandir_scan, directory, args.repeat)
+            line = (f'{count:>7} entries: iterdir {legacy * 1000:8.1f} ms   '
+                    f'scandir {scandir * 1000:8.1f} ms   ({legacy / scandir:.1f}x)')
+            if args.strace:
+                line += (f'   syscalls iterdir {count_syscalls("legacy", directory):>7}'
+                         f'   scandir {count_syscalls("scandir", directory):>7}')
+            print(line)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
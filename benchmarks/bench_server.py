@@ -0,0 +1,134 @@
+"""Compare request throughput of the dev and production server modes.
+
+Starts backend/web_server.py in each mode against a throwaway HOME,
+then hammers it with concurrent clients doing directory listings and
+small uploads.
+
+    python benchmarks/bench_server.py --clients 10 --seconds 10
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVER = ROOT / 'backend' / 'web_server.py'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/info')
+            conn.getresponse().read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(mode, port, home, extra_args=()):
+    env = dict(os.environ, HOME=home)
+    cmd = [sys.executable, str(SERVER), '--serve', mode, '--host', '127.0.0.1', '--port', str(port)]
+    cmd += list(extra_args)
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    if not wait_for_server(port):
+        stop_server(proc)
+        raise RuntimeError(f'{mode} server did not start')
+    return proc
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    proc.wait(timeout=20)
+
+
+def client_loop(port, deadline, counts, payload):
+    boundary = 'benchboundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+            f'filename="bench-{threading.get_ident()}.bin"\r\n\r\n').encode() + payload + \
+        f'\r\n--{boundary}--\r\n'.encode()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    done = errors = 0
+    i = 0
+    while time.time() < deadline:
+        try:
+            if i % 2:
+                conn.request('POST', '/api/upload', body=body,
+                             headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+            else:
+                conn.request('GET', '/api/files')
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                errors += 1
+        except OSError:
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        i += 1
+    counts.append((done, errors))
+
+
+def run(mode, clients, seconds, payload_size, extra_args=()):
+    with tempfile.TemporaryDirectory() as home:
+        downloads = Path(home) / 'Downloads'
+        downloads.mkdir()
+        for n in range(200):
+            (downloads / f'file-{n:04d}.txt').write_bytes(b'x' * 100)
+
+        port = free_port()
+        proc = start_server(mode, port, home, extra_args)
+        try:
+            counts = []
+            deadline = time.time() + seconds
+            payload = os.urandom(payload_size)
+            threads = [threading.Thread(target=client_loop, args=(port, deadline, counts, payload))
+                       for _ in range(clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            stop_server(proc)
+
+    done = sum(c[0] for c in counts)
+    errors = sum(c[1] for c in counts)
+    print(f'{mode:>10}: {done / seconds:8.1f} req/s  ({done} ok, {errors} errors, {clients} clients)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--payload-kb', type=int, default=256, help='size of each uploaded file')
+    parser.add_argument('--threads', type=int, default=16, help='production server threads')
+    args = parser.parse_args()
+
+    run('dev', args.clients, args.seconds, args.payload_kb * 1024)
+    run('production', args.clients, args.seconds, args.payload_kb * 1024,
+        ['--threads', str(args.threads)])
+
+
+if __name__ == '__main__':
+    main()
@@ -22,7 +22,7 @@ fi
 
 # Start the web server
 echo "🌐 Starting web server..."
-python backend/web_server.py
+python backend/web_server.py "$@"
 
 # Function to cleanup on exit
 cleanup() {
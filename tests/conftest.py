@@ -0,0 +1,27 @@
+import os
+import sys
+import uuid
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# web_server creates its config and ~/Downloads on import; keep that out of the real home
+os.environ['HOME'] = tempfile.mkdtemp(prefix='aft-home-')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import web_server  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return web_server.app.test_client()
+
+
+@pytest.fixture
+def folder():
+    """A fresh directory under the served ~/Downloads, as (path, name)"""
+    name = f'test-{uuid.uuid4().hex[:8]}'
+    path = Path(web_server.file_manager.base_path) / name
+    path.mkdir()
+    return path, name
@@ -0,0 +1,45 @@
+import web_server
+from web_server import MetadataStore, TreeIndex
+
+
+def test_index_change_while_directory_write_is_queued(tmp_path):
+    root = tmp_path / 'tree'
+    root.mkdir()
+    for i in range(5):
+        (root / f'file-{i}.txt').write_bytes(b'x' * i)
+
+    store = MetadataStore(tmp_path / 'metadata.db')
+    index = TreeIndex(root)
+    index.store = store
+
+    # Change the index from the writer thread while it is storing the
+    # directory's entries, as a watcher event can
+    row = store._row
+    changed = []
+
+    def row_then_change(directory, name, entry):
+        if not changed:
+            changed.append(name)
+            (root / 'late.txt').write_bytes(b'late')
+            index.refresh_entry(str(root), 'late.txt')
+        return row(directory, name, entry)
+
+    store._row = row_then_change
+    index.build()
+    store.flush()
+
+    assert changed
+    assert store.thread.is_alive()
+    dirs, _ = store.load_tree(root)
+    assert set(dirs[str(root)]) == {f'file-{i}.txt' for i in range(5)} | {'late.txt'}
+
+
+def test_writer_survives_a_failing_batch(tmp_path):
+    store = MetadataStore(tmp_path / 'metadata.db')
+    store._submit(('directory', '/nowhere', 1, {'bad': None}))
+    store.flush()
+    store.put_directory('/somewhere', 2, {})
+    store.flush()
+
+    assert store.thread.is_alive()
+    assert store.load_tree('/somewhere')[1] == {'/somewhere': 2}
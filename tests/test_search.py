@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import web_server
+from web_server import TreeIndex
+
+
+def search(client, path, query, limit):
+    response = client.get('/api/search', query_string={
+        'q': query, 'base_path': str(path), 'limit': limit
+    })
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return lines[:-1], lines[-1]
+
+
+@pytest.fixture(params=['index', 'walk'])
+def search_folder(request, folder, monkeypatch):
+    path, _ = folder
+    for i in range(3):
+        (path / f'photo-{i}.jpg').write_bytes(b'x')
+    (path / 'notes.txt').write_bytes(b'x')
+    index = None
+    if request.param == 'index':
+        index = TreeIndex(path)
+        index.build()
+    monkeypatch.setattr(web_server, 'background_services_started', True)
+    monkeypatch.setattr(web_server.file_manager, 'tree_index', index)
+    return path
+
+
+def test_exactly_limit_matches_is_not_truncated(client, search_folder):
+    results, done = search(client, search_folder, 'photo', 3)
+    assert len(results) == 3
+    assert done == {'done': True, 'count': 3, 'truncated': False}
+
+
+def test_more_matches_than_limit_is_truncated(client, search_folder):
+    results, done = search(client, search_folder, 'photo', 2)
+    assert len(results) == 2
+    assert done == {'done': True, 'count': 2, 'truncated': True}
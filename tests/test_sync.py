@@ -0,0 +1,78 @@
+import hashlib
+import os
+
+import web_server
+from web_server import TreeIndex
+
+
+def indexed(monkeypatch, path):
+    index = TreeIndex(path)
+    index.build()
+    monkeypatch.setattr(web_server, 'background_services_started', True)
+    monkeypatch.setattr(web_server.file_manager, 'tree_index', index)
+    return index
+
+
+def sync_diff(client, path, files):
+    response = client.post('/api/sync/diff', json={'upload_directory': str(path), 'files': files})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_deduplicated_file_is_unchanged_in_a_later_sync(client, folder, monkeypatch):
+    path, _ = folder
+    content = os.urandom(300 * 1024)
+    sha256 = hashlib.sha256(content).hexdigest()
+    (path / 'existing.jpg').write_bytes(content)
+    os.utime(path / 'existing.jpg', (1_600_000_000, 1_600_000_000))
+    index = indexed(monkeypatch, path)
+
+    phone_mtime = 1_700_000_000
+    response = client.post('/api/upload/check', json={
+        'filename': 'IMG_0001.jpg', 'size': len(content), 'sha256': sha256,
+        'upload_directory': str(path), 'mtime': phone_mtime
+    })
+    assert response.get_json()['status'] in ('linked', 'copied')
+    assert (path / 'IMG_0001.jpg').stat().st_mtime == phone_mtime
+    assert (path / 'existing.jpg').stat().st_mtime == 1_600_000_000
+
+    index.build()
+    diff = sync_diff(client, path, [{'path': 'IMG_0001.jpg', 'size': len(content), 'mtime': phone_mtime}])
+    assert diff['upload'] == []
+    assert diff['unchanged'] == 1
+
+
+def test_linked_file_with_the_phone_mtime_stays_linked(client, folder, monkeypatch):
+    path, _ = folder
+    content = os.urandom(300 * 1024)
+    sha256 = hashlib.sha256(content).hexdigest()
+    (path / 'existing.jpg').write_bytes(content)
+    os.utime(path / 'existing.jpg', (1_700_000_000, 1_700_000_000))
+    indexed(monkeypatch, path)
+
+    response = client.post('/api/upload/check', json={
+        'filename': 'IMG_0001.jpg', 'size': len(content), 'sha256': sha256,
+        'upload_directory': str(path), 'mtime': 1_700_000_000
+    })
+    assert response.get_json()['status'] == 'linked'
+    assert (path / 'IMG_0001.jpg').stat().st_nlink == 2
+
+
+def test_present_link_with_another_mtime_is_split_off(client, folder, monkeypatch):
+    path, _ = folder
+    content = os.urandom(300 * 1024)
+    sha256 = hashlib.sha256(content).hexdigest()
+    (path / 'existing.jpg').write_bytes(content)
+    os.utime(path / 'existing.jpg', (1_600_000_000, 1_600_000_000))
+    os.link(path / 'existing.jpg', path / 'IMG_0001.jpg')
+    indexed(monkeypatch, path)
+
+    response = client.post('/api/upload/check', json={
+        'filename': 'IMG_0001.jpg', 'size': len(content), 'sha256': sha256,
+        'upload_directory': str(path), 'mtime': 1_700_000_000
+    })
+    assert response.get_json()['status'] == 'present'
+    assert (path / 'IMG_0001.jpg').stat().st_nlink == 1
+    assert (path / 'IMG_0001.jpg').stat().st_mtime == 1_700_000_000
+    assert (path / 'existing.jpg').stat().st_mtime == 1_600_000_000
+    assert (path / 'IMG_0001.jpg').read_bytes() == content
@@ -0,0 +1,51 @@
+from PIL import Image
+
+from web_server import ThumbnailCache
+
+
+def cache_size(cache_dir):
+    return sum(p.stat().st_size for p in cache_dir.glob('??/*') if p.suffix != '.tmp')
+
+
+def test_size_limit_holds_across_processes_sharing_the_cache(tmp_path):
+    sources = []
+    for i in range(8):
+        source = tmp_path / f'photo-{i}.png'
+        Image.new('RGB', (64, 64), (i * 30, 0, 0)).save(source)
+        sources.append(source)
+
+    cache_dir = tmp_path / 'thumbnails'
+    # Two caches over one directory stand in for two gunicorn workers
+    first, second = ThumbnailCache(cache_dir), ThumbnailCache(cache_dir)
+    try:
+        written = first.get(sources[0], f'{0:064x}.jpg', 32, 'jpeg').stat().st_size
+        for cache in (first, second):
+            cache.max_bytes = written * 3
+            cache.RESCAN_INTERVAL = 0
+        for i, source in enumerate(sources[1:], 1):
+            cache = first if i % 2 else second
+            path = cache.get(source, f'{i:064x}.jpg', 32, 'jpeg')
+            assert path.exists()
+            assert cache_size(cache_dir) <= written * 3 + written // 2
+    finally:
+        for cache in (first, second):
+            if cache.pool is not None:
+                cache.pool.shutdown()
+
+
+def test_thumbnail_rendered_by_another_process_is_reused(tmp_path):
+    source = tmp_path / 'photo.png'
+    Image.new('RGB', (64, 64), (200, 0, 0)).save(source)
+    cache_dir = tmp_path / 'thumbnails'
+    first, second = ThumbnailCache(cache_dir), ThumbnailCache(cache_dir)
+    try:
+        key = f'{1:064x}.jpg'
+        second._load()
+        path = first.get(source, key, 32, 'jpeg')
+        source.unlink()
+        # Rendering again would fail now that the source is gone
+        assert second.get(source, key, 32, 'jpeg') == path
+        assert second.pool is None
+    finally:
+        if first.pool is not None:
+            first.pool.shutdown()